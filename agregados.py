@@ -0,0 +1,205 @@
+"""Agregados del historial mantenidos de forma incremental al escribir
+
+Las tarjetas del panel (totales, promedio, máximo, mínimo, rangos, pacientes únicos y
+resumen de feedback) se leen de una sola fila de `agregados_predicciones`, que se actualiza
+en cada inserción, cambio de feedback y limpieza. La tabla `pacientes_predicciones` guarda
+los nombres ya vistos (con su clave normalizada, para el buscador de pacientes) y permite
+contar pacientes únicos sin recorrer el historial.
+
+La app, la API y la ingesta masiva escriben desde procesos distintos, así que la fila no se
+lee y se reescribe: cada escritura envía solo su incremento a la función `sumar_agregados`,
+que lo suma en la base en una sola sentencia, y los pacientes nuevos se insertan con
+`on conflict do nothing` contando solo las filas que de verdad se insertaron. Por lo mismo,
+el recálculo completo lo hace la función `reconstruir_agregados` dentro de la base, en una
+sola transacción con la fila de agregados bloqueada.
+
+Uso:
+    python agregados.py verificar      # compara los agregados con un recálculo completo
+    python agregados.py reconstruir    # los recalcula desde cero y los guarda
+"""
+import argparse
+import logging
+import threading
+
+import numpy as np
+
+from almacenamiento import TABLA_PREDICCIONES, clave_paciente
+from estadisticas import LIMITES_RANGOS, NOMBRES_RANGOS, UMBRAL_PARKINSON
+
+logger = logging.getLogger("detector_parkinson")
+
+TABLA_AGREGADOS = "agregados_predicciones"
+TABLA_PACIENTES = "pacientes_predicciones"
+FUNCION_SUMAR = "sumar_agregados"
+FUNCION_RECONSTRUIR = "reconstruir_agregados"
+ID_AGREGADOS = 1
+COLUMNAS_RANGOS = ["rango_0_25", "rango_25_50", "rango_50_75", "rango_75_100"]
+CONTADORES = [
+    "total_analisis", "total_parkinson", "suma_probabilidad", *COLUMNAS_RANGOS,
+    "pacientes_unicos", "feedback_total", "feedback_positivo", "feedback_negativo"
+]
+
+def agregados_vacios():
+    """Fila de agregados de un historial vacío"""
+    return {"id": ID_AGREGADOS, **{c: 0 for c in CONTADORES}, "prob_maxima": None, "prob_minima": None}
+
+def conteo_feedback(correcta):
+    """Aporta (total, 👍, 👎) del valor de `correcta` a los contadores"""
+    if correcta is None:
+        return 0, 0, 0
+    return 1, int(bool(correcta)), int(not correcta)
+
+def acumular_filas(agregados, filas):
+    """Suma a los agregados las filas dadas (sin pacientes únicos); devuelve los nombres vistos"""
+    if not filas:
+        return set()
+    probabilidades = np.array([float(f["probabilidad"]) for f in filas], dtype=np.float64)
+    conteos = np.bincount(
+        np.searchsorted(LIMITES_RANGOS, probabilidades * 100, side="right"), minlength=len(NOMBRES_RANGOS)
+    )
+    agregados["total_analisis"] += int(probabilidades.size)
+    agregados["total_parkinson"] += int(np.count_nonzero(probabilidades > UMBRAL_PARKINSON))
+    agregados["suma_probabilidad"] += float(probabilidades.sum())
+    for columna, conteo in zip(COLUMNAS_RANGOS, conteos):
+        agregados[columna] += int(conteo)
+    maxima, minima = float(probabilidades.max()), float(probabilidades.min())
+    agregados["prob_maxima"] = maxima if agregados["prob_maxima"] is None else max(agregados["prob_maxima"], maxima)
+    agregados["prob_minima"] = minima if agregados["prob_minima"] is None else min(agregados["prob_minima"], minima)
+    for fila in filas:
+        total, positivo, negativo = conteo_feedback(fila.get("correcta"))
+        agregados["feedback_total"] += total
+        agregados["feedback_positivo"] += positivo
+        agregados["feedback_negativo"] += negativo
+    return {f["nombre"] for f in filas}
+
+def estadisticas_desde_agregados(agregados):
+    """Convierte la fila de agregados al formato de obtener_estadisticas_avanzadas (más el feedback)"""
+    if agregados is None or agregados["total_analisis"] == 0:
+        return None
+    total = agregados["total_analisis"]
+    return {
+        "total_analisis": total,
+        "total_parkinson": agregados["total_parkinson"],
+        "total_saludable": total - agregados["total_parkinson"],
+        "prob_promedio": agregados["suma_probabilidad"] / total,
+        "prob_maxima": agregados["prob_maxima"],
+        "prob_minima": agregados["prob_minima"],
+        "rangos": {nombre: agregados[c] for nombre, c in zip(NOMBRES_RANGOS, COLUMNAS_RANGOS)},
+        "pacientes_unicos": agregados["pacientes_unicos"],
+        "feedback_total": agregados["feedback_total"],
+        "feedback_positivo": agregados["feedback_positivo"],
+        "feedback_negativo": agregados["feedback_negativo"]
+    }
+
+class AgregadosPredicciones:
+    """Lee y actualiza la fila de agregados; los fallos se registran y se corrigen con `reconstruir`"""
+    
+    def __init__(self, cliente, tamano_pagina=1000):
+        self.cliente = cliente
+        self.tamano_pagina = tamano_pagina
+        # Evita dos reconstrucciones a la vez en este proceso (los incrementos son atómicos en la base)
+        self._lock = threading.Lock()
+    
+    def _leer(self):
+        filas = self.cliente.table(TABLA_AGREGADOS).select("*").eq("id", ID_AGREGADOS).execute().data
+        return filas[0] if filas else None
+    
+    def _sumar(self, incremento):
+        """Suma el incremento a la fila en la base, sin leerla antes"""
+        valores = {c: v for c, v in incremento.items() if c != "id"}
+        self.cliente.rpc(FUNCION_SUMAR, {"incremento": valores}).execute()
+    
+    def _agregar_pacientes(self, nombres):
+        """Inserta los nombres que aún no están y devuelve cuántos eran nuevos"""
+        if not nombres:
+            return 0
+        response = self.cliente.table(TABLA_PACIENTES).upsert(
+            [{"nombre": n, "clave": clave_paciente(n)} for n in nombres], on_conflict="nombre", ignore_duplicates=True
+        ).execute()
+        return len(response.data or [])
+    
+    def inicializar(self):
+        """Calcula los agregados la primera vez, cuando la tabla aún no tiene su fila"""
+        if self._leer() is None:
+            self.reconstruir()
+    
+    def obtener(self):
+        """Estadísticas del historial con una sola lectura (None si está vacío)"""
+        return estadisticas_desde_agregados(self._leer())
+    
+    def registrar_inserciones(self, filas):
+        """Suma al agregado las filas recién insertadas"""
+        if not filas:
+            return True
+        try:
+            incremento = agregados_vacios()
+            nombres = acumular_filas(incremento, filas)
+            # Si otro proceso inserta el mismo nombre a la vez, solo uno de los dos lo cuenta
+            incremento["pacientes_unicos"] = self._agregar_pacientes(sorted(nombres))
+            self._sumar(incremento)
+            return True
+        except Exception as e:
+            logger.warning("No se pudieron actualizar los agregados tras insertar: %s", e)
+            return False
+    
+    def calcular(self):
+        """Recalcula los agregados recorriendo todo el historial por páginas"""
+        agregados = agregados_vacios()
+        nombres = set()
+        desde_id = None
+        while True:
+            consulta = self.cliente.table(TABLA_PREDICCIONES).select("id,nombre,probabilidad,correcta")
+            if desde_id is not None:
+                consulta = consulta.gt("id", desde_id)
+            pagina = consulta.order("id").limit(self.tamano_pagina).execute().data
+            nombres |= acumular_filas(agregados, pagina)
+            if len(pagina) < self.tamano_pagina:
+                break
+            desde_id = pagina[-1]["id"]
+        agregados["pacientes_unicos"] = len(nombres)
+        return agregados, nombres
+    
+    def reconstruir(self):
+        """Sustituye los agregados y la tabla de pacientes por un recálculo completo y devuelve la fila nueva
+
+        Se recalcula en la base: si se leyera el historial desde aquí, los incrementos que otros
+        procesos sumaran mientras tanto se perderían al guardar.
+        """
+        with self._lock:
+            self.cliente.rpc(FUNCION_RECONSTRUIR, {}).execute()
+            return self._leer()
+    
+    def verificar(self, tolerancia=1e-6):
+        """Compara los agregados guardados con un recálculo; devuelve {columna: (guardado, real)}"""
+        guardados = self._leer() or agregados_vacios()
+        reales, _ = self.calcular()
+        diferencias = {}
+        for columna, real in reales.items():
+            guardado = guardados.get(columna)
+            if isinstance(real, float) and guardado is not None:
+                iguales = abs(guardado - real) <= tolerancia * max(1.0, abs(real))
+            else:
+                iguales = guardado == real
+            if not iguales:
+                diferencias[columna] = (guardado, real)
+        return diferencias
+
+if __name__ == "__main__":
+    from almacenamiento import crear_cliente
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("accion", choices=["verificar", "reconstruir"])
+    args = parser.parse_args()
+    
+    agregados = AgregadosPredicciones(crear_cliente())
+    if args.accion == "reconstruir":
+        resultado = agregados.reconstruir()
+        print(f"Agregados reconstruidos: {resultado['total_analisis']} análisis, {resultado['pacientes_unicos']} pacientes")
+    else:
+        diferencias = agregados.verificar()
+        if not diferencias:
+            print("✅ Los agregados coinciden con el historial")
+        else:
+            for columna, (guardado, real) in diferencias.items():
+                print(f"❌ {columna}: guardado={guardado} real={real}")
+            raise SystemExit(1)
@@ -0,0 +1,162 @@
+"""Acceso a la tabla de predicciones compartido por la app y la API"""
+import os
+import re
+import unicodedata
+
+from inferencia import resultado_prediccion
+
+TABLA_PREDICCIONES = "predicciones"
+# Prefer: return=minimal, la respuesta no trae las filas. postgrest acepta el texto igual que
+# ReturnMethod.minimal, e importar su enum cargaría supabase al arrancar la app
+SIN_FILAS = "minimal"
+TAMANO_BLOQUE_INSERCION = 500
+FUNCION_FEEDBACK = "guardar_feedback"  # Feedback y ajuste de los agregados en una transacción (SQL del README)
+COLUMNAS_FEEDBACK = "id,nombre,probabilidad,resultado,fecha_hora,correcta,comentario"
+# Backend de almacenamiento: supabase (por defecto), sqlite (archivo local) o memoria (pruebas)
+ALMACENAMIENTO = os.environ.get("ALMACENAMIENTO", "supabase").lower()
+RUTA_SQLITE = os.environ.get("RUTA_SQLITE", "predicciones.db")
+
+def crear_cliente_supabase():
+    """Crea el cliente de Supabase a partir de SUPABASE_URL y SUPABASE_KEY"""
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("Credenciales de Supabase no configuradas")
+    # Importación diferida: el cliente solo se carga cuando se usa
+    from supabase import create_client
+    return create_client(url, key)
+
+def crear_cliente(backend=None):
+    """Crea el cliente del backend elegido con ALMACENAMIENTO; todos exponen la misma interfaz"""
+    backend = (backend or ALMACENAMIENTO).lower()
+    if backend == "sqlite":
+        from supabase_sqlite import ClienteSQLite
+        return ClienteSQLite(RUTA_SQLITE)
+    if backend == "memoria":
+        from supabase_memoria import ClienteMemoria
+        return ClienteMemoria()
+    if backend == "supabase":
+        return crear_cliente_supabase()
+    raise RuntimeError(f"Backend de almacenamiento desconocido: {backend}")
+
+def clave_paciente(nombre):
+    """Clave normalizada del paciente: minúsculas, sin tildes y con espacios simples
+
+    "  José  PÉREZ" y "jose perez" tienen la misma clave, que es la que se indexa y se busca.
+    """
+    texto = unicodedata.normalize("NFKD", str(nombre or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+    return re.sub(r"\s+", " ", texto).strip()
+
+def fila_prediccion(nombre, probabilidad, fecha_hora):
+    """Construye la fila que se guarda en la tabla de predicciones"""
+    return {
+        "nombre": nombre,
+        "paciente_clave": clave_paciente(nombre),
+        "probabilidad": float(probabilidad),
+        "resultado": resultado_prediccion(probabilidad),
+        "fecha_hora": fecha_hora,
+        # Feedback estructurado: se rellena cuando el usuario valora la predicción
+        "correcta": None,
+        "comentario": None
+    }
+
+def insertar_prediccion(cliente, nombre, probabilidad, fecha_hora, agregados=None):
+    """Inserta una predicción y devuelve la fila guardada (con su id)"""
+    response = cliente.table(TABLA_PREDICCIONES).insert(fila_prediccion(nombre, probabilidad, fecha_hora)).execute()
+    if agregados is not None:
+        agregados.registrar_inserciones(response.data)
+    return response.data[0] if response.data else None
+
+def insertar_predicciones(cliente, registros, tamano_bloque=TAMANO_BLOQUE_INSERCION, agregados=None):
+    """Inserta varias predicciones con una petición por bloque y devuelve las filas guardadas"""
+    filas = [fila_prediccion(nombre, probabilidad, fecha_hora) for nombre, probabilidad, fecha_hora in registros]
+    guardadas = []
+    for inicio in range(0, len(filas), tamano_bloque):
+        response = cliente.table(TABLA_PREDICCIONES).insert(filas[inicio:inicio + tamano_bloque]).execute()
+        if agregados is not None:
+            agregados.registrar_inserciones(response.data)
+        guardadas.extend(response.data or [])
+    return guardadas
+
+def actualizar_feedback(cliente, prediccion_id, correcta, comentario=None, agregados=None):
+    """Guarda si la predicción fue correcta y el comentario opcional
+
+    Con `agregados`, la función `guardar_feedback` de la base bloquea la fila, lee el valor
+    anterior, la actualiza y ajusta los contadores (👍 → 👎, por ejemplo) en una sola llamada:
+    dos valoraciones simultáneas de la misma predicción no descuadran los contadores.
+    """
+    if agregados is not None:
+        return cliente.rpc(FUNCION_FEEDBACK, {
+            "id_prediccion": prediccion_id, "nueva_correcta": bool(correcta), "nuevo_comentario": comentario or None
+        }).execute()
+    return cliente.table(TABLA_PREDICCIONES).update(
+        {"correcta": bool(correcta), "comentario": comentario or None}
+    ).eq("id", prediccion_id).execute()
+
+def borrar_rango_ids(cliente, id_minimo, id_maximo, tamano_bloque, progreso=None):
+    """Borra las predicciones con id entre id_minimo e id_maximo, en bloques de hasta tamano_bloque filas
+
+    Cada bloque lee el id de su última fila existente y borra hasta él con un solo rango, así que
+    el número de peticiones depende de las filas que hay y no de los huecos entre ids. Las filas
+    borradas no se devuelven. Devuelve el número de peticiones.
+    """
+    peticiones = 0
+    desde = id_minimo
+    while desde <= id_maximo:
+        ultima = (
+            cliente.table(TABLA_PREDICCIONES).select("id").gte("id", desde).lte("id", id_maximo)
+            .order("id").range(tamano_bloque - 1, tamano_bloque - 1).execute().data
+        )
+        # Menos de un bloque hasta id_maximo: el último rango llega hasta él
+        hasta = ultima[0]["id"] if ultima else id_maximo
+        cliente.table(TABLA_PREDICCIONES).delete(returning=SIN_FILAS).gte("id", desde).lte("id", hasta).execute()
+        peticiones += 2
+        if progreso is not None:
+            progreso((hasta - id_minimo + 1) / (id_maximo - id_minimo + 1))
+        desde = hasta + 1
+    return peticiones
+
+def feedback_desde_texto(texto):
+    """Convierte el formato antiguo "👍 Sí | comentario" en (correcta, comentario); None si está vacío"""
+    texto = (texto or "").strip()
+    if not texto:
+        return None
+    tipo, _, comentario = texto.partition("|")
+    comentario = comentario.strip()
+    if comentario in ("", "Sin comentario"):
+        comentario = None
+    return "👍" in tipo, comentario
+
+def contar_feedback(cliente):
+    """Cuenta el feedback 👍/👎 con dos consultas filtradas por `correcta`; devuelve (total, 👍, 👎)"""
+    positivos = cliente.table(TABLA_PREDICCIONES).select("id", count="exact").eq("correcta", True).limit(1).execute().count or 0
+    negativos = cliente.table(TABLA_PREDICCIONES).select("id", count="exact").eq("correcta", False).limit(1).execute().count or 0
+    return positivos + negativos, positivos, negativos
+
+def obtener_pagina_feedback(cliente, pagina, tamano_pagina):
+    """Una página de predicciones con feedback, de la más reciente a la más antigua, y el total"""
+    inicio = pagina * tamano_pagina
+    response = (
+        cliente.table(TABLA_PREDICCIONES).select(COLUMNAS_FEEDBACK, count="exact")
+        .not_.is_("correcta", "null")
+        .order("id", desc=True)
+        .range(inicio, inicio + tamano_pagina - 1)
+        .execute()
+    )
+    return response.data or [], response.count or 0
+
+def descargar_feedback(cliente, tamano_pagina=1000):
+    """Todas las predicciones con feedback en orden de id, por páginas (para exportar)"""
+    filas = []
+    desde_id = 0
+    while True:
+        pagina = (
+            cliente.table(TABLA_PREDICCIONES).select(COLUMNAS_FEEDBACK)
+            .not_.is_("correcta", "null").gt("id", desde_id)
+            .order("id").limit(tamano_pagina).execute().data or []
+        )
+        filas.extend(pagina)
+        if len(pagina) < tamano_pagina:
+            return filas
+        desde_id = pagina[-1]["id"]
@@ -0,0 +1,186 @@
+"""API HTTP de inferencia para integraciones externas (p. ej. la historia clínica electrónica)
+
+Uso:
+    python api.py --puerto 8000            # guarda en Supabase (SUPABASE_URL / SUPABASE_KEY)
+    python api.py --host 0.0.0.0           # escucha en todas las interfaces (por defecto solo en local)
+    python api.py --puerto 8000 --stub     # guarda en una tabla en memoria, para pruebas de carga
+    ALMACENAMIENTO=sqlite python api.py    # guarda en un archivo SQLite local (RUTA_SQLITE)
+
+Rutas:
+    POST /predict   cuerpo con los bytes de una imagen (?nombre=... para guardarla en el historial)
+                    o JSON {"imagenes": [{"imagen": "<base64>", "nombre": "..."}]} para un lote
+    GET  /metrics   latencias por ruta y por etapa (p50/p95/p99 en ms) y estado de la cola de micro-lotes
+    GET  /metrics/prometheus   las mismas latencias en formato de texto de Prometheus
+    GET  /health    estado del servicio
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from agregados import AgregadosPredicciones
+from almacenamiento import crear_cliente, insertar_prediccion, insertar_predicciones
+from inferencia import (
+    CachePredicciones, abrir_imagen, calentar_modelo, cargar_modelo, crear_planificador, predecir_imagen, predecir_lote,
+    resultado_prediccion
+)
+from metricas import METRICAS, MetricasLatencia
+
+# Tamaño máximo del cuerpo de POST /predict; un lote JSON lleva las imágenes en base64
+API_MAX_CUERPO = int(os.environ.get("API_MAX_CUERPO", str(20 * 2**20)))
+
+class ServicioInferencia:
+    """Estado compartido por todas las peticiones: modelo, caché y almacenamiento"""
+    
+    def __init__(self, modelo, cliente):
+        self.modelo = modelo
+        self.cliente = cliente
+        self.agregados = AgregadosPredicciones(cliente)
+        self.cache = CachePredicciones()
+        self.metricas = MetricasLatencia()
+        # Las peticiones concurrentes de una imagen se agrupan en micro-lotes
+        self.planificador = crear_planificador(modelo)
+    
+    def predecir(self, imagen_bytes, nombre=None):
+        imagen = abrir_imagen(io.BytesIO(imagen_bytes))
+        probabilidad = float(predecir_imagen(self.modelo, imagen, self.cache, self.planificador))
+        respuesta = {"probabilidad": probabilidad, "resultado": resultado_prediccion(probabilidad)}
+        if nombre:
+            fila = insertar_prediccion(
+                self.cliente, nombre, probabilidad, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), agregados=self.agregados
+            )
+            respuesta["id"] = fila["id"] if fila else None
+        return respuesta
+    
+    def predecir_lote(self, elementos):
+        imagenes = [abrir_imagen(io.BytesIO(base64.b64decode(e["imagen"]))) for e in elementos]
+        probabilidades = predecir_lote(self.modelo, imagenes, self.cache)
+        resultados = [
+            {"probabilidad": float(p), "resultado": resultado_prediccion(p)} for p in probabilidades
+        ]
+        
+        # Solo se guardan los elementos que traen nombre de paciente
+        fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        a_guardar = [i for i, e in enumerate(elementos) if e.get("nombre")]
+        if a_guardar:
+            filas = insertar_predicciones(
+                self.cliente, [(elementos[i]["nombre"], probabilidades[i], fecha_hora) for i in a_guardar],
+                agregados=self.agregados
+            )
+            for i, fila in zip(a_guardar, filas):
+                resultados[i]["id"] = fila["id"]
+        return {"resultados": resultados}
+
+def crear_manejador(servicio):
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def _responder(self, estado, cuerpo):
+            if isinstance(cuerpo, str):
+                datos, tipo = cuerpo.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                datos, tipo = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+            self.send_response(estado)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(datos)))
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(datos)
+        
+        def _atender(self, ruta, funcion):
+            inicio = time.perf_counter()
+            try:
+                estado, cuerpo = funcion()
+            except (ValueError, KeyError, OSError) as e:
+                estado, cuerpo = 400, {"error": str(e)}
+            except Exception as e:
+                estado, cuerpo = 500, {"error": str(e)}
+            self._responder(estado, cuerpo)
+            servicio.metricas.registrar(ruta, time.perf_counter() - inicio, estado >= 400)
+        
+        def do_GET(self):
+            ruta = urlparse(self.path).path
+            if ruta == "/health":
+                self._atender(ruta, lambda: (200, {"estado": "ok"}))
+            elif ruta == "/metrics":
+                self._atender(ruta, lambda: (200, {
+                    "rutas": servicio.metricas.resumen(),
+                    "etapas": METRICAS.resumen(),
+                    "microlotes": servicio.planificador.estadisticas()
+                }))
+            elif ruta == "/metrics/prometheus":
+                self._atender(ruta, lambda: (200, (
+                    servicio.metricas.a_prometheus("detector_parkinson_api_latencia_segundos", "ruta")
+                    + METRICAS.a_prometheus()
+                )))
+            else:
+                self._responder(404, {"error": "Ruta no encontrada"})
+        
+        def _leer_cuerpo(self):
+            """Lee el cuerpo entero para que la conexión keep-alive siga alineada; None si supera el máximo"""
+            longitud = int(self.headers.get("Content-Length", 0))
+            if longitud < 0:
+                raise ValueError(longitud)
+            if longitud > API_MAX_CUERPO:
+                # No se lee: tras responder se cierra la conexión
+                self.close_connection = True
+                return None
+            return self.rfile.read(longitud)
+        
+        def do_POST(self):
+            url = urlparse(self.path)
+            try:
+                cuerpo = self._leer_cuerpo()
+            except ValueError:
+                self.close_connection = True
+                self._responder(400, {"error": "Content-Length no válido"})
+                return
+            if cuerpo is None:
+                self._responder(413, {"error": f"El cuerpo supera el máximo de {API_MAX_CUERPO} bytes"})
+                return
+            if url.path != "/predict":
+                self._responder(404, {"error": "Ruta no encontrada"})
+                return
+            
+            def atender():
+                if not cuerpo:
+                    raise ValueError("El cuerpo de la petición está vacío")
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    elementos = json.loads(cuerpo)["imagenes"]
+                    return 200, servicio.predecir_lote(elementos)
+                nombre = parse_qs(url.query).get("nombre", [None])[0]
+                return 200, servicio.predecir(cuerpo, nombre)
+            
+            self._atender(url.path, atender)
+        
+        def log_message(self, formato, *args):
+            # Las latencias ya se registran en /metrics
+            pass
+    
+    return Manejador
+
+def crear_servidor(servicio, host="127.0.0.1", puerto=8000):
+    """Crea el servidor HTTP multihilo para el servicio dado"""
+    return ThreadingHTTPServer((host, puerto), crear_manejador(servicio))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP de inferencia del detector de Parkinson")
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz de escucha; 0.0.0.0 la expone en la red")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--stub", action="store_true", help="Usar una tabla en memoria en lugar de Supabase")
+    args = parser.parse_args()
+    
+    # --stub equivale a ALMACENAMIENTO=memoria
+    cliente = crear_cliente("memoria" if args.stub else None)
+    
+    modelo = cargar_modelo()
+    calentar_modelo(modelo)
+    servidor = crear_servidor(ServicioInferencia(modelo, cliente), args.host, args.puerto)
+    print(f"API de inferencia escuchando en http://{args.host}:{args.puerto}")
+    servidor.serve_forever()
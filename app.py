@@ -1,13 +1,36 @@
+import time
+INICIO_ARRANQUE = time.perf_counter()
+
 import streamlit as st
 import numpy as np
-from PIL import Image
-import tensorflow as tf
 from datetime import datetime
 import hashlib
+import logging
 import os
-from supabase import create_client, Client
+import threading
 import pandas as pd
-import matplotlib.pyplot as plt
+from agregados import AgregadosPredicciones
+from almacenamiento import (
+    ALMACENAMIENTO, COLUMNAS_FEEDBACK, borrar_rango_ids, contar_feedback, crear_cliente, descargar_feedback, fila_prediccion,
+    obtener_pagina_feedback
+)
+from escritura_diferida import EscritorDiferido
+from estadisticas import obtener_estadisticas_avanzadas
+from grafico_drift import datos_drift, dibujar_drift
+from indice_embeddings import IndiceEmbeddings
+from metricas import METRICAS, iniciar_servidor_metricas
+from monitor_drift import DRIFT_PSI_ALERTA, DRIFT_PSI_AVISO, MonitorDrift
+from pacientes import buscar_pacientes, evolucion_paciente
+from inferencia import (
+    CachePredicciones, ModeloEnSegundoPlano, abrir_imagen, crear_planificador, identidad_modelo, predecir_imagen, predecir_lote
+)
+from exportacion import (
+    FORMATOS_EXPORTACION, bloques_txt_feedback, bloques_txt_historial, exportar, tabla_feedback, tabla_historial
+)
+
+TIEMPO_IMPORTS = time.perf_counter() - INICIO_ARRANQUE
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+logger = logging.getLogger("detector_parkinson")
 
 # Configuración de la página
 st.set_page_config(
@@ -35,28 +58,79 @@ if 'ultimo_id_prediccion' not in st.session_state:
 ADMIN_PASSWORD = "12345678"
 ADMIN_PASSWORD_HASH = hashlib.sha256(ADMIN_PASSWORD.encode()).hexdigest()
 
-# Configurar Supabase
+# Configurar almacenamiento (Supabase por defecto, o SQLite local con ALMACENAMIENTO=sqlite)
 @st.cache_resource
-def init_supabase() -> Client:
-    """Inicializa la conexión a Supabase"""
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_KEY")
-    
-    if not url or not key:
-        st.error("⚠️ Error: Credenciales de Supabase no configuradas")
+def init_supabase():
+    """Inicializa la conexión al backend de almacenamiento"""
+    try:
+        return crear_cliente()
+    except RuntimeError as e:
+        if ALMACENAMIENTO == "supabase":
+            st.error("⚠️ Error: Credenciales de Supabase no configuradas")
+        else:
+            st.error(f"⚠️ Error: {str(e)}")
         st.stop()
-    
-    return create_client(url, key)
 
+inicio = time.perf_counter()
 supabase = init_supabase()
+TIEMPO_SUPABASE = time.perf_counter() - inicio
+
+# Cargar modelo en segundo plano: las páginas se muestran sin esperar a TensorFlow
+@st.cache_resource
+def init_modelo():
+    """Empieza a cargar el modelo una sola vez para todas las sesiones"""
+    return ModeloEnSegundoPlano()
+
+modelo = init_modelo()
+
+@st.cache_resource
+def init_planificador():
+    """Crea la cola de micro-lotes compartida por todas las sesiones"""
+    return crear_planificador(modelo)
+
+planificador = init_planificador()
+
+# Caché de predicciones por contenido de la imagen
+@st.cache_resource
+def init_cache_predicciones():
+    """Crea la caché de predicciones compartida entre sesiones"""
+    capacidad = int(os.environ.get("CACHE_PREDICCIONES_MAX", "1024"))
+    ruta = os.environ.get("CACHE_PREDICCIONES_RUTA")  # Opcional: persistir en disco
+    # La identidad del modelo invalida la caché guardada al cambiar de modelo o de backend
+    return CachePredicciones(capacidad, ruta, identidad_modelo())
+
+cache_predicciones = init_cache_predicciones()
+
+# Índice de embeddings para mostrar casos parecidos a los resultados dudosos
+@st.cache_resource
+def init_indice_embeddings():
+    """Abre el índice de embeddings compartido entre sesiones"""
+    return IndiceEmbeddings(os.environ.get("RUTA_INDICE_EMBEDDINGS", "indice_embeddings"))
+
+indice_embeddings = init_indice_embeddings()
+
+@st.cache_resource
+def init_lock_graficos():
+    """Lock compartido para dibujar los gráficos de Altair (st.bar_chart, st.line_chart)
+    
+    Streamlit 1.28 registra en Altair un transformador global en cada gráfico: con dos sesiones
+    dibujando a la vez, los datos de una acaban en la otra ("dictionary changed size during iteration").
+    """
+    return threading.Lock()
+
+lock_graficos = init_lock_graficos()
 
-# Cargar modelo
 @st.cache_resource
-def cargar_modelo():
-    modelo = tf.keras.models.load_model("modelo_parkinson.h5")
-    return modelo
+def registrar_arranque():
+    """Registra en el log cuánto tardó el primer arranque del proceso (solo una vez)"""
+    logger.info(
+        "Arranque: imports %.2f s, Supabase %.2f s, total hasta la primera página %.2f s "
+        "(el modelo sigue cargando en segundo plano)",
+        TIEMPO_IMPORTS, TIEMPO_SUPABASE, time.perf_counter() - INICIO_ARRANQUE
+    )
+    return True
 
-modelo = cargar_modelo()
+registrar_arranque()
 
 # Funciones de autenticación
 def verificar_contraseña(password):
@@ -78,116 +152,347 @@ def cerrar_sesion():
     st.session_state['usuario_actual'] = None
 
 # Funciones de Supabase
-def guardar_prediccion(nombre, probabilidad, fecha_hora):
-    """Guarda una predicción en Supabase"""
+COLUMNAS_HISTORIAL = ["id", "nombre", "probabilidad", "resultado", "fecha_hora"]
+LIMPIEZA_BLOQUE = int(os.environ.get("LIMPIEZA_BLOQUE", "10000"))  # Filas por petición de borrado
+HISTORIAL_TTL = int(os.environ.get("HISTORIAL_TTL", "30"))  # Segundos entre sincronizaciones
+# Ids bajo la marca de agua que se releen: en Postgres un id menor puede confirmarse después que uno
+# mayor (transacciones concurrentes, inserciones masivas) y quedaría por debajo de lo ya leído
+HISTORIAL_SOLAPE = int(os.environ.get("HISTORIAL_SOLAPE", "1000"))
+FEEDBACK_POR_PAGINA = 20
+BANDA_CASOS_SIMILARES = (0.5, 0.75)  # Probabilidades dudosas para las que se muestran casos parecidos
+CASOS_SIMILARES = 5
+
+def indexar_al_guardar(embedding):
+    """Callback que añade el embedding al índice cuando se conoce el id de la predicción"""
+    if embedding is None:
+        return None
+    return lambda prediccion_id: indice_embeddings.agregar([prediccion_id], embedding[None])
+
+@METRICAS.cronometrar("guardar_prediccion")
+def guardar_prediccion(nombre, probabilidad, fecha_hora, embedding=None):
+    """Encola una predicción para guardarla en Supabase sin bloquear la página"""
     try:
-        resultado = "Parkinson detectado" if probabilidad > 0.5 else "Saludable"
-        
-        data = {
-            "nombre": nombre,
-            "probabilidad": float(probabilidad),
-            "resultado": resultado,
-            "fecha_hora": fecha_hora,
-            "feedback": None  # Inicialmente sin feedback
-        }
-        
-        response = supabase.table("predicciones").insert(data).execute()
-        # Guardar el ID de la predicción para asociar feedback después
-        if response.data and len(response.data) > 0:
-            st.session_state['ultimo_id_prediccion'] = response.data[0]['id']
+        pendiente = escritor.insertar(fila_prediccion(nombre, probabilidad, fecha_hora), indexar_al_guardar(embedding))
+        # Referencia a la fila para asociar feedback después (su id llega al escribirse)
+        st.session_state['ultimo_id_prediccion'] = pendiente
         return True
     except Exception as e:
         st.error(f"Error al guardar: {str(e)}")
         return False
 
-def guardar_feedback(prediccion_id, feedback_texto):
-    """Actualiza el feedback de una predicción en Supabase"""
+def guardar_predicciones_lote(registros, embeddings=None):
+    """Encola varias predicciones; el escritor las envía en inserciones masivas"""
     try:
-        response = supabase.table("predicciones").update(
-            {"feedback": feedback_texto}
-        ).eq("id", prediccion_id).execute()
+        embeddings = embeddings if embeddings is not None else [None] * len(registros)
+        for (nombre, probabilidad, fecha_hora), embedding in zip(registros, embeddings):
+            escritor.insertar(fila_prediccion(nombre, probabilidad, fecha_hora), indexar_al_guardar(embedding))
         return True
     except Exception as e:
-        st.error(f"Error al guardar feedback: {str(e)}")
+        st.error(f"Error al guardar lote: {str(e)}")
         return False
 
-def obtener_historial():
-    """Obtiene el historial de predicciones desde Supabase"""
+def guardar_feedback(prediccion, correcta, comentario=None):
+    """Encola el feedback de una predicción (id o fila pendiente de escribir)"""
     try:
-        response = supabase.table("predicciones").select("*").order("fecha_hora", desc=False).execute()
-        return response.data if response.data else []
-    except Exception as e:
-        st.error(f"Error al cargar historial: {str(e)}")
-        return []
-
-def limpiar_historial():
-    """Limpia todo el historial en Supabase"""
-    try:
-        # Primero obtener todos los IDs
-        response = supabase.table("predicciones").select("id").execute()
-        if response.data:
-            for item in response.data:
-                supabase.table("predicciones").delete().eq("id", item["id"]).execute()
+        escritor.actualizar_feedback(prediccion, correcta, comentario)
         return True
     except Exception as e:
-        st.error(f"Error al limpiar historial: {str(e)}")
+        st.error(f"Error al guardar feedback: {str(e)}")
         return False
 
-# Función para predicción
-def predecir_imagen(imagen):
-    img = imagen.convert("RGB").resize((224, 224))
-    img_array = tf.keras.preprocessing.image.img_to_array(img)
-    img_array = img_array / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    pred = modelo.predict(img_array, verbose=0)[0][0]
-    return pred
-
-def obtener_estadisticas_avanzadas():
-    """Obtiene estadísticas detalladas del sistema"""
-    historial = obtener_historial()
+class HistorialLocal:
+    """Copia local del historial que se sincroniza de forma incremental con Supabase"""
     
-    if len(historial) == 0:
-        return None
+    def __init__(self, cliente, tamano_pagina=1000, al_agregar=None):
+        self.cliente = cliente
+        self.tamano_pagina = tamano_pagina
+        self.al_agregar = al_agregar  # Recibe cada bloque de filas nuevas (sin repetidas), en orden de id
+        self.df = pd.DataFrame(columns=COLUMNAS_HISTORIAL)
+        self.ultimo_id = None  # Marca de agua: mayor id ya descargado
+        self.ultima_sincronizacion = 0.0
+        self.pendiente = True
+        self._lock = threading.Lock()
     
-    total_analisis = len(historial)
-    total_parkinson = sum(1 for p in historial if p['probabilidad'] > 0.5)
-    total_saludable = total_analisis - total_parkinson
-    prob_promedio = sum(p['probabilidad'] for p in historial) / total_analisis
-    prob_maxima = max(p['probabilidad'] for p in historial)
-    prob_minima = min(p['probabilidad'] for p in historial)
+    @METRICAS.cronometrar("descarga_historial")
+    def _descargar_paginas(self, columnas, desde_id=None):
+        """Descarga filas por páginas ordenadas por id (paginación por clave)"""
+        filas = []
+        while True:
+            consulta = self.cliente.table("predicciones").select(columnas)
+            if desde_id is not None:
+                consulta = consulta.gt("id", desde_id)
+            pagina = consulta.order("id").limit(self.tamano_pagina).execute().data or []
+            filas.extend(pagina)
+            if len(pagina) < self.tamano_pagina:
+                return filas
+            desde_id = pagina[-1]["id"]
     
-    # Análisis por rangos
-    rangos = {
-        "0-25%": 0,
-        "25-50%": 0,
-        "50-75%": 0,
-        "75-100%": 0
-    }
+    def sincronizar(self):
+        """Trae las filas posteriores a la marca de agua (y las del solape) y devuelve el historial"""
+        with self._lock:
+            ahora = time.monotonic()
+            if self.pendiente or ahora - self.ultima_sincronizacion >= HISTORIAL_TTL:
+                desde_id = None if self.ultimo_id is None else max(0, self.ultimo_id - HISTORIAL_SOLAPE)
+                filas = self._descargar_paginas(",".join(COLUMNAS_HISTORIAL), desde_id=desde_id)
+                nuevas = pd.DataFrame(filas, columns=COLUMNAS_HISTORIAL)
+                if self.ultimo_id is not None and not nuevas.empty:
+                    # Las filas del solape que ya están en la copia local se descartan por id
+                    conocidas = self.df["id"][self.df["id"] > desde_id]
+                    nuevas = nuevas[~nuevas["id"].isin(conocidas)]
+                if not nuevas.empty:
+                    self._agregar(nuevas)
+                self.ultima_sincronizacion = ahora
+                self.pendiente = False
+            return self.df
     
-    for p in historial:
-        prob = p['probabilidad'] * 100
-        if prob < 25:
-            rangos["0-25%"] += 1
-        elif prob < 50:
-            rangos["25-50%"] += 1
-        elif prob < 75:
-            rangos["50-75%"] += 1
+    def _agregar(self, nuevas):
+        if self.df.empty:
+            df = nuevas.sort_values(["fecha_hora", "id"], kind="stable", ignore_index=True)
         else:
-            rangos["75-100%"] += 1
+            df = pd.concat([self.df, nuevas], ignore_index=True)
+            # Solo se reordena todo si alguna fila nueva tiene fecha anterior a la última conocida
+            if nuevas["fecha_hora"].min() < self.df["fecha_hora"].iloc[-1]:
+                df = df.sort_values(["fecha_hora", "id"], kind="stable", ignore_index=True)
+        self.df = df
+        self.ultimo_id = int(df["id"].max())
+        if self.al_agregar is not None:
+            self.al_agregar(nuevas)
     
-    # Pacientes únicos
-    pacientes_unicos = len(set(p['nombre'] for p in historial))
+    def invalidar(self):
+        """Marca la copia local para sincronizarse en la próxima lectura"""
+        with self._lock:
+            self.pendiente = True
+    
+    def reiniciar(self):
+        """Vacía la copia local (por ejemplo tras limpiar la tabla)"""
+        with self._lock:
+            self.df = pd.DataFrame(columns=COLUMNAS_HISTORIAL)
+            self.ultimo_id = None
+            self.pendiente = True
+
+@st.cache_resource
+def init_monitor_drift():
+    """Crea el detector de drift en streaming, retomando su estado guardado"""
+    return MonitorDrift(ruta=os.environ.get("RUTA_MONITOR_DRIFT", "monitor_drift.json"))
+
+monitor_drift = init_monitor_drift()
+
+def alimentar_monitor_drift(nuevas):
+    """Pasa al detector de drift predicciones nuevas (las ya procesadas se ignoran por su id)"""
+    try:
+        monitor_drift.actualizar_filas(nuevas["id"], nuevas["probabilidad"], nuevas["fecha_hora"])
+    except Exception as e:
+        logger.warning("No se pudo actualizar el monitor de drift: %s", e)
+
+@st.cache_resource
+def init_historial_local():
+    """Crea la copia local del historial compartida entre sesiones"""
+    # El monitor de drift se alimenta al escribir; la sincronización recupera las filas de otros
+    # procesos (API, ingesta) y las que se escribieron con la app parada
+    return HistorialLocal(supabase, al_agregar=alimentar_monitor_drift)
+
+historial_local = init_historial_local()
+
+@st.cache_resource
+def init_agregados():
+    """Crea el acceso a los agregados del panel, calculándolos la primera vez"""
+    agregados = AgregadosPredicciones(supabase)
+    try:
+        agregados.inicializar()
+    except Exception as e:
+        logger.warning("No se pudieron inicializar los agregados: %s", e)
+    return agregados
+
+agregados = init_agregados()
+
+def al_insertar_predicciones(filas):
+    """Tras cada inserción del escritor: el detector de drift procesa las filas y el historial se resincroniza"""
+    alimentar_monitor_drift(pd.DataFrame(filas, columns=["id", "probabilidad", "fecha_hora"]))
+    historial_local.invalidar()
+
+@st.cache_resource
+def init_escritor():
+    """Crea la cola de escritura diferida compartida entre sesiones"""
+    return EscritorDiferido(
+        supabase,
+        ruta_spool=os.environ.get("RUTA_SPOOL", "predicciones_pendientes.jsonl"),
+        al_insertar=al_insertar_predicciones,
+        agregados=agregados
+    )
+
+escritor = init_escritor()
+
+@st.cache_resource
+def init_servidor_metricas():
+    """Arranca el endpoint local de Prometheus si se define METRICAS_PUERTO"""
+    puerto = os.environ.get("METRICAS_PUERTO")
+    if not puerto:
+        return None
+    try:
+        return iniciar_servidor_metricas(int(puerto), os.environ.get("METRICAS_HOST", "127.0.0.1"))
+    except OSError as e:
+        logger.warning("No se pudo abrir el puerto de métricas %s: %s", puerto, e)
+        return None
+
+servidor_metricas = init_servidor_metricas()
+
+@METRICAS.cronometrar("obtener_historial")
+def obtener_historial():
+    """Obtiene el historial compartido, pidiendo a Supabase solo las filas nuevas"""
+    try:
+        return historial_local.sincronizar()
+    except Exception as e:
+        st.error(f"Error al cargar historial: {str(e)}")
+        return historial_local.df
+
+def obtener_estadisticas(historial_df):
+    """Lee las métricas del panel de la fila de agregados (recalcula del historial si falla)"""
+    try:
+        return agregados.obtener()
+    except Exception as e:
+        logger.warning("Agregados no disponibles, se recalculan del historial: %s", e)
+        stats = obtener_estadisticas_avanzadas(historial_df)
+        if stats is not None:
+            # Los conteos de feedback salen de consultas filtradas por `correcta`, no del historial
+            try:
+                stats["feedback_total"], stats["feedback_positivo"], stats["feedback_negativo"] = contar_feedback(supabase)
+            except Exception as e:
+                logger.warning("No se pudo contar el feedback: %s", e)
+                stats["feedback_total"] = stats["feedback_positivo"] = stats["feedback_negativo"] = 0
+        return stats
+
+@st.cache_data(max_entries=4, show_spinner=False)
+@METRICAS.cronometrar("dibujo_drift")  # Solo se mide cuando no está en caché
+def grafico_drift(marca_agua, _historial_df):
+    """PNG del gráfico de drift, cacheado por marca de agua del historial"""
+    datos = datos_drift(_historial_df)
+    resumen = None
+    if datos["modo"] == "intervalos":
+        resumen = f"{datos['total']} predicciones agrupadas por {datos['intervalo']} ({len(datos['serie'])} intervalos)"
+    return dibujar_drift(datos), resumen
+
+def total_filtrado_agregados(filtro, stats):
+    """Filas que cumplen el filtro según la fila de agregados, sin contar en la tabla"""
+    if filtro == "Parkinson detectado":
+        return stats["total_parkinson"]
+    if filtro == "Saludable":
+        return stats["total_saludable"]
+    return stats["total_analisis"]
+
+def obtener_pagina_historial(filtro, pagina, tamano_pagina, stats=None):
+    """Obtiene una página del historial filtrada y ordenada en Supabase, junto con el total de filas
     
-    return {
-        "total_analisis": total_analisis,
-        "total_parkinson": total_parkinson,
-        "total_saludable": total_saludable,
-        "prob_promedio": prob_promedio,
-        "prob_maxima": prob_maxima,
-        "prob_minima": prob_minima,
-        "rangos": rangos,
-        "pacientes_unicos": pacientes_unicos
-    }
+    El total sale de los agregados (`stats`); solo si no están disponibles se pide a Supabase una
+    estimación, que evita el count(*) completo en tablas grandes.
+    """
+    try:
+        consulta = supabase.table("predicciones").select(
+            "id,nombre,probabilidad,resultado,fecha_hora", count=None if stats is not None else "estimated"
+        )
+        if filtro == "Parkinson detectado":
+            consulta = consulta.gt("probabilidad", 0.5)
+        elif filtro == "Saludable":
+            consulta = consulta.lte("probabilidad", 0.5)
+        
+        inicio = pagina * tamano_pagina
+        response = (
+            consulta.order("fecha_hora", desc=True)
+            .order("id", desc=True)
+            .range(inicio, inicio + tamano_pagina - 1)
+            .execute()
+        )
+        total = total_filtrado_agregados(filtro, stats) if stats is not None else response.count
+        return response.data or [], total or 0
+    except Exception as e:
+        st.error(f"Error al cargar la página del historial: {str(e)}")
+        return [], 0
+
+def obtener_comentarios(pagina, tamano_pagina):
+    """Una página de predicciones con feedback (consulta sobre el índice de `correcta`) y su total"""
+    try:
+        return obtener_pagina_feedback(supabase, pagina, tamano_pagina)
+    except Exception as e:
+        st.error(f"Error al cargar el feedback: {str(e)}")
+        return [], 0
+
+@METRICAS.cronometrar("busqueda_pacientes")
+def buscar_pacientes_panel(texto):
+    """Pacientes que coinciden con el texto (prefijo y subcadena sobre la clave indexada)"""
+    try:
+        return buscar_pacientes(supabase, texto)
+    except Exception as e:
+        st.error(f"Error al buscar pacientes: {str(e)}")
+        return []
+
+@METRICAS.cronometrar("evolucion_paciente")
+def obtener_evolucion_paciente(clave):
+    """Análisis de un solo paciente en orden cronológico, sin descargar el resto del historial"""
+    try:
+        return pd.DataFrame(evolucion_paciente(supabase, clave))
+    except Exception as e:
+        st.error(f"Error al cargar la evolución del paciente: {str(e)}")
+        return pd.DataFrame()
+
+@METRICAS.cronometrar("casos_similares")
+def obtener_casos_similares(embedding, k=CASOS_SIMILARES):
+    """Predicciones anteriores con el embedding más parecido, de la más a la menos similar"""
+    try:
+        vecinos = indice_embeddings.buscar(embedding, k)
+        if not vecinos:
+            return pd.DataFrame()
+        ids = [prediccion_id for prediccion_id, _ in vecinos]
+        filas = (
+            supabase.table("predicciones").select("id,probabilidad,resultado,fecha_hora,correcta")
+            .in_("id", ids).execute().data or []
+        )
+        # Las filas borradas de la tabla ya no se muestran aunque sigan en el índice
+        por_id = {fila["id"]: fila for fila in filas}
+        return pd.DataFrame([
+            dict(por_id[prediccion_id], similitud=similitud)
+            for prediccion_id, similitud in vecinos if prediccion_id in por_id
+        ])
+    except Exception as e:
+        st.error(f"Error al buscar casos similares: {str(e)}")
+        return pd.DataFrame()
+
+def invalidar_historial():
+    """Fuerza una sincronización incremental tras una escritura"""
+    historial_local.invalidar()
+
+def limpiar_historial(progreso=None, tamano_bloque=LIMPIEZA_BLOQUE):
+    """Limpia todo el historial en Supabase borrando por rangos de id"""
+    try:
+        inicio = time.perf_counter()
+        # Lo que ya estaba encolado se escribe antes de leer los ids y se borra con el resto
+        escritor.vaciar()
+        # Total de filas e id mínimo en una sola petición, id máximo en otra
+        primero = supabase.table("predicciones").select("id", count="exact").order("id").limit(1).execute()
+        ultimo = supabase.table("predicciones").select("id").order("id", desc=True).limit(1).execute()
+        peticiones = 2
+        total = primero.count or 0
+        
+        if primero.data:
+            id_minimo = primero.data[0]["id"]
+            id_maximo = ultimo.data[0]["id"]
+            # Cada petición borra como mucho un bloque de filas para no agotar el tiempo de espera
+            peticiones += borrar_rango_ids(supabase, id_minimo, id_maximo, tamano_bloque, progreso)
+            # Las predicciones guardadas durante la limpieza tienen ids mayores y conservan su embedding
+            indice_embeddings.descartar_hasta(id_maximo)
+        
+        monitor_drift.reiniciar()
+        # La siguiente sincronización vuelve a pasar al monitor de drift las filas que quedan
+        historial_local.reiniciar()
+        # Tras limpiar solo quedan las filas escritas durante el borrado: recalcular es inmediato
+        agregados.reconstruir()
+        return {
+            "eliminados": total,
+            "peticiones": peticiones,
+            "segundos": time.perf_counter() - inicio
+        }
+    except Exception as e:
+        historial_local.reiniciar()
+        st.error(f"Error al limpiar historial: {str(e)}")
+        return None
 
 # Sidebar para navegación
 st.sidebar.title("🧠 Navegación")
@@ -208,42 +513,150 @@ if pagina == "🔍 Análisis":
     st.markdown("<p style='text-align: center;'>Sube una imagen de trazo para predecir la probabilidad de Parkinson.</p>", unsafe_allow_html=True)
     st.markdown("---")
     
+    if modelo.error is not None:
+        st.error(f"⚠️ Error al cargar el modelo: {modelo.error}")
+    elif not modelo.listo:
+        st.info("⏳ El modelo se está cargando en segundo plano; la primera predicción esperará a que termine.")
+    
     col1, col2 = st.columns([2, 1])
     
     with col1:
-        nombre_paciente = st.text_input("👤 Nombre del paciente:", placeholder="Ej: Juan Pérez")
-        imagen_subida = st.file_uploader("📤 Sube una imagen (trazo de espiral u onda)", type=["jpg", "jpeg", "png"])
+        modo_analisis = st.radio("Modo de análisis:", ["📄 Individual", "📚 Lote (varias imágenes)"], horizontal=True)
+        
+        if modo_analisis == "📄 Individual":
+            nombre_paciente = st.text_input("👤 Nombre del paciente:", placeholder="Ej: Juan Pérez")
+            imagen_subida = st.file_uploader("📤 Sube una imagen (trazo de espiral u onda)", type=["jpg", "jpeg", "png"])
         
-        if imagen_subida:
-            imagen = Image.open(imagen_subida)
-            st.image(imagen, caption='Imagen cargada', use_column_width=True)
+            if imagen_subida:
+                # El navegador muestra los bytes originales; la imagen solo se decodifica para predecir
+                imagen = abrir_imagen(imagen_subida)
+                st.image(imagen_subida.getvalue(), caption='Imagen cargada', use_column_width=True)
             
-            if st.button("🔍 Predecir", type="primary"):
-                if not nombre_paciente:
-                    st.warning("⚠️ Por favor ingresa el nombre del paciente antes de predecir.")
-                else:
-                    with st.spinner("Analizando imagen..."):
-                        probabilidad = predecir_imagen(imagen)
-                        fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                if st.button("🔍 Predecir", type="primary"):
+                    if not nombre_paciente:
+                        st.warning("⚠️ Por favor ingresa el nombre del paciente antes de predecir.")
+                    else:
+                        with st.spinner("Analizando imagen..."):
+                            probabilidad, embedding = predecir_imagen(
+                                modelo, imagen, cache_predicciones, planificador, con_embedding=True
+                            )
+                            fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            # En los resultados dudosos se buscan los trazos más parecidos ya analizados
+                            # (antes de guardar, para que el propio análisis no salga entre ellos)
+                            similares = None
+                            if embedding is not None and BANDA_CASOS_SIMILARES[0] < probabilidad <= BANDA_CASOS_SIMILARES[1]:
+                                similares = obtener_casos_similares(embedding)
                         
-                        # Guardar en Supabase
-                        if guardar_prediccion(nombre_paciente, probabilidad, fecha_hora):
-                            # Guardar datos para feedback
-                            st.session_state['ultimo_nombre'] = nombre_paciente
-                            st.session_state['ultima_fecha'] = fecha_hora
-                            st.session_state['mostrar_feedback'] = True
+                            # Guardar en Supabase
+                            if guardar_prediccion(nombre_paciente, probabilidad, fecha_hora, embedding):
+                                # Guardar datos para feedback
+                                st.session_state['ultimo_nombre'] = nombre_paciente
+                                st.session_state['ultima_fecha'] = fecha_hora
+                                st.session_state['mostrar_feedback'] = True
+                            
+                                st.markdown("---")
+                                if probabilidad > 0.5:
+                                    st.error(f"🧠 **Probabilidad de Parkinson detectada: {probabilidad*100:.2f}%**")
+                                    st.info(f"📅 Análisis realizado el {fecha_hora}")
+                                else:
+                                    st.success(f"✅ **Imagen saludable detectada: {(1 - probabilidad)*100:.2f}%**")
+                                    st.info(f"📅 Análisis realizado el {fecha_hora}")
+                            
+                                st.success("💾 Predicción enviada a la base de datos")
+                                
+                                if similares is not None and not similares.empty:
+                                    st.markdown("#### 🔎 Casos similares analizados antes")
+                                    similares["probabilidad"] = (similares["probabilidad"] * 100).round(2)
+                                    similares["similitud"] = similares["similitud"].round(3)
+                                    # Sin nombres de pacientes: la página de análisis no requiere sesión
+                                    st.dataframe(
+                                        similares.rename(columns={
+                                            "fecha_hora": "Fecha", "probabilidad": "Probabilidad (%)", "resultado": "Resultado",
+                                            "correcta": "Confirmado por feedback", "similitud": "Similitud"
+                                        })[["Fecha", "Probabilidad (%)", "Resultado", "Confirmado por feedback", "Similitud"]],
+                                        hide_index=True,
+                                        use_container_width=True
+                                    )
+                                st.markdown("---")
+                                st.markdown("**Nota:** Este resultado es orientativo y no sustituye una evaluación médica profesional.", unsafe_allow_html=True)
+        
+        else:
+            imagenes_subidas = st.file_uploader(
+                "📤 Sube varias imágenes (espirales y ondas de varios pacientes)",
+                type=["jpg", "jpeg", "png"],
+                accept_multiple_files=True
+            )
+            
+            if imagenes_subidas:
+                # El nombre del paciente se toma del nombre del archivo y puede editarse
+                tabla_pacientes = st.data_editor(
+                    pd.DataFrame({
+                        "Archivo": [archivo.name for archivo in imagenes_subidas],
+                        "Paciente": [os.path.splitext(archivo.name)[0] for archivo in imagenes_subidas]
+                    }),
+                    disabled=["Archivo"],
+                    hide_index=True,
+                    use_container_width=True
+                )
+                comparar_secuencial = st.checkbox("⏱️ Comparar rendimiento con el análisis uno por uno")
+                
+                if st.button("🔍 Predecir lote", type="primary"):
+                    if tabla_pacientes["Paciente"].fillna("").str.strip().eq("").any():
+                        st.warning("⚠️ Todas las imágenes deben tener un nombre de paciente.")
+                    else:
+                        with st.spinner(f"Analizando {len(imagenes_subidas)} imágenes..."):
+                            imagenes = [abrir_imagen(archivo) for archivo in imagenes_subidas]
+                            
+                            inicio = time.perf_counter()
+                            # Al comparar se omite la caché para medir el modelo en ambos modos
+                            probabilidades, embeddings = predecir_lote(
+                                modelo, imagenes, None if comparar_secuencial else cache_predicciones, con_embedding=True
+                            )
+                            tiempo_lote = time.perf_counter() - inicio
                             
-                            st.markdown("---")
-                            if probabilidad > 0.5:
-                                st.error(f"🧠 **Probabilidad de Parkinson detectada: {probabilidad*100:.2f}%**")
-                                st.info(f"📅 Análisis realizado el {fecha_hora}")
-                            else:
-                                st.success(f"✅ **Imagen saludable detectada: {(1 - probabilidad)*100:.2f}%**")
-                                st.info(f"📅 Análisis realizado el {fecha_hora}")
+                            fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            registros = [
+                                (nombre, probabilidad, fecha_hora)
+                                for nombre, probabilidad in zip(tabla_pacientes["Paciente"], probabilidades)
+                            ]
+                            guardado = guardar_predicciones_lote(registros, embeddings)
                             
-                            st.success("💾 Predicción guardada en la base de datos")
-                            st.markdown("---")
-                            st.markdown("**Nota:** Este resultado es orientativo y no sustituye una evaluación médica profesional.", unsafe_allow_html=True)
+                            tiempo_secuencial = None
+                            if comparar_secuencial:
+                                inicio = time.perf_counter()
+                                for imagen in imagenes:
+                                    predecir_imagen(modelo, imagen)
+                                tiempo_secuencial = time.perf_counter() - inicio
+                        
+                        st.markdown("---")
+                        st.dataframe(
+                            pd.DataFrame({
+                                "Paciente": tabla_pacientes["Paciente"],
+                                "Archivo": tabla_pacientes["Archivo"],
+                                "Probabilidad (%)": np.round(probabilidades * 100, 2),
+                                "Resultado": np.where(probabilidades > 0.5, "Parkinson detectado", "Saludable")
+                            }),
+                            hide_index=True,
+                            use_container_width=True
+                        )
+                        
+                        col_m1, col_m2, col_m3 = st.columns(3)
+                        with col_m1:
+                            st.metric("🖼️ Imágenes", len(imagenes))
+                        with col_m2:
+                            st.metric("⏱️ Tiempo (lote)", f"{tiempo_lote:.2f} s")
+                        with col_m3:
+                            st.metric("⚡ Imágenes/seg (lote)", f"{len(imagenes) / tiempo_lote:.1f}")
+                        
+                        if tiempo_secuencial is not None:
+                            st.info(
+                                f"🐢 Uno por uno: {len(imagenes) / tiempo_secuencial:.1f} imágenes/seg "
+                                f"({tiempo_secuencial:.2f} s) · Aceleración del lote: {tiempo_secuencial / tiempo_lote:.1f}x"
+                            )
+                        
+                        if guardado:
+                            st.success(f"💾 {len(registros)} predicciones enviadas a la base de datos")
+                        st.markdown("**Nota:** Estos resultados son orientativos y no sustituyen una evaluación médica profesional.", unsafe_allow_html=True)
         
         # === 🗣️ BLOQUE DE FEEDBACK DEL USUARIO ===
         if st.session_state.get("mostrar_feedback", False):
@@ -266,9 +679,9 @@ if pagina == "🔍 Análisis":
                 )
             
             if st.button("📩 Enviar Feedback", type="primary"):
-                feedback_texto = f"{feedback_correcto} | {comentario if comentario else 'Sin comentario'}"
+                correcta = feedback_correcto.startswith("👍")
                 if st.session_state['ultimo_id_prediccion']:
-                    if guardar_feedback(st.session_state['ultimo_id_prediccion'], feedback_texto):
+                    if guardar_feedback(st.session_state['ultimo_id_prediccion'], correcta, comentario.strip() or None):
                         st.success("✅ ¡Gracias por tu retroalimentación!")
                         st.balloons()
                         st.session_state["mostrar_feedback"] = False
@@ -329,103 +742,126 @@ elif pagina == "📊 Historial / Panel Admin":
         st.markdown(f"<p style='text-align: center;'>Bienvenido, {st.session_state['usuario_actual']}</p>", unsafe_allow_html=True)
         st.markdown("---")
         
+        # Una sola lectura del historial por render, compartida por todas las tabs
+        historial_df = obtener_historial()
+        stats = obtener_estadisticas(historial_df)
+        
         # Crear tabs para organizar el contenido
-        tab1, tab2, tab3 = st.tabs(["📊 Historial de Predicciones", "📈 Estadísticas y Drift", "💬 Feedback de Usuarios"])
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Historial de Predicciones", "📈 Estadísticas y Drift", "💬 Feedback de Usuarios", "⏱️ Rendimiento", "🧑‍⚕️ Pacientes"])
         
         # ==================== TAB 1: HISTORIAL ====================
         with tab1:
-            historial = obtener_historial()
+            resumen = st.session_state.pop('resumen_limpieza', None)
+            if resumen is not None:
+                st.success(
+                    f"✅ Historial limpiado: {resumen['eliminados']} registros en {resumen['segundos']:.2f} s "
+                    f"con {resumen['peticiones']} peticiones (el borrado fila por fila requería {resumen['eliminados'] + 1})"
+                )
             
-            if len(historial) == 0:
+            if len(historial_df) == 0:
                 st.info("📭 No hay predicciones guardadas aún. Realiza tu primer análisis en la pestaña '🔍 Análisis'.")
             else:
-                col1, col2, col3, col4 = st.columns(4)
-                
-                total_analisis = len(historial)
-                total_parkinson = sum(1 for p in historial if p['probabilidad'] > 0.5)
-                total_saludable = total_analisis - total_parkinson
-                prob_promedio = sum(p['probabilidad'] for p in historial) / total_analisis
-                
-                with col1:
-                    st.metric("📈 Total de análisis", total_analisis)
-                with col2:
-                    st.metric("🔴 Parkinson detectado", total_parkinson)
-                with col3:
-                    st.metric("🟢 Saludables", total_saludable)
-                with col4:
-                    st.metric("📊 Prob. promedio", f"{prob_promedio*100:.1f}%")
-                
-                st.markdown("---")
+                # Los agregados pueden ir por detrás del historial si falló su actualización
+                if stats is not None:
+                    col1, col2, col3, col4 = st.columns(4)
+                    
+                    with col1:
+                        st.metric("📈 Total de análisis", stats['total_analisis'])
+                    with col2:
+                        st.metric("🔴 Parkinson detectado", stats['total_parkinson'])
+                    with col3:
+                        st.metric("🟢 Saludables", stats['total_saludable'])
+                    with col4:
+                        st.metric("📊 Prob. promedio", f"{stats['prob_promedio']*100:.1f}%")
+                    
+                    st.markdown("---")
                 
                 col_filtro, col_boton = st.columns([3, 1])
                 
                 with col_filtro:
                     filtro = st.selectbox("🔍 Filtrar por resultado:", 
-                                         ["Todos", "Parkinson detectado", "Saludable"])
+                                         ["Todos", "Parkinson detectado", "Saludable"],
+                                         on_change=lambda: st.session_state.update(pagina_historial=1))
                 
                 with col_boton:
                     st.markdown("<br>", unsafe_allow_html=True)
                     if st.button("🗑️ Limpiar historial", type="secondary"):
                         if st.session_state.get('confirmar_limpieza_hist'):
-                            if limpiar_historial():
+                            barra_limpieza = st.progress(0.0, text="Limpiando historial...")
+                            resumen = limpiar_historial(
+                                progreso=lambda avance: barra_limpieza.progress(avance, text=f"Limpiando historial... {avance*100:.0f}%")
+                            )
+                            if resumen is not None:
                                 st.session_state['confirmar_limpieza_hist'] = False
-                                st.success("✅ Historial limpiado")
+                                st.session_state['resumen_limpieza'] = resumen
                                 st.rerun()
                         else:
                             st.session_state['confirmar_limpieza_hist'] = True
                             st.warning("⚠️ Clic nuevamente para confirmar")
                 
-                historial_invertido = historial[::-1]
-                
                 st.markdown("### 📋 Registro de análisis")
                 
-                for idx, prediccion in enumerate(historial_invertido):
-                    if filtro == "Parkinson detectado" and prediccion['probabilidad'] <= 0.5:
-                        continue
-                    elif filtro == "Saludable" and prediccion['probabilidad'] > 0.5:
-                        continue
-                    
-                    if prediccion['probabilidad'] > 0.5:
-                        color_borde = "#ff4b4b"
-                        icono = "🔴"
-                    else:
-                        color_borde = "#00cc00"
-                        icono = "🟢"
-                    
-                    with st.container():
-                        st.markdown(f"""
-                        <div style='padding: 15px; border-left: 5px solid {color_borde}; background-color: #f0f2f6; border-radius: 5px; margin-bottom: 10px;'>
-                            <p style='margin: 0; font-size: 18px;'><strong>{icono} {prediccion['nombre']}</strong></p>
-                            <p style='margin: 5px 0; color: #666;'>📅 {prediccion['fecha_hora']}</p>
-                            <p style='margin: 5px 0;'><strong>Resultado:</strong> {prediccion['resultado']}</p>
-                            <p style='margin: 5px 0;'><strong>Probabilidad de Parkinson:</strong> {prediccion['probabilidad']*100:.2f}%</p>
-                        </div>
-                        """, unsafe_allow_html=True)
+                col_tamano, col_pagina = st.columns([1, 1])
+                with col_tamano:
+                    tamano_pagina = st.selectbox("Filas por página:", [10, 25, 50, 100], index=1)
+                
+                # Filtro, orden y paginación se resuelven en Supabase; el total, con los agregados
+                filas_pagina, total_filtrado = obtener_pagina_historial(
+                    filtro, st.session_state.get('pagina_historial', 1) - 1, tamano_pagina, stats
+                )
+                total_paginas = max(1, -(-total_filtrado // tamano_pagina))
+                
+                with col_pagina:
+                    pagina_actual = st.number_input(
+                        f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas,
+                        value=min(st.session_state.get('pagina_historial', 1), total_paginas), step=1
+                    )
+                
+                if pagina_actual != st.session_state.get('pagina_historial', 1):
+                    st.session_state['pagina_historial'] = pagina_actual
+                    st.rerun()
+                
+                if len(filas_pagina) == 0:
+                    st.info("📭 No hay análisis que coincidan con el filtro.")
+                else:
+                    tabla = pd.DataFrame(filas_pagina)
+                    st.dataframe(
+                        pd.DataFrame({
+                            "": np.where(tabla["probabilidad"] > 0.5, "🔴", "🟢"),
+                            "Paciente": tabla["nombre"],
+                            "Fecha": tabla["fecha_hora"],
+                            "Resultado": tabla["resultado"],
+                            "Probabilidad de Parkinson (%)": (tabla["probabilidad"] * 100).round(2)
+                        }),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+                    st.caption(f"Mostrando {len(filas_pagina)} de {total_filtrado} análisis")
                 
                 st.markdown("---")
                 st.markdown("### 💾 Exportar datos")
                 
-                historial_texto = "HISTORIAL DE PREDICCIONES - DETECTOR DE PARKINSON\n"
-                historial_texto += "=" * 60 + "\n\n"
-                
-                for pred in historial_invertido:
-                    historial_texto += f"Paciente: {pred['nombre']}\n"
-                    historial_texto += f"Fecha: {pred['fecha_hora']}\n"
-                    historial_texto += f"Resultado: {pred['resultado']}\n"
-                    historial_texto += f"Probabilidad: {pred['probabilidad']*100:.2f}%\n"
-                    historial_texto += "-" * 60 + "\n\n"
-                
-                st.download_button(
-                    label="📥 Descargar historial (TXT)",
-                    data=historial_texto,
-                    file_name=f"historial_parkinson_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                    mime="text/plain"
-                )
+                # El archivo solo se genera cuando se pide, no en cada render
+                col_formato, col_exportar = st.columns([1, 1])
+                with col_formato:
+                    formato_historial = st.selectbox("Formato:", list(FORMATOS_EXPORTACION), key="formato_historial")
+                with col_exportar:
+                    st.markdown("<br>", unsafe_allow_html=True)
+                    preparar_historial = st.button("⚙️ Preparar exportación", key="preparar_historial")
+                
+                if preparar_historial:
+                    extension, mime = FORMATOS_EXPORTACION[formato_historial]
+                    with st.spinner("Generando archivo..."):
+                        datos_historial = exportar(tabla_historial(historial_df), formato_historial, bloques_txt_historial)
+                    st.download_button(
+                        label=f"📥 Descargar historial ({formato_historial})",
+                        data=datos_historial,
+                        file_name=f"historial_parkinson_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                        mime=mime
+                    )
         
         # ==================== TAB 2: ESTADÍSTICAS Y DRIFT ====================
         with tab2:
-            stats = obtener_estadisticas_avanzadas()
-            
             if stats is None:
                 st.info("📊 No hay datos disponibles aún. Espera a que se realicen análisis.")
             else:
@@ -505,74 +941,126 @@ elif pagina == "📊 Historial / Panel Admin":
                 st.markdown("---")
                 st.markdown("### 📈 Evolución temporal de predicciones (Drift del modelo)")
                 
-                historial = obtener_historial()
-                if len(historial) < 2:
+                if len(historial_df) < 2:
                     st.info("📊 Aún no hay suficientes datos para graficar la evolución.")
                 else:
-                    df = pd.DataFrame(historial)
-                    df["fecha_hora"] = pd.to_datetime(df["fecha_hora"])
-                    df = df.sort_values("fecha_hora")
-                    df["promedio_movil"] = df["probabilidad"].rolling(window=3, min_periods=1).mean()
-
-                    fig, ax = plt.subplots(figsize=(10, 5))
-                    ax.scatter(df["fecha_hora"], df["probabilidad"], color="gray", alpha=0.6, s=50, label="Predicciones individuales")
-                    ax.plot(df["fecha_hora"], df["promedio_movil"], marker='o', linestyle='-', color='royalblue', linewidth=2, markersize=6, label="Promedio móvil (ventana=3)")
-                    ax.axhline(0.5, color='red', linestyle='--', linewidth=2, label='Umbral 50%')
-                    ax.set_title("Evolución de las predicciones en el tiempo", fontsize=14, fontweight='bold')
-                    ax.set_xlabel("Fecha y hora del análisis", fontsize=11)
-                    ax.set_ylabel("Probabilidad de Parkinson", fontsize=11)
-                    ax.legend(loc='best', fontsize=9)
-                    ax.grid(True, alpha=0.3, linestyle='--')
-                    plt.xticks(rotation=45, ha='right')
-                    plt.tight_layout()
-                    st.pyplot(fig)
-
-                    primeros = df["probabilidad"].head(3).mean()
-                    ultimos = df["probabilidad"].tail(3).mean()
-                    drift_valor = (ultimos - primeros) * 100
-
-                    if abs(drift_valor) < 5:
-                        estado = "✅ Sin drift significativo"
-                        color = "green"
-                    elif drift_valor > 5:
-                        estado = "⚠️ Posible aumento en detecciones de Parkinson"
-                        color = "orange"
+                    # Se redibuja solo cuando cambia la marca de agua del historial
+                    marca_agua = (historial_local.ultimo_id, len(historial_df))
+                    with METRICAS.medir("grafico_drift"):
+                        imagen_drift, resumen_drift = grafico_drift(marca_agua, historial_df)
+                    st.image(imagen_drift, use_column_width=True)
+                    if resumen_drift:
+                        st.caption(resumen_drift)
+                
+                # Detector en streaming: PSI entre ventanas y Page-Hinkley sobre la media
+                estado_drift = monitor_drift.estado()
+                if estado_drift["nivel"] == "calentando":
+                    st.info(
+                        f"⏳ Reuniendo predicciones para el detector de drift: {estado_drift['referencia']}/{estado_drift['ventana']} "
+                        f"de referencia y {estado_drift['recientes']}/{estado_drift['ventana']} recientes"
+                    )
+                else:
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("📐 PSI (referencia vs. recientes)", f"{estado_drift['psi']:.3f}")
+                    with col2:
+                        st.metric("📊 Media reciente", f"{estado_drift['media_reciente']*100:.1f}%" if estado_drift['media_reciente'] is not None else "—")
+                    with col3:
+                        st.metric("🔢 Predicciones vigiladas", estado_drift['procesadas'])
+                    
+                    if estado_drift["nivel"] == "alerta":
+                        st.error(f"🚨 Drift significativo: la distribución reciente difiere de la referencia (PSI ≥ {DRIFT_PSI_ALERTA})")
+                    elif estado_drift["nivel"] == "aviso":
+                        st.warning(f"⚠️ Cambio moderado en la distribución de probabilidades (PSI ≥ {DRIFT_PSI_AVISO})")
                     else:
-                        estado = "⚠️ Posible disminución en detecciones de Parkinson"
-                        color = "orange"
-
-                    st.markdown(f"<p style='color:{color};font-weight:bold;font-size:16px;'>📊 {estado} ({drift_valor:+.2f}% de variación promedio)</p>", unsafe_allow_html=True)
+                        st.success("✅ Sin drift significativo")
+                
+                if estado_drift["alertas"]:
+                    with st.expander(f"🔔 Alertas de drift ({len(estado_drift['alertas'])})"):
+                        for alerta in reversed(estado_drift["alertas"]):
+                            st.markdown(f"- **{alerta['detector']}** · {alerta['fecha_hora']} (id {alerta['id']}): {alerta['mensaje']}")
                 
                 st.markdown("---")
                 
                 # Últimos análisis
                 st.markdown("### 🕐 Últimos 5 Análisis")
-                historial = obtener_historial()
-                ultimos = historial[-5:][::-1] if len(historial) >= 5 else historial[::-1]
-                
-                for pred in ultimos:
-                    color = "#ff4b4b" if pred['probabilidad'] > 0.5 else "#00cc00"
+                # Solo se convierten las 5 filas que se muestran, no todo el historial
+                for pred in historial_df.tail(5).iloc[::-1].itertuples(index=False):
+                    color = "#ff4b4b" if pred.probabilidad > 0.5 else "#00cc00"
                     st.markdown(f"""
                     <div style='padding: 10px; border-left: 4px solid {color}; background-color: #f8f9fa; border-radius: 5px; margin-bottom: 8px;'>
-                        <strong>{pred['nombre']}</strong> - {pred['fecha_hora']} - <strong>{pred['probabilidad']*100:.2f}%</strong>
+                        <strong>{pred.nombre}</strong> - {pred.fecha_hora} - <strong>{pred.probabilidad*100:.2f}%</strong>
                     </div>
                     """, unsafe_allow_html=True)
+            
+            # Estado de la escritura diferida en Supabase
+            st.markdown("---")
+            st.markdown("### 💾 Escritura en Base de Datos")
+            stats_escritor = escritor.estadisticas()
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                st.metric("⏳ En cola", stats_escritor['en_cola'])
+            with col2:
+                st.metric("✅ Escrituras completadas", stats_escritor['escritas'])
+            with col3:
+                st.metric("📁 Pendientes en disco", stats_escritor['en_spool'])
+            
+            if stats_escritor['en_spool'] > 0:
+                st.warning(f"⚠️ Supabase no respondió; las escrituras se reenviarán automáticamente. Último error: {stats_escritor['ultimo_error']}")
+            
+            # Rendimiento de la caché de predicciones
+            st.markdown("---")
+            st.markdown("### ⚡ Caché de Predicciones")
+            stats_cache = cache_predicciones.estadisticas()
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                st.metric("✅ Aciertos", stats_cache['aciertos'])
+            with col2:
+                st.metric("❌ Fallos", stats_cache['fallos'])
+            with col3:
+                st.metric("🎯 Tasa de aciertos", f"{stats_cache['tasa_aciertos']*100:.1f}%")
+            with col4:
+                st.metric("🗂️ Entradas", f"{stats_cache['entradas']} / {stats_cache['capacidad']}")
+            
+            # Cola compartida de micro-lotes para las predicciones individuales
+            st.markdown("---")
+            st.markdown("### ⚙️ Planificador de Micro-lotes")
+            stats_planificador = planificador.estadisticas()
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                st.metric("📦 Lotes ejecutados", stats_planificador['lotes'])
+            with col2:
+                st.metric("📏 Tamaño medio de lote", f"{stats_planificador['lote_medio']:.1f}")
+            with col3:
+                st.metric("⏳ Cola (actual / máx.)", f"{stats_planificador['cola_actual']} / {stats_planificador['cola_maxima']}")
+            with col4:
+                st.metric("⏱️ Latencia p50 / p99", f"{stats_planificador['p50_ms']:.0f} / {stats_planificador['p99_ms']:.0f} ms")
+            
+            if stats_planificador['histograma_lotes']:
+                with lock_graficos:
+                    st.bar_chart(pd.DataFrame(
+                        {"Lotes": list(stats_planificador['histograma_lotes'].values())},
+                        index=pd.Index(list(stats_planificador['histograma_lotes'].keys()), name="Tamaño de lote")
+                    ))
         
         # ==================== TAB 3: FEEDBACK DE USUARIOS ====================
         with tab3:
             st.markdown("### 💬 Retroalimentación de Usuarios")
             
-            historial = obtener_historial()
-            feedback_data = [p for p in historial if p.get('feedback') and p['feedback'].strip()]
+            # Conteos de la fila de agregados; sin historial no hay feedback
+            if stats is not None:
+                total_fb = stats['feedback_total']
+                positivos = stats['feedback_positivo']
+                negativos = stats['feedback_negativo']
+            else:
+                total_fb = positivos = negativos = 0
             
-            if len(feedback_data) == 0:
+            if total_fb == 0:
                 st.info("📭 No se ha recibido feedback todavía.")
             else:
-                # Estadísticas de feedback
-                positivos = sum(1 for f in feedback_data if "👍" in f['feedback'])
-                negativos = sum(1 for f in feedback_data if "👎" in f['feedback'])
-                total_fb = len(feedback_data)
-                
                 st.markdown("### 📊 Resumen de Feedback")
                 col1, col2, col3 = st.columns(3)
                 
@@ -586,16 +1074,24 @@ elif pagina == "📊 Historial / Panel Admin":
                 st.markdown("---")
                 st.markdown("### 💭 Comentarios recibidos")
                 
-                for fb in reversed(feedback_data):
-                    icono = "👍" if "👍" in fb["feedback"] else "👎"
-                    color = "#28a745" if "👍" in fb["feedback"] else "#dc3545"
-                    
-                    # Extraer comentario del feedback
-                    try:
-                        partes = fb["feedback"].split("|")
-                        comentario = partes[1].strip() if len(partes) > 1 else "Sin comentario adicional."
-                    except:
-                        comentario = fb["feedback"]
+                # Solo se piden las filas valoradas de la página actual, de la más reciente a la más antigua
+                comentarios_pagina, total_comentarios = obtener_comentarios(
+                    st.session_state.get('pagina_feedback', 1) - 1, FEEDBACK_POR_PAGINA
+                )
+                paginas_feedback = max(1, -(-total_comentarios // FEEDBACK_POR_PAGINA))
+                pagina_feedback = st.number_input(
+                    f"Página (de {paginas_feedback}):", min_value=1, max_value=paginas_feedback,
+                    value=min(st.session_state.get('pagina_feedback', 1), paginas_feedback), step=1,
+                    key="selector_pagina_feedback"
+                )
+                if pagina_feedback != st.session_state.get('pagina_feedback', 1):
+                    st.session_state['pagina_feedback'] = pagina_feedback
+                    st.rerun()
+                
+                for fb in comentarios_pagina:
+                    icono = "👍" if fb["correcta"] else "👎"
+                    color = "#28a745" if fb["correcta"] else "#dc3545"
+                    comentario = fb["comentario"] or "Sin comentario adicional."
                     
                     st.markdown(f"""
                     <div style='padding:15px; border-left:5px solid {color}; background-color:#f8f9fa; border-radius:5px; margin-bottom:15px;'>
@@ -606,32 +1102,110 @@ elif pagina == "📊 Historial / Panel Admin":
                         <p style='margin: 10px 0; padding: 10px; background-color: white; border-radius: 5px;'><em>"{comentario}"</em></p>
                     </div>
                     """, unsafe_allow_html=True)
+                st.caption(f"Mostrando {len(comentarios_pagina)} de {total_comentarios} valoraciones")
                 
                 st.markdown("---")
                 
                 # Descargar feedback
                 st.markdown("### 💾 Exportar Feedback")
-                feedback_texto = "RETROALIMENTACIÓN DE USUARIOS - DETECTOR DE PARKINSON\n"
-                feedback_texto += "=" * 70 + "\n\n"
+                col_formato, col_exportar = st.columns([1, 1])
+                with col_formato:
+                    formato_feedback = st.selectbox("Formato:", list(FORMATOS_EXPORTACION), key="formato_feedback")
+                with col_exportar:
+                    st.markdown("<br>", unsafe_allow_html=True)
+                    preparar_feedback = st.button("⚙️ Preparar exportación", key="preparar_feedback")
                 
-                for fb in reversed(feedback_data):
-                    partes = fb["feedback"].split("|")
-                    tipo_fb = "CORRECTO" if "👍" in partes[0] else "INCORRECTO"
-                    comentario = partes[1].strip() if len(partes) > 1 else "Sin comentario"
-                    
-                    feedback_texto += f"Paciente: {fb['nombre']}\n"
-                    feedback_texto += f"Fecha: {fb['fecha_hora']}\n"
-                    feedback_texto += f"Predicción: {fb['resultado']} ({fb['probabilidad']*100:.2f}%)\n"
-                    feedback_texto += f"Feedback: {tipo_fb}\n"
-                    feedback_texto += f"Comentario: {comentario}\n"
-                    feedback_texto += "-" * 70 + "\n\n"
-                
-                st.download_button(
-                    label="📥 Descargar feedback (TXT)",
-                    data=feedback_texto,
-                    file_name=f"feedback_parkinson_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                    mime="text/plain"
+                if preparar_feedback:
+                    extension, mime = FORMATOS_EXPORTACION[formato_feedback]
+                    with st.spinner("Generando archivo..."):
+                        feedback_df = pd.DataFrame(descargar_feedback(supabase), columns=COLUMNAS_FEEDBACK.split(","))
+                        datos_feedback = exportar(tabla_feedback(feedback_df), formato_feedback, bloques_txt_feedback)
+                    st.download_button(
+                        label=f"📥 Descargar feedback ({formato_feedback})",
+                        data=datos_feedback,
+                        file_name=f"feedback_parkinson_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                        mime=mime
+                    )
+
+        # ==================== TAB 4: RENDIMIENTO ====================
+        with tab4:
+            st.markdown("### ⏱️ Latencia por etapa")
+            st.caption(f"Percentiles sobre las últimas {METRICAS.ventana} mediciones de cada etapa en este proceso.")
+            resumen_etapas = METRICAS.resumen()
+            
+            if not resumen_etapas:
+                st.info("📭 Aún no hay mediciones. Realiza un análisis o abre el historial.")
+            else:
+                tabla_etapas = pd.DataFrame.from_dict(resumen_etapas, orient="index").sort_values("p95_ms", ascending=False)
+                tabla_etapas.index.name = "Etapa"
+                st.dataframe(
+                    tabla_etapas.rename(columns={
+                        "peticiones": "Mediciones", "errores": "Errores", "media_ms": "Media (ms)",
+                        "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)", "p99_ms": "p99 (ms)"
+                    }).round(1),
+                    use_container_width=True
                 )
+                st.markdown("#### p95 por etapa (ms)")
+                with lock_graficos:
+                    st.bar_chart(tabla_etapas["p95_ms"])
+            
+            if servidor_metricas is not None:
+                st.info(f"📡 Métricas en formato Prometheus: http://{servidor_metricas.server_address[0]}:{servidor_metricas.server_address[1]}/metrics")
+            else:
+                st.caption("Define METRICAS_PUERTO para exportarlas en formato Prometheus.")
+        
+        # ==================== TAB 5: PACIENTES ====================
+        with tab5:
+            st.markdown("### 🧑‍⚕️ Evolución por paciente")
+            texto_busqueda = st.text_input(
+                "🔍 Buscar paciente:", placeholder="Escribe el inicio o parte del nombre...", key="busqueda_paciente"
+            )
+            
+            if not texto_busqueda.strip():
+                st.info("💡 Escribe el nombre del paciente; no importan mayúsculas ni tildes.")
+            else:
+                pacientes_encontrados = buscar_pacientes_panel(texto_busqueda)
+                if len(pacientes_encontrados) == 0:
+                    st.info("📭 Ningún paciente coincide con la búsqueda.")
+                else:
+                    paciente = st.selectbox(
+                        f"Pacientes encontrados ({len(pacientes_encontrados)}):", pacientes_encontrados,
+                        format_func=lambda p: p["nombre"], key="paciente_seleccionado"
+                    )
+                    evolucion = obtener_evolucion_paciente(paciente["clave"])
+                    
+                    if len(evolucion) == 0:
+                        st.info("📭 No hay análisis con la clave de este paciente. Si son anteriores a la búsqueda, ejecuta `python pacientes.py rellenar`.")
+                    else:
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("📈 Análisis", len(evolucion))
+                        with col2:
+                            st.metric(
+                                "🎯 Última probabilidad", f"{evolucion['probabilidad'].iloc[-1]*100:.1f}%",
+                                delta=f"{(evolucion['probabilidad'].iloc[-1] - evolucion['probabilidad'].iloc[0])*100:+.1f}% desde el primero",
+                                delta_color="inverse"
+                            )
+                        with col3:
+                            st.metric("📅 Seguimiento", f"{evolucion['fecha_hora'].iloc[0][:10]} → {evolucion['fecha_hora'].iloc[-1][:10]}")
+                        
+                        with lock_graficos:
+                            st.line_chart(pd.DataFrame({
+                                "Probabilidad de Parkinson (%)": (evolucion["probabilidad"] * 100).round(2).values,
+                                "Umbral 50%": 50.0
+                            }, index=pd.to_datetime(evolucion["fecha_hora"]).rename("Fecha")))
+                        
+                        st.dataframe(
+                            pd.DataFrame({
+                                "": np.where(evolucion["probabilidad"] > 0.5, "🔴", "🟢"),
+                                "Fecha": evolucion["fecha_hora"],
+                                "Resultado": evolucion["resultado"],
+                                "Probabilidad de Parkinson (%)": (evolucion["probabilidad"] * 100).round(2),
+                                "Feedback": evolucion["correcta"].map({True: "👍", False: "👎"}).fillna("")
+                            }).iloc[::-1],
+                            hide_index=True,
+                            use_container_width=True
+                        )
 
 # Footer
 st.sidebar.markdown("---")
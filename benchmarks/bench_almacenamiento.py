@@ -0,0 +1,78 @@
+"""Compara los backends de almacenamiento (SQLite local y Supabase) en las operaciones de la app
+
+Operaciones: inserciones individuales, inserción por bloques, descarga completa del historial,
+descarga incremental, página filtrada con conteo, actualización de feedback y limpieza.
+Supabase solo se mide si SUPABASE_URL / SUPABASE_KEY están configuradas (usa una tabla real:
+el benchmark borra lo que inserta, pero conviene apuntar a un proyecto de pruebas).
+
+Uso: python benchmarks/bench_almacenamiento.py [--filas 10000] [--individuales 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacenamiento import SIN_FILAS, TABLA_PREDICCIONES, actualizar_feedback, insertar_prediccion, insertar_predicciones
+from bench_estadisticas import historial_sintetico
+
+def medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return (time.perf_counter() - inicio) * 1000, resultado
+
+def descargar(cliente, desde_id=0, tamano_pagina=1000):
+    """Descarga por keyset igual que HistorialLocal"""
+    filas = []
+    while True:
+        pagina = (cliente.table(TABLA_PREDICCIONES).select("*").gt("id", desde_id)
+                  .order("id").limit(tamano_pagina).execute().data)
+        filas.extend(pagina)
+        if len(pagina) < tamano_pagina:
+            return filas
+        desde_id = pagina[-1]["id"]
+
+def ejecutar(cliente, filas, individuales):
+    registros = list(historial_sintetico(filas)[["nombre", "probabilidad", "fecha_hora"]].itertuples(index=False))
+    tiempos = {}
+    
+    ms, guardadas = medir(lambda: [insertar_prediccion(cliente, *r) for r in registros[:individuales]])
+    tiempos[f"insertar x{individuales} (ms/fila)"] = ms / individuales
+    ms, guardadas_lote = medir(lambda: insertar_predicciones(cliente, registros[individuales:]))
+    tiempos[f"insertar por bloques x{len(registros) - individuales}"] = ms
+    ids = [f["id"] for f in guardadas + guardadas_lote]
+    
+    tiempos["historial completo"], _ = medir(lambda: descargar(cliente, min(ids) - 1))
+    tiempos["historial incremental (100 filas)"], _ = medir(lambda: descargar(cliente, ids[-101]))
+    tiempos["página filtrada + conteo"], _ = medir(
+        lambda: cliente.table(TABLA_PREDICCIONES).select("*", count="exact").gte("probabilidad", 0.5)
+        .gte("id", min(ids)).order("fecha_hora", desc=True).range(0, 49).execute()
+    )
+    tiempos["feedback x50 (ms/fila)"] = medir(
+        lambda: [actualizar_feedback(cliente, i, True) for i in ids[:50]]
+    )[0] / 50
+    tiempos["limpieza"], _ = medir(
+        lambda: cliente.table(TABLA_PREDICCIONES).delete(returning=SIN_FILAS).gte("id", min(ids)).lte("id", max(ids)).execute()
+    )
+    return tiempos
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=10_000)
+    parser.add_argument("--individuales", type=int, default=200)
+    args = parser.parse_args()
+    
+    backends = {}
+    with tempfile.TemporaryDirectory() as temporal:
+        from supabase_sqlite import ClienteSQLite
+        backends["sqlite"] = ejecutar(ClienteSQLite(os.path.join(temporal, "bench.db")), args.filas, args.individuales)
+    if os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_KEY"):
+        from almacenamiento import crear_cliente_supabase
+        backends["supabase"] = ejecutar(crear_cliente_supabase(), args.filas, args.individuales)
+    else:
+        print("Supabase sin credenciales: solo se mide SQLite\n")
+    
+    print(f"{'operación (ms)':<40}" + "".join(f"{nombre:>12}" for nombre in backends))
+    for operacion in next(iter(backends.values())):
+        print(f"{operacion:<40}" + "".join(f"{t[operacion]:>12.2f}" for t in backends.values()))
@@ -0,0 +1,85 @@
+"""Compara el cálculo de estadísticas fila por fila con el motor vectorizado
+
+Uso: python benchmarks/bench_estadisticas.py [filas ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from estadisticas import obtener_estadisticas_avanzadas
+
+def historial_sintetico(filas, semilla=0):
+    """Genera un historial de predicciones con la misma forma que la tabla real"""
+    rng = np.random.default_rng(semilla)
+    probabilidades = rng.random(filas)
+    fechas = pd.date_range("2024-01-01", periods=filas, freq="min").strftime("%Y-%m-%d %H:%M:%S")
+    # Alrededor del 10% de las predicciones tienen valoración del médico
+    valoradas = rng.random(filas) < 0.1
+    correcta = np.where(valoradas, rng.random(filas) < 0.8, None)
+    nombres = [f"Paciente {i}" for i in rng.integers(0, max(1, filas // 4), filas)]
+    return pd.DataFrame({
+        "id": np.arange(1, filas + 1),
+        "nombre": nombres,
+        "paciente_clave": [nombre.lower() for nombre in nombres],
+        "probabilidad": probabilidades,
+        "resultado": np.where(probabilidades > 0.5, "Parkinson detectado", "Saludable"),
+        "fecha_hora": fechas,
+        "correcta": correcta,
+        "comentario": None
+    })
+
+def estadisticas_por_filas(historial):
+    """Implementación anterior: varias pasadas de Python sobre una lista de dicts"""
+    total_analisis = len(historial)
+    total_parkinson = sum(1 for p in historial if p['probabilidad'] > 0.5)
+    prob_promedio = sum(p['probabilidad'] for p in historial) / total_analisis
+    prob_maxima = max(p['probabilidad'] for p in historial)
+    prob_minima = min(p['probabilidad'] for p in historial)
+    rangos = {"0-25%": 0, "25-50%": 0, "50-75%": 0, "75-100%": 0}
+    for p in historial:
+        prob = p['probabilidad'] * 100
+        if prob < 25:
+            rangos["0-25%"] += 1
+        elif prob < 50:
+            rangos["25-50%"] += 1
+        elif prob < 75:
+            rangos["50-75%"] += 1
+        else:
+            rangos["75-100%"] += 1
+    pacientes_unicos = len(set(p['nombre'] for p in historial))
+    return {
+        "total_analisis": total_analisis,
+        "total_parkinson": total_parkinson,
+        "total_saludable": total_analisis - total_parkinson,
+        "prob_promedio": prob_promedio,
+        "prob_maxima": prob_maxima,
+        "prob_minima": prob_minima,
+        "rangos": rangos,
+        "pacientes_unicos": pacientes_unicos
+    }
+
+def medir(funcion, argumento, repeticiones=5):
+    """Devuelve el mejor tiempo (s) de varias ejecuciones y el último resultado"""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(argumento)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+if __name__ == "__main__":
+    tamanos = [int(n) for n in sys.argv[1:]] or [1_000, 10_000, 100_000, 500_000]
+    print(f"{'filas':>10} {'por filas (ms)':>16} {'vectorizado (ms)':>18} {'aceleración':>12}")
+    for filas in tamanos:
+        df = historial_sintetico(filas)
+        registros = df.to_dict("records")
+        t_filas, esperado = medir(estadisticas_por_filas, registros)
+        t_vector, obtenido = medir(obtener_estadisticas_avanzadas, df)
+        assert obtenido["rangos"] == esperado["rangos"]
+        assert obtenido["total_parkinson"] == esperado["total_parkinson"]
+        assert obtenido["pacientes_unicos"] == esperado["pacientes_unicos"]
+        print(f"{filas:>10} {t_filas*1000:>16.2f} {t_vector*1000:>18.2f} {t_filas/t_vector:>11.1f}x")
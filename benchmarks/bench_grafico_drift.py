@@ -0,0 +1,55 @@
+"""Tiempo de dibujo del gráfico de drift: todos los puntos con pyplot frente a intervalos agregados
+
+También cuenta las figuras que quedan abiertas en pyplot, que antes crecían en cada recarga.
+
+Uso: python benchmarks/bench_grafico_drift.py 1000 10000 100000
+"""
+import io
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_estadisticas import historial_sintetico
+from grafico_drift import datos_drift, dibujar_drift
+
+def dibujar_todos_los_puntos(historial_df):
+    """Versión anterior: scatter de todas las filas y figura de pyplot sin cerrar"""
+    df = historial_df.copy()
+    df["fecha_hora"] = pd.to_datetime(df["fecha_hora"])
+    df = df.sort_values("fecha_hora")
+    df["promedio_movil"] = df["probabilidad"].rolling(window=3, min_periods=1).mean()
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.scatter(df["fecha_hora"], df["probabilidad"], color="gray", alpha=0.6, s=50, label="Predicciones individuales")
+    ax.plot(df["fecha_hora"], df["promedio_movil"], marker='o', linestyle='-', color='royalblue', linewidth=2, markersize=6, label="Promedio móvil (ventana=3)")
+    ax.axhline(0.5, color='red', linestyle='--', linewidth=2, label='Umbral 50%')
+    ax.set_title("Evolución de las predicciones en el tiempo", fontsize=14, fontweight='bold')
+    ax.legend(loc='best', fontsize=9)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    plt.xticks(rotation=45, ha='right')
+    plt.tight_layout()
+    fig.savefig(io.BytesIO(), format="png", dpi=100)  # st.pyplot también rasteriza la figura
+
+def medir(funcion, repeticiones=3):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000
+
+if __name__ == "__main__":
+    tamanos = [int(t) for t in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    print(f"{'filas':>8} {'todos los puntos':>18} {'intervalos':>12} {'figuras abiertas':>18}")
+    for filas in tamanos:
+        historial_df = historial_sintetico(filas)
+        anterior = medir(lambda: dibujar_todos_los_puntos(historial_df))
+        abiertas = len(plt.get_fignums())
+        plt.close("all")
+        nuevo = medir(lambda: dibujar_drift(datos_drift(historial_df)))
+        print(f"{filas:>8} {anterior:>15.0f} ms {nuevo:>9.0f} ms {abiertas:>10} → {len(plt.get_fignums())}")
@@ -0,0 +1,78 @@
+"""Índice de embeddings: latencia de la búsqueda top-k con 100k vectores y espacio en disco
+
+Compara el índice float16 mapeado en memoria con la búsqueda directa sobre una matriz float32,
+y mide cuántos de los k vecinos de float32 recupera float16 (la pérdida de precisión).
+Los embeddings sintéticos se agrupan alrededor de unos centros, como trazos parecidos entre sí.
+
+Uso: python benchmarks/bench_indice_embeddings.py [--filas 100000] [--dimension 128] [-k 5] [--consultas 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indice_embeddings import IndiceEmbeddings, normalizar_filas
+
+def embeddings_sinteticos(filas, dimension, centros=50, semilla=0):
+    rng = np.random.default_rng(semilla)
+    base = rng.normal(size=(centros, dimension)).astype(np.float32)
+    ruido = rng.normal(scale=0.5, size=(filas, dimension)).astype(np.float32)
+    # Las activaciones tras una ReLU no son negativas
+    return np.maximum(base[rng.integers(0, centros, filas)] + ruido, 0)
+
+def buscar_float32(matriz, consulta, k):
+    """Búsqueda directa: producto con toda la matriz normalizada en float32 y orden completo"""
+    similitudes = matriz @ normalizar_filas(consulta)
+    return np.argsort(similitudes)[::-1][:k] + 1
+
+def percentiles(tiempos):
+    return np.percentile(np.array(tiempos) * 1000, [50, 95])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--consultas", type=int, default=200)
+    args = parser.parse_args()
+    
+    embeddings = embeddings_sinteticos(args.filas, args.dimension)
+    consultas = embeddings_sinteticos(args.consultas, args.dimension, semilla=1)
+    ids = np.arange(1, args.filas + 1)
+    
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, "indice")
+        indice = IndiceEmbeddings(ruta)
+        inicio = time.perf_counter()
+        # Por bloques, como llegan de las inserciones masivas
+        for desde in range(0, args.filas, 1000):
+            indice.agregar(ids[desde:desde + 1000], embeddings[desde:desde + 1000])
+        tiempo_carga = time.perf_counter() - inicio
+        tamano_disco = sum(os.path.getsize(f"{ruta}.{extension}") for extension in ("vectores", "ids", "json"))
+        
+        inicio = time.perf_counter()
+        indice = IndiceEmbeddings(ruta)  # Reabrir: solo se mapea el archivo
+        tiempo_apertura = time.perf_counter() - inicio
+        
+        matriz = normalizar_filas(embeddings)
+        tiempos_indice, tiempos_float32, aciertos = [], [], 0
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            encontrados = [i for i, _ in indice.buscar(consulta, args.k)]
+            tiempos_indice.append(time.perf_counter() - inicio)
+            inicio = time.perf_counter()
+            exactos = buscar_float32(matriz, consulta, args.k)
+            tiempos_float32.append(time.perf_counter() - inicio)
+            aciertos += len(set(encontrados) & set(exactos.tolist()))
+    
+    print(f"{args.filas} embeddings de dimensión {args.dimension}, top-{args.k}, {args.consultas} consultas")
+    print(f"Inserción: {args.filas / tiempo_carga:,.0f} embeddings/s · apertura del índice: {tiempo_apertura * 1000:.1f} ms")
+    print(f"Disco: {tamano_disco / 2**20:.1f} MiB (float32 en memoria: {matriz.nbytes / 2**20:.1f} MiB)")
+    for nombre, tiempos in (("índice float16 (bloques + argpartition)", tiempos_indice), ("float32 + argsort", tiempos_float32)):
+        p50, p95 = percentiles(tiempos)
+        print(f"{nombre:<42} p50 {p50:7.2f} ms  p95 {p95:7.2f} ms")
+    print(f"Vecinos de float32 recuperados con float16: {aciertos / (args.k * args.consultas):.1%}")
@@ -0,0 +1,52 @@
+"""Escalado de la decodificación en paralelo de la ingesta masiva con 1..N procesos
+
+Mide decodificación, redimensionado y armado de lotes (sin modelo) sobre una carpeta real
+o sobre fotos sintéticas.
+
+Uso: python benchmarks/bench_ingesta.py [--carpeta archivo/] [--imagenes 256] [--max-trabajadores 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_preprocesamiento import foto_sintetica
+from ingesta_masiva import decodificar_en_paralelo, listar_archivos, lotes_preprocesados
+
+def crear_archivo_sintetico(carpeta, imagenes):
+    for i in range(imagenes):
+        formato, extension = ("JPEG", "jpg") if i % 2 else ("PNG", "png")
+        with open(os.path.join(carpeta, f"paciente_{i:05d}.{extension}"), "wb") as f:
+            f.write(foto_sintetica(formato, semilla=i))
+
+def medir(rutas, trabajadores, tamano_lote=32):
+    inicio = time.perf_counter()
+    total = sum(len(rutas_lote) for rutas_lote, _ in lotes_preprocesados(
+        decodificar_en_paralelo(rutas, trabajadores), tamano_lote
+    ))
+    return total / (time.perf_counter() - inicio)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carpeta")
+    parser.add_argument("--imagenes", type=int, default=256)
+    parser.add_argument("--max-trabajadores", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as temporal:
+        carpeta = args.carpeta
+        if carpeta is None:
+            crear_archivo_sintetico(temporal, args.imagenes)
+            carpeta = temporal
+        rutas = listar_archivos(carpeta)
+        
+        trabajadores = sorted({1, *[2 ** i for i in range(1, 8) if 2 ** i < args.max_trabajadores], args.max_trabajadores})
+        base = None
+        print(f"{len(rutas)} imágenes")
+        print(f"{'procesos':>9} {'img/s':>8} {'escalado':>9}")
+        for n in trabajadores:
+            rendimiento = medir(rutas, n)
+            base = base or rendimiento
+            print(f"{n:>9} {rendimiento:>8.1f} {rendimiento / base:>8.2f}x")
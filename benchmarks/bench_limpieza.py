@@ -0,0 +1,91 @@
+"""Limpieza del historial: borrado fila por fila (N+1 peticiones) frente a borrado por rangos de id
+
+Ambos caminos borran las mismas filas recién insertadas. En SQLite, además del tiempo medido se
+muestra el estimado con una latencia de red por petición (--rtt-ms), que es lo que domina en Supabase.
+Supabase solo se mide si SUPABASE_URL / SUPABASE_KEY están configuradas; el benchmark solo borra
+las filas que inserta, pero conviene apuntar a un proyecto de pruebas.
+
+Uso: python benchmarks/bench_limpieza.py [--filas 2000] [--tamano-bloque 10000] [--rtt-ms 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacenamiento import SIN_FILAS, TABLA_PREDICCIONES, borrar_rango_ids, insertar_predicciones
+from bench_estadisticas import historial_sintetico
+
+def insertar(cliente, filas):
+    registros = list(historial_sintetico(filas)[["nombre", "probabilidad", "fecha_hora"]].itertuples(index=False))
+    ids = [f["id"] for f in insertar_predicciones(cliente, registros)]
+    return min(ids), max(ids)
+
+def limpiar_fila_por_fila(cliente, id_minimo, id_maximo):
+    """Camino anterior: leer todos los ids y borrar cada uno con su propia petición
+    
+    Los ids se leen por páginas: PostgREST limita cada respuesta (1000 filas por defecto).
+    """
+    ids = []
+    peticiones = 0
+    while True:
+        pagina = (
+            cliente.table(TABLA_PREDICCIONES).select("id").gt("id", ids[-1] if ids else id_minimo - 1)
+            .lte("id", id_maximo).order("id").limit(1000).execute().data
+        )
+        peticiones += 1
+        ids.extend(fila["id"] for fila in pagina)
+        if len(pagina) < 1000:
+            break
+    for prediccion_id in ids:
+        cliente.table(TABLA_PREDICCIONES).delete(returning=SIN_FILAS).eq("id", prediccion_id).execute()
+    return peticiones + len(ids)
+
+def limpiar_por_rangos(cliente, id_minimo, id_maximo, tamano_bloque):
+    """Camino actual de limpiar_historial: total e ids extremos (2 peticiones) y, por bloque, una lectura y un borrado"""
+    cliente.table(TABLA_PREDICCIONES).select("id", count="exact").gte("id", id_minimo).order("id").limit(1).execute()
+    cliente.table(TABLA_PREDICCIONES).select("id").lte("id", id_maximo).order("id", desc=True).limit(1).execute()
+    return 2 + borrar_rango_ids(cliente, id_minimo, id_maximo, tamano_bloque)
+
+def medir(cliente, filas, funcion):
+    id_minimo, id_maximo = insertar(cliente, filas)
+    inicio = time.perf_counter()
+    peticiones = funcion(cliente, id_minimo, id_maximo)
+    segundos = time.perf_counter() - inicio
+    restantes = (
+        cliente.table(TABLA_PREDICCIONES).select("id", count="exact").gte("id", id_minimo).lte("id", id_maximo)
+        .limit(1).execute().count
+    )
+    if restantes:
+        raise RuntimeError(f"Quedaron {restantes} filas sin borrar")
+    return segundos, peticiones
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=2_000)
+    parser.add_argument("--tamano-bloque", type=int, default=10_000)
+    parser.add_argument("--rtt-ms", type=float, default=50.0, help="Latencia de red por petición para la estimación")
+    args = parser.parse_args()
+    
+    caminos = {
+        "fila por fila (N+1)": limpiar_fila_por_fila,
+        "por rangos de id": lambda cliente, minimo, maximo: limpiar_por_rangos(cliente, minimo, maximo, args.tamano_bloque)
+    }
+    with tempfile.TemporaryDirectory() as temporal:
+        from supabase_sqlite import ClienteSQLite
+        backends = {"sqlite": ClienteSQLite(os.path.join(temporal, "bench.db"))}
+        if os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_KEY"):
+            from almacenamiento import crear_cliente_supabase
+            backends["supabase"] = crear_cliente_supabase()
+        else:
+            print("Supabase sin credenciales: solo se mide SQLite\n")
+        
+        print(f"{args.filas} filas · estimación con {args.rtt_ms:.0f} ms por petición")
+        print(f"{'backend':<10} {'camino':<22} {'peticiones':>10} {'medido':>12} {'estimado':>12}")
+        for nombre, cliente in backends.items():
+            for camino, funcion in caminos.items():
+                segundos, peticiones = medir(cliente, args.filas, funcion)
+                # En Supabase la red ya está en el tiempo medido
+                estimado = f"{segundos + peticiones * args.rtt_ms / 1000:>10.2f} s" if nombre == "sqlite" else f"{'-':>12}"
+                print(f"{nombre:<10} {camino:<22} {peticiones:>10} {segundos * 1000:>9.1f} ms {estimado}")
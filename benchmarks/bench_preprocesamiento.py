@@ -0,0 +1,74 @@
+"""Latencia y memoria reservada por imagen del preprocesamiento anterior frente al actual
+
+Uso: python benchmarks/bench_preprocesamiento.py [--repeticiones 20] [--lote 16]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inferencia import TAMANO_ENTRADA, abrir_imagen, preprocesar_lote
+
+def foto_sintetica(formato, tamano=(2000, 1500), semilla=0):
+    """Genera una foto de un trazo oscuro sobre papel claro, con ruido, como la de un móvil"""
+    rng = np.random.default_rng(semilla)
+    ancho, alto = tamano
+    t = np.linspace(0, 12 * np.pi, 20000)
+    pixeles = np.full((alto, ancho, 3), 235, dtype=np.uint8)
+    x = (ancho / 2 + t * np.cos(t) * ancho / 90).astype(int).clip(0, ancho - 1)
+    y = (alto / 2 + t * np.sin(t) * alto / 90).astype(int).clip(0, alto - 1)
+    pixeles[y, x] = 20
+    pixeles = np.clip(pixeles + rng.normal(0, 6, pixeles.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixeles).save(buffer, format=formato, quality=90)
+    return buffer.getvalue()
+
+def preprocesamiento_anterior(datos_imagenes):
+    """Pipeline original: decodificación completa, conversión, copia float32, /255 y expand_dims por imagen"""
+    arreglos = []
+    for datos in datos_imagenes:
+        img = Image.open(io.BytesIO(datos)).convert("RGB").resize(TAMANO_ENTRADA)
+        img_array = np.asarray(img, dtype=np.float32)
+        img_array = img_array / 255.0
+        arreglos.append(np.expand_dims(img_array, axis=0))
+    return np.concatenate(arreglos)
+
+def preprocesamiento_actual(datos_imagenes):
+    """Decodificación reducida y escritura directa en el búfer del lote"""
+    return preprocesar_lote([abrir_imagen(io.BytesIO(datos)) for datos in datos_imagenes])
+
+def medir(funcion, datos_imagenes, repeticiones):
+    latencias = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(datos_imagenes)
+        latencias.append((time.perf_counter() - inicio) / len(datos_imagenes))
+    # tracemalloc cuenta los arreglos de NumPy, no los búferes internos de decodificación de Pillow
+    tracemalloc.start()
+    funcion(datos_imagenes)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return np.median(latencias) * 1000, pico / len(datos_imagenes) / 1024 / 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--lote", type=int, default=16)
+    args = parser.parse_args()
+    
+    print(f"{'formato':>8} {'pipeline':>10} {'ms/imagen':>10} {'MB pico/imagen':>15}")
+    for formato in ["JPEG", "PNG"]:
+        datos = [foto_sintetica(formato, semilla=i) for i in range(args.lote)]
+        anterior = preprocesamiento_anterior(datos)
+        actual = preprocesamiento_actual(datos)
+        diferencia = float(np.abs(anterior - actual).mean())
+        for nombre, funcion in [("anterior", preprocesamiento_anterior), ("actual", preprocesamiento_actual)]:
+            ms, mb = medir(funcion, datos, args.repeticiones)
+            print(f"{formato:>8} {nombre:>10} {ms:>10.2f} {mb:>15.2f}")
+        print(f"{formato:>8} diferencia media absoluta de píxel entre ambos: {diferencia:.4f}")
@@ -0,0 +1,54 @@
+"""Prueba de carga local de la API de inferencia
+
+Arranca antes la API sin Supabase:  python api.py --stub
+Uso: python benchmarks/carga_api.py [--url http://localhost:8000] [--peticiones 200] [--concurrencia 8]
+"""
+import argparse
+import io
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+def imagen_sintetica(semilla, tamano=(400, 400)):
+    """Genera un PNG de trazo aleatorio con el tamaño típico de una foto recortada"""
+    rng = np.random.default_rng(semilla)
+    pixeles = rng.integers(0, 256, (*tamano, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixeles).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def enviar(url, imagen, nombre):
+    peticion = urllib.request.Request(
+        f"{url}/predict?nombre={nombre}", data=imagen, headers={"Content-Type": "image/png"}, method="POST"
+    )
+    inicio = time.perf_counter()
+    with urllib.request.urlopen(peticion) as respuesta:
+        respuesta.read()
+    return time.perf_counter() - inicio
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--imagenes-distintas", type=int, default=50, help="Imágenes únicas (el resto repite y usa la caché)")
+    args = parser.parse_args()
+    
+    imagenes = [imagen_sintetica(i) for i in range(args.imagenes_distintas)]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrencia) as ejecutor:
+        latencias = list(ejecutor.map(
+            lambda i: enviar(args.url, imagenes[i % len(imagenes)], f"carga_{i}"), range(args.peticiones)
+        ))
+    total = time.perf_counter() - inicio
+    
+    p50, p95, p99 = np.percentile(latencias, [50, 95, 99]) * 1000
+    print(f"Peticiones: {args.peticiones}  Concurrencia: {args.concurrencia}")
+    print(f"Rendimiento: {args.peticiones / total:.1f} pet/s")
+    print(f"Latencia cliente (ms): p50={p50:.1f} p95={p95:.1f} p99={p99:.1f}")
+    with urllib.request.urlopen(f"{args.url}/metrics") as respuesta:
+        print("Métricas del servidor:", json.dumps(json.load(respuesta), indent=2))
@@ -0,0 +1,389 @@
+"""Prueba de carga de la app de Streamlit con varias sesiones simultáneas en un solo proceso
+
+Reproduce el despliegue del Procfile, que es un único `streamlit run app.py`. Cada sesión simulada
+es un AppTest que ejecuta app.py dentro de este proceso, así que todas comparten el modelo, la cola
+de micro-lotes, la caché de predicciones y el escritor diferido, igual que en producción. Supabase
+se sustituye por el cliente en memoria con una latencia fija por petición. El modelo se sustituye
+por uno sintético con la misma entrada, o se usa el real con --modelo real.
+
+Las sesiones de médico abren Análisis, escriben el nombre, suben una imagen, pulsan Predecir y
+envían feedback. Las de administrador inician sesión y buscan pacientes en el panel. Para cada
+número de sesiones se mide:
+- el rendimiento;
+- los percentiles de latencia por acción;
+- la memoria del proceso;
+- las etapas de metricas.METRICAS que más tardan (modelo, escrituras, historial...).
+
+AppTest no permite subir archivos. Por eso st.file_uploader se sustituye por una función que
+devuelve las imágenes que la prueba deja en el session_state de cada sesión.
+
+Uso:
+    python benchmarks/carga_streamlit.py --sesiones 1 4 8 16 --acciones 5
+    python benchmarks/carga_streamlit.py --sesiones 8 --latencia-bd-ms 40 --modelo real --salida carga.json
+"""
+import argparse
+import functools
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_APP = os.path.join(RAIZ, "app.py")
+sys.path.insert(0, RAIZ)
+os.environ["ALMACENAMIENTO"] = "memoria"  # Antes de importar almacenamiento: nunca se toca Supabase
+
+import almacenamiento
+import inferencia
+import streamlit as st
+from bench_preprocesamiento import foto_sintetica
+from metricas import METRICAS
+from suite import ModeloSintetico, metadatos
+from supabase_memoria import ClienteMemoria
+from streamlit.testing.v1 import AppTest
+
+CLAVE_ARCHIVOS = "_carga_archivos"
+
+class ConsultaConLatencia:
+    """Consulta que espera antes de execute(), como un viaje de ida y vuelta a Supabase"""
+    
+    def __init__(self, consulta, latencia):
+        self.consulta = consulta
+        self.latencia = latencia
+    
+    def __getattr__(self, nombre):
+        valor = getattr(self.consulta, nombre)
+        if valor is self.consulta:  # Propiedades encadenables como not_
+            return self
+        if not callable(valor):
+            return valor
+        def encadenar(*args, **kwargs):
+            resultado = valor(*args, **kwargs)
+            return self if resultado is self.consulta else resultado
+        return encadenar
+    
+    def execute(self):
+        time.sleep(self.latencia)
+        return self.consulta.execute()
+
+class ClienteConLatencia:
+    """Cliente en memoria con latencia de red simulada en cada petición"""
+    
+    def __init__(self, cliente, latencia):
+        self.cliente = cliente
+        self.latencia = latencia
+    
+    def table(self, nombre):
+        return ConsultaConLatencia(self.cliente.table(nombre), self.latencia)
+    
+    def rpc(self, nombre, parametros=None):
+        return ConsultaConLatencia(self.cliente.rpc(nombre, parametros), self.latencia)
+
+class ModeloSinteticoLento(ModeloSintetico):
+    """Modelo sintético que además espera un tiempo fijo por lote, para aproximar el coste del real"""
+    
+    def __init__(self, latencia):
+        super().__init__()
+        self.latencia = latencia
+    
+    def predict_con_embedding(self, lote, batch_size=None, verbose=0):
+        time.sleep(self.latencia)
+        return super().predict_con_embedding(lote, batch_size, verbose)
+
+class ArchivoSubido(io.BytesIO):
+    """Imita el UploadedFile de Streamlit: bytes más nombre y tipo"""
+    
+    def __init__(self, nombre, datos):
+        super().__init__(datos)
+        self.name = nombre
+        self.type = "image/png" if nombre.endswith(".png") else "image/jpeg"
+        self.size = len(datos)
+
+def file_uploader_simulado(label, type=None, accept_multiple_files=False, **kwargs):
+    """Sustituto de st.file_uploader que lee las imágenes del session_state de la sesión"""
+    archivos = [ArchivoSubido(nombre, datos) for nombre, datos in st.session_state.get(CLAVE_ARCHIVOS, [])]
+    if accept_multiple_files:
+        return archivos
+    return archivos[0] if archivos else None
+
+def compartir_runtime():
+    """Un único runtime simulado para todas las sesiones
+    
+    Cada AppTest crea un runtime simulado al empezar a ejecutarse y lo borra al terminar. Con
+    varias sesiones en hilos, la primera que termina lo borra mientras las demás aún dibujan
+    (st.image lo necesita). Por eso se crea uno para todo el proceso y cada AppTest recibe una
+    clase de la que solo puede cambiar su propia copia.
+    
+    La caché del código compilado también es una sola, como en el runtime real: cada ejecución de
+    AppTest compilaba app.py de nuevo, y en Python 3.11 varias compilaciones simultáneas en hilos
+    fallan a veces ("AST constructor recursion depth mismatch").
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type("RuntimePorSesion", (), {"_instance": None})
+    cache_codigo = ScriptCache()
+    local_script_runner.ScriptCache = lambda: cache_codigo
+
+def esperar_fin_de_ejecucion():
+    """AppTest (1.28) da la ejecución por terminada al primer evento de parada
+    
+    Tras un st.rerun ese evento es SCRIPT_STOPPED_FOR_RERUN: la segunda pasada sigue en marcha y
+    AppTest busca el estado del cliente en un evento que no es el SHUTDOWN (KeyError 'client_state').
+    Además el árbol mezcla los mensajes de las dos pasadas. Se espera al SHUTDOWN, que llega cuando
+    no quedan pasadas, y al empezar cada pasada se descartan los mensajes de la anterior, como
+    hace el navegador.
+    """
+    from streamlit.runtime.scriptrunner import ScriptRunnerEvent
+    from streamlit.testing.v1 import local_script_runner
+    
+    clase = local_script_runner.LocalScriptRunner
+    iniciar = clase.__init__
+    
+    def iniciar_con_limpieza(self, *args, **kwargs):
+        iniciar(self, *args, **kwargs)
+        
+        def al_empezar(sender, event, **datos):
+            if event == ScriptRunnerEvent.SCRIPT_STARTED:
+                self.forward_msg_queue.clear()
+        self.on_event.connect(al_empezar, weak=False)
+    
+    def esperar(runner, timeout=3):
+        limite = time.time() + timeout
+        while time.time() < limite:
+            time.sleep(0.02)
+            if ScriptRunnerEvent.SHUTDOWN in runner.events:
+                return
+        runner.request_stop()
+        runner.join()
+        raise RuntimeError(f"AppTest script run timed out after {timeout}s)")
+    
+    clase.__init__ = iniciar_con_limpieza
+    local_script_runner.require_widgets_deltas = esperar
+
+def preparar_proceso(args, directorio):
+    """Sustituye Supabase, el modelo y la subida de archivos antes de la primera sesión"""
+    os.environ["RUTA_SPOOL"] = os.path.join(directorio, "predicciones_pendientes.jsonl")
+    os.environ["RUTA_MONITOR_DRIFT"] = os.path.join(directorio, "monitor_drift.json")
+    # app.py importa estos nombres en cada ejecución, así que basta con cambiarlos en su módulo
+    latencia_bd = args.latencia_bd_ms / 1000
+    almacenamiento.crear_cliente = lambda backend=None: ClienteConLatencia(ClienteMemoria(), latencia_bd)
+    if args.modelo == "sintetico":
+        inferencia.ModeloEnSegundoPlano = functools.partial(
+            inferencia.ModeloEnSegundoPlano, cargar=lambda: ModeloSinteticoLento(args.latencia_modelo_ms / 1000)
+        )
+    st.file_uploader = file_uploader_simulado
+    compartir_runtime()
+    esperar_fin_de_ejecucion()
+
+def memoria_proceso():
+    """Memoria residente del proceso en MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Sin /proc (macOS) solo se conoce el máximo histórico, en bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**20
+
+class MuestreoMemoria:
+    """Registra el pico de memoria residente mientras dura el bloque `with`"""
+    
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+        self.pico = 0.0
+        self._parar = threading.Event()
+    
+    def _muestrear(self):
+        while not self._parar.is_set():
+            self.pico = max(self.pico, memoria_proceso())
+            self._parar.wait(self.intervalo)
+    
+    def __enter__(self):
+        self.pico = memoria_proceso()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+
+class Registro:
+    """Latencias de las acciones de todas las sesiones de un escenario"""
+    
+    def __init__(self):
+        self.latencias = {}
+        self.errores = {}
+        self._lock = threading.Lock()
+    
+    def medir(self, accion, funcion):
+        inicio = time.perf_counter()
+        try:
+            at = funcion()
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+            return at
+        except Exception as e:
+            with self._lock:
+                self.errores.setdefault(accion, []).append(str(e))
+            raise
+        finally:
+            with self._lock:
+                self.latencias.setdefault(accion, []).append(time.perf_counter() - inicio)
+
+def widget(widgets, etiqueta):
+    for w in widgets:
+        if w.label == etiqueta:
+            return w
+    raise LookupError(f"No aparece el widget '{etiqueta}'")
+
+def sesion_medico(indice, acciones, imagenes, registro, timeout):
+    """Un médico que analiza `acciones` imágenes seguidas y valora cada resultado"""
+    at = AppTest.from_file(RUTA_APP, default_timeout=timeout)
+    registro.medir("abrir_app", at.run)
+    for accion in range(acciones):
+        at.session_state[CLAVE_ARCHIVOS] = [imagenes[(indice * acciones + accion) % len(imagenes)]]
+        widget(at.text_input, "👤 Nombre del paciente:").input(f"Paciente carga {indice}")
+        registro.medir("subir_imagen", at.run)
+        registro.medir("predecir", widget(at.button, "🔍 Predecir").click().run)
+        widget(at.radio, "¿Fue correcta la predicción?").set_value("👍 Sí" if accion % 2 else "👎 No")
+        registro.medir("enviar_feedback", widget(at.button, "📩 Enviar Feedback").click().run)
+
+def sesion_admin(indice, acciones, contrasena, registro, timeout):
+    """Un administrador que entra al panel y busca pacientes (cada búsqueda redibuja el panel)"""
+    at = AppTest.from_file(RUTA_APP, default_timeout=timeout)
+    registro.medir("abrir_app", at.run)
+    widget(at.sidebar.radio, "Ir a:").set_value("📊 Historial / Panel Admin")
+    registro.medir("abrir_login", at.run)
+    widget(at.text_input, "Contraseña:").input(contrasena)
+    registro.medir("abrir_panel", widget(at.button, "🔓 Acceder").click().run)
+    for accion in range(acciones):
+        for seleccion in at.selectbox:
+            if seleccion.label.startswith("Pacientes encontrados"):
+                # AppTest busca str(valor) entre las opciones ya formateadas: con diccionarios y
+                # format_func no lo encuentra, así que se elige por posición, como haría el médico
+                seleccion.select_index(0)
+        widget(at.text_input, "🔍 Buscar paciente:").input(f"paciente carga {(indice + accion) % 10}")
+        registro.medir("panel_busqueda", at.run)
+
+def escenario(sesiones, args, imagenes):
+    """Lanza `sesiones` sesiones a la vez y resume latencias, rendimiento y memoria"""
+    admins = int(round(sesiones * args.proporcion_admin))
+    registro = Registro()
+    fallidas = []
+    METRICAS.reiniciar()
+    memoria_inicial = memoria_proceso()
+    
+    inicio = time.perf_counter()
+    with MuestreoMemoria() as muestreo, ThreadPoolExecutor(sesiones) as ejecutor:
+        futuros = [
+            ejecutor.submit(sesion_admin, i, args.acciones, args.contrasena, registro, args.timeout) if i < admins
+            else ejecutor.submit(sesion_medico, i, args.acciones, imagenes, registro, args.timeout)
+            for i in range(sesiones)
+        ]
+        for futuro in futuros:
+            try:
+                futuro.result()
+            except Exception as e:
+                fallidas.append(str(e))
+    duracion = time.perf_counter() - inicio
+    
+    acciones = {}
+    for accion, tiempos in registro.latencias.items():
+        p50, p95, p99 = np.percentile(tiempos, [50, 95, 99]) * 1000
+        acciones[accion] = {
+            "n": len(tiempos), "errores": len(registro.errores.get(accion, [])),
+            "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)
+        }
+    predicciones = acciones.get("predecir", {}).get("n", 0)
+    etapas = sorted(METRICAS.resumen().items(), key=lambda par: par[1]["p95_ms"], reverse=True)
+    return {
+        "sesiones": sesiones,
+        "medicos": sesiones - admins,
+        "admins": admins,
+        "duracion_s": duracion,
+        "acciones_por_s": sum(a["n"] for a in acciones.values()) / duracion,
+        "predicciones_por_s": predicciones / duracion,
+        "sesiones_fallidas": len(fallidas),
+        "primer_error": fallidas[0] if fallidas else None,
+        "memoria_inicial_mb": memoria_inicial,
+        "memoria_pico_mb": muestreo.pico,
+        "memoria_por_sesion_mb": max(0.0, muestreo.pico - memoria_inicial) / sesiones,
+        "acciones": acciones,
+        "etapas": dict(etapas[:args.etapas])
+    }
+
+def imprimir(resultado):
+    print(
+        f"\n=== {resultado['sesiones']} sesiones ({resultado['medicos']} médicos, {resultado['admins']} admins) "
+        f"en {resultado['duracion_s']:.1f} s ==="
+    )
+    print(
+        f"Rendimiento: {resultado['acciones_por_s']:.1f} acciones/s, {resultado['predicciones_por_s']:.2f} predicciones/s  "
+        f"Memoria: pico {resultado['memoria_pico_mb']:.0f} MB, {resultado['memoria_por_sesion_mb']:.1f} MB/sesión"
+    )
+    if resultado["sesiones_fallidas"]:
+        print(f"⚠️ {resultado['sesiones_fallidas']} sesiones fallidas; primer error: {resultado['primer_error']}")
+    print(f"{'acción':<18} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for accion, a in resultado["acciones"].items():
+        print(f"{accion:<18} {a['n']:>5} {a['errores']:>4} {a['p50_ms']:>9.1f} {a['p95_ms']:>9.1f} {a['p99_ms']:>9.1f}")
+    print("Etapas internas más lentas (p95 ms): " + ", ".join(
+        f"{etapa} {e['p95_ms']:.1f}" for etapa, e in resultado["etapas"].items()
+    ))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sesiones", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Sesiones simultáneas por escenario")
+    parser.add_argument("--acciones", type=int, default=5, help="Análisis (o búsquedas en el panel) por sesión")
+    parser.add_argument("--proporcion-admin", type=float, default=0.25, help="Fracción de sesiones de administrador")
+    parser.add_argument("--latencia-bd-ms", type=float, default=20.0, help="Espera simulada por petición a Supabase")
+    parser.add_argument("--modelo", choices=["sintetico", "real"], default="sintetico")
+    parser.add_argument("--latencia-modelo-ms", type=float, default=50.0, help="Espera por lote del modelo sintético")
+    parser.add_argument("--imagenes-distintas", type=int, default=200, help="Imágenes únicas (las repetidas usan la caché)")
+    parser.add_argument("--contrasena", default="12345678", help="Contraseña del panel de administrador")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Segundos máximos por ejecución del script")
+    parser.add_argument("--etapas", type=int, default=6, help="Etapas internas a mostrar por escenario")
+    parser.add_argument("--salida", default="resultados_carga.json")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        preparar_proceso(args, directorio)
+        imagenes = [
+            (f"trazo_{i}.png", foto_sintetica("PNG", tamano=(600, 450), semilla=i))
+            for i in range(args.imagenes_distintas)
+        ]
+        
+        # Una sesión sin medir carga el modelo y crea los recursos compartidos
+        inicio = time.perf_counter()
+        sesion_medico(0, 1, imagenes, Registro(), args.timeout)
+        print(f"Calentamiento (carga del modelo y recursos compartidos): {time.perf_counter() - inicio:.1f} s")
+        
+        resultados = []
+        for sesiones in args.sesiones:
+            resultado = escenario(sesiones, args, imagenes)
+            imprimir(resultado)
+            resultados.append(resultado)
+    
+    configuracion = {k: v for k, v in vars(args).items() if k != "contrasena"}
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(
+            {"metadatos": metadatos(), "configuracion": configuracion, "resultados": resultados},
+            f, ensure_ascii=False, indent=2
+        )
+    print(f"\nResultados guardados en {args.salida}")
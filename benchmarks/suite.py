@@ -0,0 +1,234 @@
+"""Suite de benchmarks reproducible de inferencia y del panel, sin red ni TensorFlow
+
+Usa un modelo sintético con la misma entrada 224x224x3 que el real y una tabla `predicciones`
+en memoria (SQLite) con historiales de 1k/10k/100k filas. Cubre preprocesamiento, inferencia individual
+y por lotes, estadísticas, lectura y dibujo del historial, búsqueda de pacientes y de casos similares y
+exportación, y guarda los resultados en JSON para comparar ejecuciones.
+
+Uso:
+    python benchmarks/suite.py --salida antes.json
+    python benchmarks/suite.py --salida despues.json --comparar antes.json
+    python benchmarks/suite.py --filas 1000 10000 --casos estadisticas exportacion
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from agregados import AgregadosPredicciones
+from almacenamiento import contar_feedback, obtener_pagina_feedback
+from bench_almacenamiento import descargar
+from bench_estadisticas import historial_sintetico
+from bench_preprocesamiento import foto_sintetica
+from estadisticas import obtener_estadisticas_avanzadas
+from exportacion import FORMATOS_EXPORTACION, bloques_txt_historial, exportar, tabla_historial
+from grafico_drift import datos_drift, dibujar_drift
+from indice_embeddings import IndiceEmbeddings
+from inferencia import TAMANO_ENTRADA, abrir_imagen, predecir_imagen, predecir_lote, preprocesar_lote
+from pacientes import buscar_pacientes, evolucion_paciente
+from supabase_sqlite import ClienteSQLite
+
+class ModeloSintetico:
+    """Sustituto del modelo Keras: misma forma de entrada y salida, coste proporcional al lote"""
+    
+    def __init__(self, semilla=0):
+        rng = np.random.default_rng(semilla)
+        # Proyección fija de la imagen reducida 28x28x3 a una probabilidad
+        self.pesos = rng.normal(0, 0.05, (28 * 28 * 3, 64)).astype(np.float32)
+        self.salida = rng.normal(0, 0.1, 64).astype(np.float32)
+    
+    def predict(self, lote, batch_size=None, verbose=0):
+        return self.predict_con_embedding(lote, batch_size, verbose)[0]
+    
+    def predict_con_embedding(self, lote, batch_size=None, verbose=0):
+        """Probabilidades y capa oculta de 64 valores, como el modelo Keras con salida de embedding"""
+        lote = np.asarray(lote, dtype=np.float32)
+        if lote.shape[1:] != (*TAMANO_ENTRADA, 3):
+            raise ValueError(f"Entrada con forma {lote.shape[1:]}, se esperaba {(*TAMANO_ENTRADA, 3)}")
+        reducida = lote.reshape(len(lote), 28, 8, 28, 8, 3).mean(axis=(2, 4)).reshape(len(lote), -1)
+        oculta = np.maximum(reducida @ self.pesos, 0)
+        return (1 / (1 + np.exp(-(oculta @ self.salida))))[:, None].astype(np.float32), oculta
+
+def tabla_en_memoria(historial_df):
+    """Tabla `predicciones` en una base SQLite en memoria, con los mismos índices que la real
+
+    Se usa en lugar de ClienteMemoria porque este filtra recorriendo todas las filas y a 100k
+    filas mediría el coste del sustituto, no el de la app.
+    """
+    cliente = ClienteSQLite(":memory:")
+    columnas = ["id", "nombre", "paciente_clave", "probabilidad", "resultado", "fecha_hora", "correcta", "comentario"]
+    with cliente.conexion() as conexion:
+        conexion.executemany(
+            f"INSERT INTO predicciones ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+            historial_df[columnas].astype(object).where(historial_df[columnas].notna(), None).itertuples(index=False)
+        )
+    return cliente
+
+def medir(funcion, repeticiones):
+    """Una ejecución de calentamiento y `repeticiones` medidas; devuelve tiempos en ms"""
+    funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+# Casos: cada uno devuelve [(nombre, filas, función)] con la preparación ya hecha
+def casos_inferencia(imagenes):
+    modelo = ModeloSintetico()
+    fotos = [foto_sintetica("JPEG" if i % 2 else "PNG", semilla=i) for i in range(imagenes)]
+    abrir = lambda: [abrir_imagen(io.BytesIO(f)) for f in fotos]
+    return [
+        ("preprocesamiento (lote)", imagenes, lambda: preprocesar_lote(abrir())),
+        ("inferencia individual", imagenes, lambda: [predecir_imagen(modelo, imagen) for imagen in abrir()]),
+        ("inferencia por lotes", imagenes, lambda: predecir_lote(modelo, abrir())),
+        ("inferencia por lotes con embedding", imagenes, lambda: predecir_lote(modelo, abrir(), con_embedding=True))
+    ]
+
+def casos_estadisticas(historial_df):
+    filas = len(historial_df)
+    agregados = AgregadosPredicciones(tabla_en_memoria(historial_df))
+    agregados.reconstruir()
+    return [
+        ("estadisticas vectorizadas", filas, lambda: obtener_estadisticas_avanzadas(historial_df)),
+        ("agregados: lectura", filas, agregados.obtener),
+        ("agregados: reconstrucción", filas, agregados.reconstruir)
+    ]
+
+def casos_historial(historial_df):
+    filas = len(historial_df)
+    cliente = tabla_en_memoria(historial_df)
+    # La misma consulta que obtener_pagina_historial con el filtro "Parkinson detectado" (el total sale de los agregados)
+    pagina = lambda: (
+        cliente.table("predicciones").select("id,nombre,probabilidad,resultado,fecha_hora").gt("probabilidad", 0.5)
+        .order("fecha_hora", desc=True).order("id", desc=True).range(0, 49).execute()
+    )
+    return [
+        ("historial: descarga por páginas", filas, lambda: descargar(cliente, 0)),
+        ("historial: página filtrada", filas, pagina),
+        ("feedback: conteos indexados", filas, lambda: contar_feedback(cliente)),
+        ("feedback: página de valoraciones", filas, lambda: obtener_pagina_feedback(cliente, 1, 20)),
+        ("historial: últimos 5 para las tabs", filas, lambda: list(historial_df.tail(5).iloc[::-1].itertuples(index=False))),
+        ("historial: gráfico de drift", filas, lambda: dibujar_drift(datos_drift(historial_df)))
+    ]
+
+def casos_pacientes(historial_df):
+    filas = len(historial_df)
+    cliente = tabla_en_memoria(historial_df)
+    AgregadosPredicciones(cliente).reconstruir()  # Rellena el directorio de pacientes
+    return [
+        ("pacientes: búsqueda por prefijo", filas, lambda: buscar_pacientes(cliente, "Paciente 12")),
+        ("pacientes: búsqueda por subcadena", filas, lambda: buscar_pacientes(cliente, "nte 99")),
+        ("pacientes: evolución de uno", filas, lambda: evolucion_paciente(cliente, "paciente 12"))
+    ]
+
+def casos_embeddings(filas, dimension=128):
+    rng = np.random.default_rng(0)
+    indice = IndiceEmbeddings()
+    indice.agregar(np.arange(1, filas + 1), rng.normal(size=(filas, dimension)).astype(np.float32))
+    consulta = rng.normal(size=dimension).astype(np.float32)
+    return [("embeddings: top-5 coseno", filas, lambda: indice.buscar(consulta, 5))]
+
+def casos_exportacion(historial_df):
+    filas = len(historial_df)
+    casos = []
+    for formato in FORMATOS_EXPORTACION:
+        if formato == "Parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                continue
+        casos.append((
+            f"exportación {formato}", filas,
+            lambda formato=formato: exportar(tabla_historial(historial_df), formato, bloques_txt_historial)
+        ))
+    return casos
+
+def metadatos():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+def comparar(resultados, ruta_anterior):
+    with open(ruta_anterior, encoding="utf-8") as f:
+        anteriores = {(r["caso"], r["filas"]): r for r in json.load(f)["resultados"]}
+    print(f"\nComparación con {ruta_anterior} (mediana, >1 = más lento ahora)")
+    for r in resultados:
+        anterior = anteriores.get((r["caso"], r["filas"]))
+        if anterior is not None:
+            print(f"{r['caso']:<38} {r['filas']:>8} {anterior['mediana_ms']:>10.2f} → {r['mediana_ms']:>10.2f} ms  x{r['mediana_ms'] / anterior['mediana_ms']:.2f}")
+
+if __name__ == "__main__":
+    import matplotlib
+    matplotlib.use("Agg")
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--imagenes", type=int, default=32)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--casos", nargs="+", choices=["inferencia", "estadisticas", "historial", "pacientes", "embeddings", "exportacion"])
+    parser.add_argument("--salida", default="resultados_benchmark.json")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+    grupos = set(args.casos or ["inferencia", "estadisticas", "historial", "pacientes", "embeddings", "exportacion"])
+    
+    casos = []
+    if "inferencia" in grupos:
+        casos += casos_inferencia(args.imagenes)
+    for filas in args.filas:
+        historial_df = historial_sintetico(filas)
+        if "estadisticas" in grupos:
+            casos += casos_estadisticas(historial_df)
+        if "historial" in grupos:
+            casos += casos_historial(historial_df)
+        if "pacientes" in grupos:
+            casos += casos_pacientes(historial_df)
+        if "embeddings" in grupos:
+            casos += casos_embeddings(filas)
+        if "exportacion" in grupos:
+            casos += casos_exportacion(historial_df)
+    
+    resultados = []
+    print(f"{'caso':<38} {'filas':>8} {'mediana':>12} {'mínimo':>12}")
+    for nombre, filas, funcion in casos:
+        tiempos = medir(funcion, args.repeticiones)
+        resultado = {
+            "caso": nombre,
+            "filas": filas,
+            "repeticiones": args.repeticiones,
+            "mediana_ms": float(np.median(tiempos)),
+            "minimo_ms": float(np.min(tiempos)),
+            "media_ms": float(np.mean(tiempos)),
+            "desviacion_ms": float(np.std(tiempos))
+        }
+        resultados.append(resultado)
+        print(f"{nombre:<38} {filas:>8} {resultado['mediana_ms']:>9.2f} ms {resultado['minimo_ms']:>9.2f} ms")
+    
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump({"metadatos": metadatos(), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {args.salida}")
+    if args.comparar:
+        comparar(resultados, args.comparar)
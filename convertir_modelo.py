@@ -0,0 +1,155 @@
+"""Convierte el modelo Keras a TFLite y compara ambos backends
+
+Uso:
+    python convertir_modelo.py convertir --cuantizacion float16
+    python convertir_modelo.py convertir --cuantizacion int8 --calibracion imagenes/entrenamiento
+    python convertir_modelo.py comparar imagenes/prueba --reporte comparacion.json
+
+En "comparar", las imágenes dentro de carpetas llamadas parkinson/ y healthy/ (o saludable/)
+se usan como etiquetas para calcular la exactitud de cada backend.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+
+from inferencia import (
+    NORMALIZACION_EN_MODELO, RUTA_MODELO, RUTA_MODELO_TFLITE, UMBRAL_PARKINSON, abrir_imagen, cargar_modelo, envolver_normalizacion,
+    preprocesar_imagen, ruta_metadatos_tflite
+)
+
+EXTENSIONES = (".jpg", ".jpeg", ".png")
+ETIQUETAS = {"parkinson": 1, "healthy": 0, "saludable": 0, "sano": 0}
+
+def listar_imagenes(carpeta):
+    """Devuelve (ruta, etiqueta) de cada imagen; la etiqueta sale del nombre de la carpeta o es None"""
+    imagenes = []
+    for raiz, _, archivos in os.walk(carpeta):
+        etiqueta = ETIQUETAS.get(os.path.basename(raiz).lower())
+        for archivo in sorted(archivos):
+            if archivo.lower().endswith(EXTENSIONES):
+                imagenes.append((os.path.join(raiz, archivo), etiqueta))
+    return imagenes
+
+def convertir(entrada, salida, cuantizacion, calibracion=None, muestras_calibracion=100):
+    """Convierte el .h5 a .tflite con cuantización opcional float16 o int8
+    
+    Junto al .tflite se guarda un JSON con las opciones de la conversión; ModeloTFLite lo lee
+    y no carga el modelo si NORMALIZACION_EN_MODELO no coincide.
+    """
+    import tensorflow as tf
+    
+    modelo = tf.keras.models.load_model(entrada)
+    if NORMALIZACION_EN_MODELO:
+        # El .tflite recibirá píxeles 0-255, igual que el preprocesamiento con esta opción
+        modelo = envolver_normalizacion(modelo)
+    convertidor = tf.lite.TFLiteConverter.from_keras_model(modelo)
+    if cuantizacion == "float16":
+        convertidor.optimizations = [tf.lite.Optimize.DEFAULT]
+        convertidor.target_spec.supported_types = [tf.float16]
+    elif cuantizacion == "int8":
+        if not calibracion:
+            raise ValueError("La cuantización int8 necesita --calibracion con imágenes representativas")
+        rutas = [ruta for ruta, _ in listar_imagenes(calibracion)][:muestras_calibracion]
+        
+        def dataset_representativo():
+            for ruta in rutas:
+                yield [np.expand_dims(preprocesar_imagen(abrir_imagen(ruta)), axis=0)]
+        
+        convertidor.optimizations = [tf.lite.Optimize.DEFAULT]
+        convertidor.representative_dataset = dataset_representativo
+        convertidor.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    
+    modelo_tflite = convertidor.convert()
+    with open(salida, "wb") as f:
+        f.write(modelo_tflite)
+    with open(ruta_metadatos_tflite(salida), "w", encoding="utf-8") as f:
+        json.dump({"normalizacion_en_modelo": NORMALIZACION_EN_MODELO, "cuantizacion": cuantizacion, "origen": entrada}, f)
+    return len(modelo_tflite)
+
+def medir_backend(backend, ruta, imagenes):
+    """Carga un backend y predice imagen por imagen; se ejecuta en un proceso aparte para aislar la memoria"""
+    inicio = time.perf_counter()
+    modelo = cargar_modelo(ruta, backend)
+    tiempo_carga = time.perf_counter() - inicio
+    
+    probabilidades = []
+    latencias = []
+    for ruta_imagen, _ in imagenes:
+        lote = np.expand_dims(preprocesar_imagen(abrir_imagen(ruta_imagen)), axis=0)
+        inicio = time.perf_counter()
+        probabilidades.append(float(modelo.predict(lote, verbose=0)[0][0]))
+        latencias.append(time.perf_counter() - inicio)
+    
+    return {
+        "carga_s": tiempo_carga,
+        # ru_maxrss está en KB en Linux
+        "memoria_max_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "latencias": latencias,
+        "probabilidades": probabilidades
+    }
+
+def comparar(carpeta, ruta_keras, ruta_tflite):
+    """Compara exactitud, latencia y memoria de los backends Keras y TFLite"""
+    imagenes = listar_imagenes(carpeta)
+    if not imagenes:
+        raise ValueError(f"No hay imágenes en {carpeta}")
+    etiquetas = np.array([e if e is not None else -1 for _, e in imagenes])
+    
+    contexto = multiprocessing.get_context("spawn")
+    with contexto.Pool(1, maxtasksperchild=1) as pool:
+        medidas = {
+            "keras": pool.apply(medir_backend, ("keras", ruta_keras, imagenes)),
+            "tflite": pool.apply(medir_backend, ("tflite", ruta_tflite, imagenes))
+        }
+    
+    referencia = np.array(medidas["keras"]["probabilidades"])
+    reporte = {"imagenes": len(imagenes), "etiquetadas": int((etiquetas >= 0).sum()), "backends": {}}
+    for backend, medida in medidas.items():
+        probabilidades = np.array(medida["probabilidades"])
+        latencias = np.array(medida["latencias"]) * 1000
+        clases = (probabilidades > UMBRAL_PARKINSON).astype(int)
+        resumen = {
+            "carga_s": round(medida["carga_s"], 3),
+            "memoria_max_mb": round(medida["memoria_max_mb"], 1),
+            "latencia_media_ms": round(float(latencias.mean()), 2),
+            "latencia_p95_ms": round(float(np.percentile(latencias, 95)), 2),
+            "acuerdo_con_keras": round(float((clases == (referencia > UMBRAL_PARKINSON)).mean()), 4),
+            "error_abs_medio_vs_keras": round(float(np.abs(probabilidades - referencia).mean()), 5)
+        }
+        if reporte["etiquetadas"]:
+            etiquetadas = etiquetas >= 0
+            resumen["exactitud"] = round(float((clases[etiquetadas] == etiquetas[etiquetadas]).mean()), 4)
+        reporte["backends"][backend] = resumen
+    return reporte
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    
+    p_convertir = subparsers.add_parser("convertir", help="Generar el modelo TFLite")
+    p_convertir.add_argument("--entrada", default=RUTA_MODELO)
+    p_convertir.add_argument("--salida", default=RUTA_MODELO_TFLITE)
+    p_convertir.add_argument("--cuantizacion", choices=["ninguna", "float16", "int8"], default="ninguna")
+    p_convertir.add_argument("--calibracion", help="Carpeta de imágenes para calibrar la cuantización int8")
+    
+    p_comparar = subparsers.add_parser("comparar", help="Comparar Keras y TFLite sobre una carpeta de prueba")
+    p_comparar.add_argument("carpeta")
+    p_comparar.add_argument("--keras", default=RUTA_MODELO)
+    p_comparar.add_argument("--tflite", default=RUTA_MODELO_TFLITE)
+    p_comparar.add_argument("--reporte", help="Guardar el reporte en JSON")
+    
+    args = parser.parse_args()
+    if args.comando == "convertir":
+        tamano = convertir(args.entrada, args.salida, args.cuantizacion, args.calibracion)
+        print(f"Modelo TFLite guardado en {args.salida} ({tamano / 1024 / 1024:.1f} MB, cuantización: {args.cuantizacion})")
+    else:
+        reporte = comparar(args.carpeta, args.keras, args.tflite)
+        print(json.dumps(reporte, indent=2, ensure_ascii=False))
+        if args.reporte:
+            with open(args.reporte, "w", encoding="utf-8") as f:
+                json.dump(reporte, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,383 @@
+"""Escritura diferida (write-behind) de predicciones y feedback en la tabla de Supabase
+
+Las escrituras se encolan y vuelven al instante; un hilo las agrupa en inserciones masivas,
+reintenta con espera exponencial y, si Supabase no responde, las guarda en un archivo local
+que se vuelve a enviar más tarde. Cada fila lleva una clave única (`clave_insercion`) y se
+inserta con upsert sobre ella, así que repetir un envío cuya respuesta se perdió no la duplica.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from almacenamiento import TABLA_PREDICCIONES, TAMANO_BLOQUE_INSERCION, actualizar_feedback, feedback_desde_texto
+from metricas import METRICAS
+
+logger = logging.getLogger("detector_parkinson")
+
+COLUMNA_CLAVE = "clave_insercion"  # Columna única de la tabla con la clave de cada fila encolada
+
+class InsercionPendiente:
+    """Referencia a una fila encolada; su id se conoce cuando la inserción llega a Supabase"""
+    
+    def __init__(self, fila, al_resolver=None):
+        self.fila = fila
+        self.al_resolver = al_resolver  # Recibe el id cuando la fila llega a Supabase
+        self.clave = uuid.uuid4().hex  # Identifica la fila en la tabla y en el archivo local mientras no tenga id
+        self.id = None
+        self.en_spool = False
+        self._hecha = threading.Event()
+    
+    def resolver(self, prediccion_id=None, en_spool=False):
+        """Asigna el id (o marca la fila como guardada en el archivo local) y despierta a quien espera"""
+        self.id = prediccion_id
+        self.en_spool = en_spool
+        self._hecha.set()
+        if prediccion_id is not None and self.al_resolver is not None:
+            try:
+                self.al_resolver(prediccion_id)
+            except Exception as e:
+                logger.warning("Error tras guardar la predicción %s: %s", prediccion_id, e)
+    
+    def esperar_id(self, timeout=None):
+        """Espera a que la fila se escriba y devuelve su id (None si quedó en el archivo local)"""
+        self._hecha.wait(timeout)
+        return self.id
+
+class EscritorDiferido:
+    """Cola de escritura con un hilo que agrupa, reintenta y guarda en disco si falla la red"""
+    
+    def __init__(self, cliente, ruta_spool="predicciones_pendientes.jsonl", max_lote=TAMANO_BLOQUE_INSERCION,
+                 max_espera_s=0.2, reintentos=4, espera_base_s=0.5, reenvio_spool_s=30,
+                 al_insertar=None, al_actualizar_feedback=None, agregados=None):
+        self.cliente = cliente
+        self.agregados = agregados  # AgregadosPredicciones que se actualiza tras cada escritura
+        self.ruta_spool = ruta_spool
+        self.ruta_reenvio = ruta_spool + ".reenviando"  # Lo que se está reenviando; se borra al terminar
+        self.max_lote = max_lote
+        self.max_espera_s = max_espera_s
+        self.reintentos = reintentos
+        self.espera_base_s = espera_base_s
+        self.reenvio_spool_s = reenvio_spool_s
+        self.al_insertar = al_insertar  # Recibe las filas guardadas (con su id) tras cada inserción
+        self.al_actualizar_feedback = al_actualizar_feedback
+        self.cola = queue.Queue()
+        self.escritas = 0
+        self.enviadas_a_spool = 0
+        self.ultimo_error = None
+        self._ultimo_reenvio = 0.0
+        self._pendientes_spool = {}  # clave -> InsercionPendiente guardada en el archivo local
+        self._lock_spool = threading.Lock()
+        threading.Thread(target=self._bucle, name="escritura-diferida", daemon=True).start()
+    
+    # API pública
+    def insertar(self, fila, al_resolver=None):
+        """Encola una fila nueva y devuelve su InsercionPendiente; al_resolver(id) se llama al conocer su id"""
+        pendiente = InsercionPendiente(fila, al_resolver)
+        self.cola.put(("insertar", pendiente))
+        return pendiente
+    
+    def actualizar_feedback(self, referencia, correcta, comentario=None):
+        """Encola el feedback de una predicción; referencia es un id o una InsercionPendiente"""
+        self.cola.put(("feedback", (referencia, correcta, comentario)))
+    
+    def vaciar(self, timeout=None):
+        """Espera a que se procesen todas las escrituras encoladas"""
+        evento = threading.Event()
+        self.cola.put(("marca", evento))
+        return evento.wait(timeout)
+    
+    def estadisticas(self):
+        return {
+            "en_cola": self.cola.qsize(),
+            "escritas": self.escritas,
+            "en_spool": self._contar_spool(),
+            "enviadas_a_spool": self.enviadas_a_spool,
+            "ultimo_error": self.ultimo_error
+        }
+    
+    # Hilo de escritura
+    def _bucle(self):
+        self._sin_detener(self._reenviar_spool)
+        while True:
+            try:
+                operaciones = [self.cola.get(timeout=self.reenvio_spool_s)]
+            except queue.Empty:
+                self._sin_detener(self._reenviar_spool)
+                continue
+            limite = time.monotonic() + self.max_espera_s
+            while len(operaciones) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    operaciones.append(self.cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            if not self._sin_detener(self._procesar, operaciones):
+                self._liberar(operaciones)
+            if time.monotonic() - self._ultimo_reenvio >= self.reenvio_spool_s:
+                self._sin_detener(self._reenviar_spool)
+    
+    def _sin_detener(self, funcion, *args):
+        """Ejecuta un paso del hilo; si falla, lo registra y devuelve False para que el hilo siga vivo"""
+        try:
+            funcion(*args)
+            return True
+        except Exception as e:
+            self.ultimo_error = str(e)
+            logger.exception("Error en el hilo de escritura diferida")
+            return False
+    
+    def _liberar(self, operaciones):
+        """Despierta a quien espera operaciones de un lote que falló (las inserciones quedan sin id)"""
+        for tipo, datos in operaciones:
+            if tipo == "marca":
+                datos.set()
+            elif tipo == "insertar" and datos.id is None and not datos.en_spool:
+                datos.resolver()
+    
+    def _procesar(self, operaciones):
+        inserciones = []
+        for tipo, datos in operaciones:
+            if tipo == "insertar":
+                inserciones.append(datos)
+                continue
+            # Las inserciones anteriores se escriben antes para respetar el orden
+            self._escribir_inserciones(inserciones)
+            inserciones = []
+            if tipo == "feedback":
+                self._escribir_feedback(*datos)
+            elif tipo == "marca":
+                datos.set()
+        self._escribir_inserciones(inserciones)
+    
+    def _con_reintentos(self, funcion):
+        for intento in range(self.reintentos):
+            try:
+                return funcion()
+            except Exception as e:
+                self.ultimo_error = str(e)
+                if intento == self.reintentos - 1:
+                    raise
+                time.sleep(self.espera_base_s * 2 ** intento)
+    
+    def _escribir_inserciones(self, inserciones):
+        if not inserciones:
+            return
+        try:
+            with METRICAS.medir("insercion_bd"):
+                ids = self._con_reintentos(lambda: self._insertar_filas([(p.clave, p.fila) for p in inserciones]))
+        except Exception:
+            logger.warning("Supabase no disponible: %d predicciones guardadas en %s", len(inserciones), self.ruta_spool)
+            self._guardar_en_spool(inserciones)
+            return
+        guardadas = [p for p in inserciones if p.clave in ids]
+        sin_id = [p for p in inserciones if p.clave not in ids]
+        if sin_id:
+            # Respuesta incompleta: esas filas se reenvían desde el archivo local (la clave evita duplicarlas)
+            logger.warning(
+                "Supabase no devolvió el id de %d de %d predicciones: guardadas en %s",
+                len(sin_id), len(inserciones), self.ruta_spool
+            )
+            self._guardar_en_spool(sin_id)
+        for pendiente in guardadas:
+            pendiente.resolver(ids[pendiente.clave])
+        filas = [dict(p.fila, id=ids[p.clave]) for p in guardadas]
+        if self.agregados is not None:
+            self.agregados.registrar_inserciones(filas)
+        self.escritas += len(guardadas)
+        if filas and self.al_insertar is not None:
+            self.al_insertar(filas)
+    
+    def _guardar_en_spool(self, inserciones):
+        """Guarda las inserciones en el archivo local y despierta a quien espera su id"""
+        self._a_spool([{"op": "insertar", "clave": p.clave, "fila": p.fila} for p in inserciones])
+        for pendiente in inserciones:
+            self._pendientes_spool[pendiente.clave] = pendiente
+            pendiente.resolver(en_spool=True)
+    
+    def _insertar_filas(self, registros):
+        """Inserta [(clave, fila)] sin duplicar las claves ya guardadas y devuelve {clave: id}
+
+        Si un intento anterior llegó a guardar la fila pero su respuesta se perdió, el upsert la
+        ignora y no la devuelve; su id se busca por la clave.
+        """
+        response = self.cliente.table(TABLA_PREDICCIONES).upsert(
+            [dict(fila, **{COLUMNA_CLAVE: clave}) for clave, fila in registros],
+            on_conflict=COLUMNA_CLAVE, ignore_duplicates=True
+        ).execute()
+        ids = {fila[COLUMNA_CLAVE]: fila["id"] for fila in response.data or []}
+        faltan = [clave for clave, _ in registros if clave not in ids]
+        if faltan:
+            existentes = self.cliente.table(TABLA_PREDICCIONES).select(f"id,{COLUMNA_CLAVE}").in_(COLUMNA_CLAVE, faltan).execute()
+            ids.update({fila[COLUMNA_CLAVE]: fila["id"] for fila in existentes.data or []})
+        return ids
+    
+    def _escribir_feedback(self, referencia, correcta, comentario):
+        feedback = {"op": "feedback", "correcta": correcta, "comentario": comentario}
+        if isinstance(referencia, InsercionPendiente):
+            if referencia.id is None:
+                # La predicción aún está en el archivo local: el feedback la sigue
+                self._a_spool([dict(feedback, clave=referencia.clave)])
+                return
+            prediccion_id = referencia.id
+        else:
+            prediccion_id = referencia
+        try:
+            with METRICAS.medir("feedback_bd"):
+                self._con_reintentos(lambda: self._actualizar(prediccion_id, correcta, comentario))
+        except Exception:
+            self._a_spool([dict(feedback, id=prediccion_id)])
+            return
+        self.escritas += 1
+        if self.al_actualizar_feedback is not None:
+            self.al_actualizar_feedback(prediccion_id, correcta, comentario)
+    
+    def _actualizar(self, prediccion_id, correcta, comentario):
+        return actualizar_feedback(self.cliente, prediccion_id, correcta, comentario, self.agregados)
+    
+    # Archivo local de escrituras pendientes
+    def _a_spool(self, registros):
+        with self._lock_spool:
+            with open(self.ruta_spool, "a", encoding="utf-8") as f:
+                for registro in registros:
+                    f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self.enviadas_a_spool += len(registros)
+    
+    def _contar_spool(self):
+        with self._lock_spool:
+            return len(self._leer_registros(self.ruta_reenvio)) + len(self._leer_registros(self.ruta_spool))
+    
+    @staticmethod
+    def _leer_registros(ruta):
+        if not os.path.exists(ruta):
+            return []
+        with open(ruta, encoding="utf-8") as f:
+            return [json.loads(linea) for linea in f if linea.strip()]
+    
+    def _tomar_spool(self):
+        """Pasa el archivo local al de reenvío, detrás de lo que quedara de un reenvío anterior
+
+        Mientras se reenvía, las escrituras que fallen siguen yendo al archivo local. Si el proceso
+        cae entre la copia y el borrado, esos registros se reenvían dos veces, lo que no cambia
+        nada: las inserciones se ignoran por su clave y el feedback vuelve a dejar el mismo valor.
+        """
+        with self._lock_spool:
+            registros = self._leer_registros(self.ruta_reenvio)
+            if os.path.exists(self.ruta_spool):
+                registros += self._leer_registros(self.ruta_spool)
+                self._reescribir_reenvio(registros)
+                os.remove(self.ruta_spool)
+        return registros
+    
+    def _reescribir_reenvio(self, registros):
+        """Sustituye de forma atómica el archivo de reenvío por los registros que faltan (lo borra si no queda ninguno)"""
+        if not registros:
+            if os.path.exists(self.ruta_reenvio):
+                os.remove(self.ruta_reenvio)
+            return
+        temporal = self.ruta_reenvio + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta_reenvio)
+    
+    def _buscar_id(self, clave):
+        """Id de una fila ya insertada a partir de su clave (None si no está en la tabla)"""
+        filas = self.cliente.table(TABLA_PREDICCIONES).select("id").eq(COLUMNA_CLAVE, clave).execute().data
+        return filas[0]["id"] if filas else None
+    
+    def _reenviar_spool(self):
+        """Reenvía en orden lo guardado en el archivo local; lo que vuelva a fallar se conserva
+
+        Los registros no se borran al leerlos: pasan a un archivo de reenvío que se reescribe tras
+        cada grupo de inserciones con lo que aún falta y solo se borra al terminar. Si el proceso
+        cae a mitad, el siguiente reenvío empieza por ese archivo.
+        """
+        self._ultimo_reenvio = time.monotonic()
+        registros = self._tomar_spool()
+        if not registros:
+            return
+        
+        ids = {}
+        insertadas = []
+        conservar = []  # Inserciones sin id en la respuesta y el feedback que las sigue: se quedan en el archivo
+        claves_conservadas = set()
+        posicion = 0
+        
+        def restantes():
+            # Los feedback de filas ya insertadas pasan a referirse a su id real
+            for registro in conservar + registros[posicion:]:
+                if registro["op"] == "feedback" and registro.get("clave") in ids:
+                    registro["id"] = ids[registro.pop("clave")]
+            return conservar + registros[posicion:]
+        
+        try:
+            while posicion < len(registros):
+                registro = registros[posicion]
+                if registro["op"] == "insertar":
+                    # Las inserciones consecutivas se reenvían juntas
+                    fin = posicion
+                    while fin < len(registros) and fin - posicion < self.max_lote and registros[fin]["op"] == "insertar":
+                        fin += 1
+                    grupo = registros[posicion:fin]
+                    ids_grupo = self._insertar_filas([(r["clave"], r["fila"]) for r in grupo])
+                    filas = [dict(r["fila"], id=ids_grupo[r["clave"]]) for r in grupo if r["clave"] in ids_grupo]
+                    if self.agregados is not None:
+                        self.agregados.registrar_inserciones(filas)
+                    insertadas.extend(filas)
+                    ids.update(ids_grupo)
+                    for clave, prediccion_id in ids_grupo.items():
+                        pendiente = self._pendientes_spool.pop(clave, None)
+                        if pendiente is not None:
+                            pendiente.resolver(prediccion_id)
+                    sin_id = [r for r in grupo if r["clave"] not in ids_grupo]
+                    if sin_id:
+                        logger.warning(
+                            "Supabase no devolvió el id de %d predicciones reenviadas: siguen en %s", len(sin_id), self.ruta_reenvio
+                        )
+                        conservar.extend(sin_id)
+                        claves_conservadas.update(r["clave"] for r in sin_id)
+                    self.escritas += len(grupo) - len(sin_id)
+                    posicion = fin
+                    # Punto de control: una caída a partir de aquí no vuelve a enviar este grupo
+                    with self._lock_spool:
+                        self._reescribir_reenvio(restantes())
+                    continue
+                
+                # El feedback no tiene punto de control propio: repetirlo tras una caída deja el mismo valor
+                clave = registro.get("clave")
+                prediccion_id = registro.get("id") or ids.get(clave)
+                if prediccion_id is None and clave in claves_conservadas:
+                    conservar.append(registro)
+                    posicion += 1
+                    continue
+                if prediccion_id is None and clave is not None:
+                    # Su inserción se reenvió en una pasada anterior que no llegó a guardar el id
+                    prediccion_id = self._buscar_id(clave)
+                if prediccion_id is None:
+                    logger.warning("Feedback descartado: su predicción no está en %s", self.ruta_spool)
+                else:
+                    if "correcta" in registro:
+                        correcta, comentario = registro["correcta"], registro["comentario"]
+                    else:
+                        # Registro guardado antes del feedback estructurado
+                        correcta, comentario = feedback_desde_texto(registro["feedback"]) or (None, None)
+                    if correcta is not None:
+                        self._actualizar(prediccion_id, correcta, comentario)
+                        self.escritas += 1
+                        if self.al_actualizar_feedback is not None:
+                            self.al_actualizar_feedback(prediccion_id, correcta, comentario)
+                posicion += 1
+        except Exception as e:
+            self.ultimo_error = str(e)
+        with self._lock_spool:
+            self._reescribir_reenvio(restantes())
+        if insertadas and self.al_insertar is not None:
+            self.al_insertar(insertadas)
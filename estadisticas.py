@@ -0,0 +1,31 @@
+"""Estadísticas del historial de predicciones calculadas de forma vectorizada"""
+import numpy as np
+import pandas as pd
+
+UMBRAL_PARKINSON = 0.5
+LIMITES_RANGOS = np.array([25.0, 50.0, 75.0])
+NOMBRES_RANGOS = ["0-25%", "25-50%", "50-75%", "75-100%"]
+
+def obtener_estadisticas_avanzadas(historial_df):
+    """Calcula todas las métricas del historial en una sola pasada sobre las columnas"""
+    if len(historial_df) == 0:
+        return None
+    
+    probabilidades = pd.to_numeric(historial_df["probabilidad"]).to_numpy(dtype=np.float64)
+    total_analisis = int(probabilidades.size)
+    total_parkinson = int(np.count_nonzero(probabilidades > UMBRAL_PARKINSON))
+    
+    # Mismos cortes que la clasificación original: prob < 25, < 50, < 75, resto
+    indices_rango = np.searchsorted(LIMITES_RANGOS, probabilidades * 100, side="right")
+    conteos = np.bincount(indices_rango, minlength=len(NOMBRES_RANGOS))
+    
+    return {
+        "total_analisis": total_analisis,
+        "total_parkinson": total_parkinson,
+        "total_saludable": total_analisis - total_parkinson,
+        "prob_promedio": float(probabilidades.mean()),
+        "prob_maxima": float(probabilidades.max()),
+        "prob_minima": float(probabilidades.min()),
+        "rangos": {nombre: int(conteo) for nombre, conteo in zip(NOMBRES_RANGOS, conteos)},
+        "pacientes_unicos": int(historial_df["nombre"].nunique())
+    }
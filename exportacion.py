@@ -0,0 +1,73 @@
+"""Exportación por bloques del historial y del feedback en TXT, CSV y Parquet"""
+import io
+
+import numpy as np
+
+TAMANO_BLOQUE = 5000
+FORMATOS_EXPORTACION = {
+    "TXT": ("txt", "text/plain"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/octet-stream")
+}
+
+def tabla_historial(historial_df):
+    """Columnas exportables del historial, del análisis más reciente al más antiguo"""
+    return historial_df.loc[::-1, ["nombre", "fecha_hora", "resultado", "probabilidad"]].reset_index(drop=True)
+
+def tabla_feedback(feedback_df):
+    """Feedback con su tipo y comentario, del más reciente al más antiguo"""
+    tabla = tabla_historial(feedback_df)
+    tabla["feedback"] = np.where(feedback_df["correcta"].iloc[::-1].astype(bool), "CORRECTO", "INCORRECTO")
+    tabla["comentario"] = feedback_df["comentario"].iloc[::-1].fillna("Sin comentario").reset_index(drop=True)
+    return tabla
+
+def bloques_txt_historial(tabla, tamano_bloque=TAMANO_BLOQUE):
+    """Genera el TXT del historial por bloques de filas"""
+    separador = "-" * 60 + "\n\n"
+    yield "HISTORIAL DE PREDICCIONES - DETECTOR DE PARKINSON\n" + "=" * 60 + "\n\n"
+    for inicio in range(0, len(tabla), tamano_bloque):
+        bloque = tabla.iloc[inicio:inicio + tamano_bloque]
+        yield "".join(
+            f"Paciente: {nombre}\nFecha: {fecha}\nResultado: {resultado}\nProbabilidad: {probabilidad*100:.2f}%\n{separador}"
+            for nombre, fecha, resultado, probabilidad in zip(
+                bloque["nombre"], bloque["fecha_hora"], bloque["resultado"], bloque["probabilidad"]
+            )
+        )
+
+def bloques_txt_feedback(tabla, tamano_bloque=TAMANO_BLOQUE):
+    """Genera el TXT del feedback por bloques de filas"""
+    separador = "-" * 70 + "\n\n"
+    yield "RETROALIMENTACIÓN DE USUARIOS - DETECTOR DE PARKINSON\n" + "=" * 70 + "\n\n"
+    for inicio in range(0, len(tabla), tamano_bloque):
+        bloque = tabla.iloc[inicio:inicio + tamano_bloque]
+        yield "".join(
+            f"Paciente: {nombre}\nFecha: {fecha}\nPredicción: {resultado} ({probabilidad*100:.2f}%)\n"
+            f"Feedback: {tipo}\nComentario: {comentario}\n{separador}"
+            for nombre, fecha, resultado, probabilidad, tipo, comentario in zip(
+                bloque["nombre"], bloque["fecha_hora"], bloque["resultado"],
+                bloque["probabilidad"], bloque["feedback"], bloque["comentario"]
+            )
+        )
+
+def exportar(tabla, formato, bloques_txt, tamano_bloque=TAMANO_BLOQUE):
+    """Escribe la tabla en el formato pedido bloque a bloque y devuelve los bytes"""
+    buffer = io.BytesIO()
+    if formato == "TXT":
+        for bloque in bloques_txt(tabla, tamano_bloque):
+            buffer.write(bloque.encode("utf-8"))
+    elif formato == "CSV":
+        for inicio in range(0, max(len(tabla), 1), tamano_bloque):
+            bloque = tabla.iloc[inicio:inicio + tamano_bloque]
+            buffer.write(bloque.to_csv(index=False, header=inicio == 0).encode("utf-8"))
+    elif formato == "Parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        esquema = pa.Schema.from_pandas(tabla, preserve_index=False)
+        with pq.ParquetWriter(buffer, esquema) as escritor:
+            for inicio in range(0, len(tabla), tamano_bloque):
+                bloque = tabla.iloc[inicio:inicio + tamano_bloque]
+                escritor.write_table(pa.Table.from_pandas(bloque, schema=esquema, preserve_index=False))
+    else:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    return buffer.getvalue()
@@ -0,0 +1,76 @@
+"""Gráfico de evolución temporal (drift) con reducción por intervalos de tiempo
+
+Con pocas predicciones se dibujan todos los puntos; con muchas se agrupan por intervalos
+(15 min, hora, 6 h, día o semana) y se dibuja la media de cada intervalo con una banda
+mínimo/máximo, de modo que el coste de dibujar no crece con el historial.
+"""
+import io
+
+import pandas as pd
+
+from estadisticas import UMBRAL_PARKINSON
+
+MAX_PUNTOS = 500
+INTERVALOS = [
+    ("15min", pd.Timedelta(minutes=15), "15 min"),
+    ("h", pd.Timedelta(hours=1), "hora"),
+    ("6h", pd.Timedelta(hours=6), "6 horas"),
+    ("D", pd.Timedelta(days=1), "día"),
+    ("W", pd.Timedelta(weeks=1), "semana")
+]
+
+def datos_drift(historial_df, max_puntos=MAX_PUNTOS):
+    """Prepara la serie a dibujar: puntos individuales o agregados por intervalo"""
+    df = pd.DataFrame({
+        "fecha_hora": pd.to_datetime(historial_df["fecha_hora"]),
+        "probabilidad": pd.to_numeric(historial_df["probabilidad"])
+    }).sort_values("fecha_hora")
+    
+    datos = {"total": len(df)}
+    
+    if len(df) <= max_puntos:
+        df["promedio_movil"] = df["probabilidad"].rolling(window=3, min_periods=1).mean()
+        datos.update(modo="puntos", serie=df)
+        return datos
+    
+    # El intervalo más fino que deja como mucho max_puntos grupos
+    duracion = df["fecha_hora"].iloc[-1] - df["fecha_hora"].iloc[0]
+    for frecuencia, ancho, nombre in INTERVALOS:
+        if duracion / ancho < max_puntos:
+            break
+    serie = (
+        df.set_index("fecha_hora")["probabilidad"]
+        .resample(frecuencia).agg(["mean", "min", "max", "count"])
+        .query("count > 0")
+        .rename(columns={"mean": "media", "min": "minimo", "max": "maximo", "count": "conteo"})
+    )
+    serie["promedio_movil"] = serie["media"].rolling(window=3, min_periods=1).mean()
+    datos.update(modo="intervalos", intervalo=nombre, serie=serie.reset_index())
+    return datos
+
+def dibujar_drift(datos):
+    """Dibuja el gráfico y devuelve un PNG; la figura no pasa por pyplot y se libera al salir"""
+    from matplotlib.figure import Figure  # Solo se carga si se dibuja el gráfico
+    
+    serie = datos["serie"]
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    if datos["modo"] == "puntos":
+        ax.scatter(serie["fecha_hora"], serie["probabilidad"], color="gray", alpha=0.6, s=50, label="Predicciones individuales")
+        ax.plot(serie["fecha_hora"], serie["promedio_movil"], marker='o', linestyle='-', color='royalblue', linewidth=2, markersize=6, label="Promedio móvil (ventana=3)")
+    else:
+        ax.fill_between(serie["fecha_hora"], serie["minimo"], serie["maximo"], color="gray", alpha=0.25, label=f"Mínimo / máximo por {datos['intervalo']}")
+        ax.plot(serie["fecha_hora"], serie["media"], color="gray", linewidth=1, label=f"Media por {datos['intervalo']}")
+        ax.plot(serie["fecha_hora"], serie["promedio_movil"], linestyle='-', color='royalblue', linewidth=2, label="Promedio móvil (ventana=3)")
+    ax.axhline(UMBRAL_PARKINSON, color='red', linestyle='--', linewidth=2, label='Umbral 50%')
+    ax.set_title("Evolución de las predicciones en el tiempo", fontsize=14, fontweight='bold')
+    ax.set_xlabel("Fecha y hora del análisis", fontsize=11)
+    ax.set_ylabel("Probabilidad de Parkinson", fontsize=11)
+    ax.legend(loc='best', fontsize=9)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    fig.autofmt_xdate(rotation=45, ha='right', bottom=0.2)
+    fig.tight_layout()
+    
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100)
+    return buffer.getvalue()
@@ -0,0 +1,173 @@
+"""Índice de embeddings de los trazos analizados para buscar casos parecidos
+
+Cada predicción aporta el embedding de la penúltima capa del modelo, calculado en la misma
+pasada que la probabilidad. Los vectores se guardan normalizados en float16 en un archivo
+mapeado en memoria, junto a otro con el id de la predicción. Así la similitud coseno es un
+producto escalar que se calcula por bloques con numpy sobre todo el índice; cada bloque se
+pasa a float32 con np.copyto sobre un mismo búfer, que se reutiliza entre bloques.
+El archivo crece duplicando su capacidad y un JSON guarda la dimensión y el número de vectores
+válidos. Solo debe escribir un proceso.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+CAPACIDAD_INICIAL = 1024
+BLOQUE_BUSQUEDA = 4096  # Filas que se pasan a float32 a la vez al buscar (caben en la caché)
+
+def normalizar_filas(embeddings):
+    """Divide cada fila por su norma (las filas nulas se dejan a cero)"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    normas = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.where(normas == 0, 1, normas)
+
+class IndiceEmbeddings:
+    """Vectores float16 normalizados y sus ids, en disco (ruta) o solo en memoria (ruta=None)"""
+    
+    def __init__(self, ruta=None, capacidad_inicial=CAPACIDAD_INICIAL):
+        self.ruta = ruta
+        self.capacidad_inicial = capacidad_inicial
+        self._lock = threading.Lock()
+        self._vaciar()
+        self._cargar_disco()
+    
+    def __len__(self):
+        return self.total
+    
+    def _vaciar(self):
+        self.dimension = None
+        self.total = 0
+        self.capacidad = 0
+        self.vectores = np.empty((0, 0), dtype=np.float16)
+        self.ids = np.empty(0, dtype=np.int64)
+    
+    def _archivos(self):
+        return f"{self.ruta}.vectores", f"{self.ruta}.ids", f"{self.ruta}.json"
+    
+    def _reservar(self, capacidad):
+        """Amplía la capacidad conservando los vectores ya guardados"""
+        if self.ruta is None:
+            vectores = np.zeros((capacidad, self.dimension), dtype=np.float16)
+            ids = np.zeros(capacidad, dtype=np.int64)
+            if self.total:
+                vectores[:self.total] = self.vectores[:self.total]
+                ids[:self.total] = self.ids[:self.total]
+        else:
+            ruta_vectores, ruta_ids, _ = self._archivos()
+            self._vaciar_mapas()
+            # Alargar el archivo no mueve los bytes existentes: basta con volver a mapearlo
+            for archivo, tamano in ((ruta_vectores, capacidad * self.dimension * 2), (ruta_ids, capacidad * 8)):
+                with open(archivo, "a+b") as f:
+                    f.truncate(tamano)
+            vectores = np.memmap(ruta_vectores, dtype=np.float16, mode="r+", shape=(capacidad, self.dimension))
+            ids = np.memmap(ruta_ids, dtype=np.int64, mode="r+", shape=(capacidad,))
+        self.vectores, self.ids, self.capacidad = vectores, ids, capacidad
+    
+    def _vaciar_mapas(self):
+        for mapa in (self.vectores, self.ids):
+            if isinstance(mapa, np.memmap):
+                mapa.flush()
+    
+    def agregar(self, ids, embeddings):
+        """Añade los embeddings de las predicciones `ids`"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        embeddings = normalizar_filas(embeddings).reshape(len(ids), -1)
+        if len(ids) == 0:
+            return
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = embeddings.shape[1]
+            elif embeddings.shape[1] != self.dimension:
+                raise ValueError(f"Embedding de dimensión {embeddings.shape[1]}, el índice usa {self.dimension}")
+            fin = self.total + len(ids)
+            if fin > self.capacidad:
+                self._reservar(max(fin, 2 * self.capacidad, self.capacidad_inicial))
+            self.vectores[self.total:fin] = embeddings
+            self.ids[self.total:fin] = ids
+            self.total = fin
+            self._guardar_disco()
+    
+    def buscar(self, embedding, k=5, excluir=()):
+        """Los k vectores más parecidos por similitud coseno; devuelve [(id, similitud)] de mayor a menor"""
+        with self._lock:
+            vectores, ids, total = self.vectores, self.ids, self.total
+        if total == 0:
+            return []
+        consulta = normalizar_filas(embedding).reshape(-1)
+        if consulta.size != vectores.shape[1]:
+            raise ValueError(f"Embedding de dimensión {consulta.size}, el índice usa {vectores.shape[1]}")
+        
+        similitudes = np.empty(total, dtype=np.float32)
+        bloque = np.empty((min(BLOQUE_BUSQUEDA, total), vectores.shape[1]), dtype=np.float32)
+        for inicio in range(0, total, BLOQUE_BUSQUEDA):
+            fin = min(inicio + BLOQUE_BUSQUEDA, total)
+            convertido = bloque[:fin - inicio]
+            np.copyto(convertido, vectores[inicio:fin])
+            np.dot(convertido, consulta, out=similitudes[inicio:fin])
+        if excluir:
+            similitudes[np.isin(ids[:total], list(excluir))] = -np.inf
+        
+        k = min(k, total)
+        mejores = np.argpartition(similitudes, total - k)[total - k:]
+        mejores = mejores[np.argsort(similitudes[mejores])[::-1]]
+        return [(int(ids[i]), float(similitudes[i])) for i in mejores if np.isfinite(similitudes[i])]
+    
+    def reiniciar(self):
+        """Vacía el índice (por ejemplo tras limpiar el historial)"""
+        with self._lock:
+            self._reiniciar()
+    
+    def _reiniciar(self):
+        self._vaciar_mapas()
+        self._vaciar()
+        if self.ruta is not None:
+            for archivo in self._archivos():
+                if os.path.exists(archivo):
+                    os.remove(archivo)
+    
+    def descartar_hasta(self, id_maximo):
+        """Quita los vectores con id hasta id_maximo (las predicciones borradas) y conserva los posteriores"""
+        with self._lock:
+            conservar = np.flatnonzero(self.ids[:self.total] > id_maximo)
+            if len(conservar) == 0:
+                self._reiniciar()
+                return
+            # La indexación con una lista copia antes de escribir: se puede compactar sobre el mismo array
+            self.vectores[:len(conservar)] = self.vectores[conservar]
+            self.ids[:len(conservar)] = self.ids[conservar]
+            self.total = len(conservar)
+            self._guardar_disco()
+    
+    def _cargar_disco(self):
+        if self.ruta is None:
+            return
+        ruta_vectores, ruta_ids, ruta_meta = self._archivos()
+        if not os.path.exists(ruta_meta):
+            return
+        try:
+            with open(ruta_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dimension = meta["dimension"]
+            capacidad = os.path.getsize(ruta_vectores) // (self.dimension * 2)
+            if meta["total"] > capacidad or os.path.getsize(ruta_ids) // 8 < capacidad:
+                raise ValueError("Archivos del índice incompletos")
+            self.total = meta["total"]
+            self._reservar(capacidad)
+        except (OSError, ValueError, KeyError, ZeroDivisionError, TypeError):
+            # Un índice corrupto no debe impedir el arranque: se empieza uno nuevo
+            self._vaciar()
+    
+    def _guardar_disco(self):
+        if self.ruta is None:
+            return
+        self._vaciar_mapas()
+        try:
+            _, _, ruta_meta = self._archivos()
+            temporal = f"{ruta_meta}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({"dimension": self.dimension, "total": self.total}, f)
+            os.replace(temporal, ruta_meta)
+        except OSError:
+            pass
@@ -0,0 +1,433 @@
+"""Carga del modelo, preprocesamiento y predicción compartidos por la app y la API"""
+import atexit
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from metricas import METRICAS
+from microlotes import PlanificadorMicrolotes
+
+RUTA_MODELO = os.environ.get("RUTA_MODELO", "modelo_parkinson.h5")
+RUTA_MODELO_TFLITE = os.environ.get("RUTA_MODELO_TFLITE", "modelo_parkinson.tflite")
+BACKEND_INFERENCIA = os.environ.get("BACKEND_INFERENCIA", "keras")  # "keras" o "tflite"
+TAMANO_ENTRADA = (224, 224)
+TAMANO_LOTE = 32
+UMBRAL_PARKINSON = 0.5
+MICROLOTE_MAX = int(os.environ.get("MICROLOTE_MAX", "16"))
+MICROLOTE_ESPERA_MS = float(os.environ.get("MICROLOTE_ESPERA_MS", "10"))
+# Decodificar los JPEG directamente a una escala reducida cercana a 224x224
+DECODIFICACION_REDUCIDA = os.environ.get("DECODIFICACION_REDUCIDA", "1") == "1"
+# El modelo incluye la división entre 255 y recibe los píxeles sin normalizar
+NORMALIZACION_EN_MODELO = os.environ.get("NORMALIZACION_EN_MODELO", "0") == "1"
+# El modelo Keras devuelve también el embedding de la penúltima capa (o de CAPA_EMBEDDING)
+EMBEDDINGS = os.environ.get("EMBEDDINGS", "1") == "1"
+CAPA_EMBEDDING = os.environ.get("CAPA_EMBEDDING") or None
+
+logger = logging.getLogger("detector_parkinson")
+
+def ruta_metadatos_tflite(ruta):
+    """Archivo JSON que convertir_modelo.py guarda junto al .tflite"""
+    return f"{ruta}.json"
+
+def leer_metadatos_tflite(ruta):
+    """Metadatos de la conversión; sin archivo, los de antes de NORMALIZACION_EN_MODELO (sin normalización)"""
+    try:
+        with open(ruta_metadatos_tflite(ruta), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"normalizacion_en_modelo": False}
+
+class ModeloTFLite:
+    """Intérprete TFLite con la misma interfaz predict() que el modelo Keras"""
+    
+    def __init__(self, ruta):
+        # La división entre 255 va dentro del .tflite o en el preprocesamiento, nunca en los dos ni en ninguno
+        normalizacion = bool(leer_metadatos_tflite(ruta).get("normalizacion_en_modelo", False))
+        if normalizacion != NORMALIZACION_EN_MODELO:
+            raise ValueError(
+                f"{ruta} se convirtió con normalizacion_en_modelo={int(normalizacion)} y NORMALIZACION_EN_MODELO="
+                f"{int(NORMALIZACION_EN_MODELO)}: vuelve a convertirlo o cambia la variable"
+            )
+        try:
+            # tflite-runtime evita cargar TensorFlow completo
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interprete = Interpreter(model_path=ruta)
+        self.entrada = self.interprete.get_input_details()[0]
+        self.salida = self.interprete.get_output_details()[0]
+        self.tamano_lote = None
+        self._lock = threading.Lock()
+    
+    def _preparar(self, tamano_lote):
+        if tamano_lote != self.tamano_lote:
+            self.interprete.resize_tensor_input(self.entrada["index"], [tamano_lote, *TAMANO_ENTRADA, 3])
+            self.interprete.allocate_tensors()
+            self.entrada = self.interprete.get_input_details()[0]
+            self.salida = self.interprete.get_output_details()[0]
+            self.tamano_lote = tamano_lote
+    
+    def predict(self, lote, batch_size=None, verbose=0):
+        lote = np.asarray(lote, dtype=np.float32)
+        escala, cero = self.entrada["quantization"]
+        if escala:
+            # Modelos cuantizados a int8 también en la entrada
+            lote = np.round(lote / escala + cero).astype(self.entrada["dtype"])
+        with self._lock:
+            self._preparar(len(lote))
+            self.interprete.set_tensor(self.entrada["index"], lote)
+            self.interprete.invoke()
+            salida = self.interprete.get_tensor(self.salida["index"]).astype(np.float32)
+        escala, cero = self.salida["quantization"]
+        if escala:
+            salida = (salida - cero) * escala
+        return salida
+
+class ModeloConEmbedding:
+    """Modelo Keras con dos salidas (embedding, probabilidad); predict() devuelve solo la probabilidad"""
+    
+    def __init__(self, modelo):
+        self.modelo = modelo
+    
+    def predict(self, lote, batch_size=None, verbose=0):
+        return self.predict_con_embedding(lote, batch_size, verbose)[0]
+    
+    def predict_con_embedding(self, lote, batch_size=None, verbose=0):
+        embeddings, salida = self.modelo.predict(lote, batch_size=batch_size, verbose=verbose)
+        return salida, embeddings
+
+def cargar_modelo(ruta=None, backend=BACKEND_INFERENCIA, embeddings=EMBEDDINGS):
+    """Carga el modelo Keras o su versión TFLite según el backend elegido"""
+    if backend == "tflite":
+        return ModeloTFLite(ruta or RUTA_MODELO_TFLITE)
+    if backend != "keras":
+        raise ValueError(f"Backend de inferencia desconocido: {backend}")
+    import tensorflow as tf
+    modelo = tf.keras.models.load_model(ruta or RUTA_MODELO)
+    if embeddings:
+        modelo = agregar_salida_embedding(modelo)
+    if NORMALIZACION_EN_MODELO:
+        modelo = envolver_normalizacion(modelo)
+    return ModeloConEmbedding(modelo) if embeddings else modelo
+
+def agregar_salida_embedding(modelo, capa=CAPA_EMBEDDING):
+    """Modelo con la salida de la penúltima capa (aplanada) además de la probabilidad, en la misma pasada"""
+    import tensorflow as tf
+    intermedia = modelo.get_layer(capa) if capa else modelo.layers[-2]
+    embedding = tf.keras.layers.Flatten()(intermedia.output)
+    return tf.keras.Model(modelo.inputs, [embedding, modelo.outputs[0]])
+
+def envolver_normalizacion(modelo):
+    """Antepone al modelo Keras una capa que divide los píxeles entre 255"""
+    import tensorflow as tf
+    entrada = tf.keras.Input(shape=(*TAMANO_ENTRADA, 3))
+    salida = modelo(tf.keras.layers.Rescaling(1 / 255.0)(entrada))
+    return tf.keras.Model(entrada, salida)
+
+def calentar_modelo(modelo):
+    """Ejecuta una pasada con una imagen vacía para que el primer paciente no pague el trazado del grafo"""
+    modelo.predict(np.zeros((1, *TAMANO_ENTRADA, 3), dtype=np.float32), verbose=0)
+
+class ModeloEnSegundoPlano:
+    """Carga y calienta el modelo en un hilo aparte; predict() espera solo si aún no está listo"""
+    
+    def __init__(self, cargar=cargar_modelo):
+        self.cargar = cargar
+        self.modelo = None
+        self.error = None
+        self.tiempos = {}
+        self._listo = threading.Event()
+        threading.Thread(target=self._cargar, name="carga-modelo", daemon=True).start()
+    
+    def _cargar(self):
+        try:
+            inicio = time.perf_counter()
+            modelo = self.cargar()
+            self.tiempos["carga_modelo"] = time.perf_counter() - inicio
+            
+            inicio = time.perf_counter()
+            calentar_modelo(modelo)
+            self.tiempos["calentamiento"] = time.perf_counter() - inicio
+            self.modelo = modelo
+            logger.info(
+                "Modelo listo: carga %.2f s, calentamiento %.2f s",
+                self.tiempos["carga_modelo"], self.tiempos["calentamiento"]
+            )
+        except Exception as e:
+            self.error = e
+            logger.exception("Error al cargar el modelo")
+        finally:
+            self._listo.set()
+    
+    @property
+    def listo(self):
+        return self._listo.is_set()
+    
+    def obtener(self, timeout=None):
+        """Devuelve el modelo cargado, esperando a que termine la carga"""
+        self._listo.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.modelo
+    
+    def predict(self, lote, batch_size=None, verbose=0):
+        return self.obtener().predict(lote, batch_size=batch_size, verbose=verbose)
+    
+    def predict_con_embedding(self, lote, batch_size=None, verbose=0):
+        return predecir_con_embedding(self.obtener(), lote, batch_size)
+
+def predecir_con_embedding(modelo, lote, batch_size=None):
+    """Salida del modelo y embeddings de la misma pasada; los embeddings son None si el modelo no los da"""
+    if hasattr(modelo, "predict_con_embedding"):
+        return modelo.predict_con_embedding(lote, batch_size=batch_size, verbose=0)
+    return modelo.predict(lote, batch_size=batch_size, verbose=0), None
+
+def crear_planificador(modelo, max_lote=MICROLOTE_MAX, max_espera_ms=MICROLOTE_ESPERA_MS):
+    """Crea la cola de micro-lotes que comparten todas las peticiones de una sola imagen"""
+    def funcion_lote(lote):
+        # Cada entrada recibe (probabilidad, embedding o None)
+        salida, embeddings = predecir_con_embedding(modelo, lote)
+        return list(zip(salida[:, 0], embeddings if embeddings is not None else [None] * len(lote)))
+    return PlanificadorMicrolotes(funcion_lote, max_lote, max_espera_ms)
+
+def resultado_prediccion(probabilidad):
+    """Traduce una probabilidad al texto de resultado guardado en el historial"""
+    return "Parkinson detectado" if probabilidad > UMBRAL_PARKINSON else "Saludable"
+
+def identidad_modelo(ruta=None, backend=BACKEND_INFERENCIA):
+    """Identifica el modelo que produce las probabilidades: archivo (ruta, tamaño, fecha), backend y normalización
+    
+    Una caché guardada con otra identidad es de otro modelo y no se reutiliza.
+    """
+    ruta = ruta or (RUTA_MODELO_TFLITE if backend == "tflite" else RUTA_MODELO)
+    try:
+        estado = os.stat(ruta)
+        archivo = f"{os.path.abspath(ruta)}:{estado.st_size}:{estado.st_mtime_ns}"
+    except OSError:
+        archivo = os.path.abspath(ruta)
+    return f"{backend}|{archivo}|normalizacion_en_modelo={int(NORMALIZACION_EN_MODELO)}"
+
+class CachePredicciones:
+    """Caché LRU de probabilidades indexada por el hash de la imagen normalizada
+    
+    Junto a cada probabilidad guarda el embedding en float16 (si el modelo lo calcula), para que
+    una imagen repetida también muestre e indexe casos similares. Con `ruta` se conserva entre reinicios. El archivo guarda la identidad del modelo y se descarta
+    si no coincide con `modelo`. Se escribe como mucho cada `intervalo_guardado_s` segundos, fuera
+    del lock, y al salir del proceso.
+    """
+    
+    def __init__(self, capacidad=1024, ruta=None, modelo=None, intervalo_guardado_s=30.0):
+        self.capacidad = capacidad
+        self.ruta = ruta
+        self.modelo = modelo
+        self.intervalo_guardado_s = intervalo_guardado_s
+        self.entradas = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._lock_disco = threading.Lock()
+        self._cambios = False
+        self._ultimo_guardado = time.monotonic()
+        self._cargar_disco()
+        if self.ruta:
+            atexit.register(self.guardar_disco)
+    
+    def obtener(self, clave):
+        """Devuelve la probabilidad guardada o None si no está en caché"""
+        entrada = self.obtener_con_embedding(clave)
+        return None if entrada is None else entrada[0]
+    
+    def obtener_con_embedding(self, clave):
+        """Devuelve (probabilidad, embedding float16 o None), o None si no está en caché"""
+        with self._lock:
+            if clave not in self.entradas:
+                self.fallos += 1
+                return None
+            self.entradas.move_to_end(clave)
+            self.aciertos += 1
+            return self.entradas[clave]
+    
+    def guardar(self, clave, probabilidad, embedding=None):
+        """Guarda una probabilidad y expulsa la entrada menos usada si se supera la capacidad"""
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float16).reshape(-1)
+        with self._lock:
+            self.entradas[clave] = (float(probabilidad), embedding)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.capacidad:
+                self.entradas.popitem(last=False)
+            self._cambios = True
+            pendiente = time.monotonic() - self._ultimo_guardado >= self.intervalo_guardado_s
+        if pendiente:
+            self.guardar_disco()
+    
+    def estadisticas(self):
+        """Devuelve los contadores de aciertos y fallos de la caché"""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "entradas": len(self.entradas),
+                "capacidad": self.capacidad
+            }
+    
+    def _cargar_disco(self):
+        if not self.ruta or not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                guardado = json.load(f)
+            # Los archivos sin identidad son de versiones anteriores y también se descartan
+            if not isinstance(guardado, dict) or guardado.get("modelo") != self.modelo:
+                logger.info("Caché de predicciones de otro modelo en %s: se descarta", self.ruta)
+                return
+            for clave, probabilidad, embedding in guardado["entradas"]:
+                if embedding is not None:
+                    embedding = np.frombuffer(base64.b64decode(embedding), dtype=np.float16)
+                self.entradas[clave] = (probabilidad, embedding)
+            while len(self.entradas) > self.capacidad:
+                self.entradas.popitem(last=False)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Una caché corrupta no debe impedir el arranque
+            self.entradas.clear()
+    
+    def guardar_disco(self):
+        """Escribe la caché en `ruta` si cambió desde la última vez"""
+        if not self.ruta:
+            return
+        with self._lock_disco:
+            with self._lock:
+                if not self._cambios:
+                    return
+                entradas = [
+                    [clave, probabilidad, None if embedding is None else base64.b64encode(embedding.tobytes()).decode("ascii")]
+                    for clave, (probabilidad, embedding) in self.entradas.items()
+                ]
+                self._cambios = False
+                self._ultimo_guardado = time.monotonic()
+            try:
+                temporal = f"{self.ruta}.tmp"
+                with open(temporal, "w", encoding="utf-8") as f:
+                    json.dump({"modelo": self.modelo, "entradas": entradas}, f)
+                os.replace(temporal, self.ruta)
+            except OSError as e:
+                self._cambios = True
+                logger.warning("No se pudo guardar la caché de predicciones: %s", e)
+
+def abrir_imagen(origen):
+    """Abre una imagen; los JPEG se decodifican a escala reducida si la opción está activa"""
+    imagen = Image.open(origen)
+    if DECODIFICACION_REDUCIDA and imagen.format == "JPEG":
+        # La escala elegida por draft() siempre es mayor o igual que el tamaño pedido
+        imagen.draft("RGB", TAMANO_ENTRADA)
+    return imagen
+
+def redimensionar(imagen):
+    """Convierte la imagen a RGB de 224x224 y devuelve sus píxeles uint8"""
+    if imagen.mode != "RGB":
+        imagen = imagen.convert("RGB")
+    return np.asarray(imagen.resize(TAMANO_ENTRADA))
+
+def normalizar_en(pixeles, destino):
+    """Copia píxeles uint8 a un arreglo float32 ya reservado y los normaliza en el mismo sitio"""
+    np.copyto(destino, pixeles, casting="unsafe")
+    if not NORMALIZACION_EN_MODELO:
+        np.divide(destino, 255.0, out=destino)
+    return destino
+
+def preprocesar_en(imagen, destino):
+    """Escribe la imagen redimensionada (y normalizada) directamente en un arreglo float32 de 224x224x3"""
+    return normalizar_en(redimensionar(imagen), destino)
+
+def preprocesar_lote(imagenes):
+    """Preprocesa varias imágenes sobre un único búfer float32 reservado de antemano"""
+    lote = np.empty((len(imagenes), *TAMANO_ENTRADA, 3), dtype=np.float32)
+    for imagen, destino in zip(imagenes, lote):
+        preprocesar_en(imagen, destino)
+    return lote
+
+def preprocesar_imagen(imagen):
+    """Convierte una imagen PIL en un arreglo normalizado de 224x224x3"""
+    return preprocesar_en(imagen, np.empty((*TAMANO_ENTRADA, 3), dtype=np.float32))
+
+def preprocesar_medido(imagenes):
+    """preprocesar_lote midiendo por separado la decodificación y el preprocesamiento"""
+    # Pillow decodifica de forma diferida: load() fuerza la decodificación para medirla aparte
+    with METRICAS.medir("decodificacion"):
+        for imagen in imagenes:
+            imagen.load()
+    with METRICAS.medir("preprocesamiento"):
+        return preprocesar_lote(imagenes)
+
+def clave_imagen(img_array):
+    """Calcula la clave de caché a partir del arreglo normalizado de la imagen"""
+    return hashlib.sha256(np.ascontiguousarray(img_array, dtype=np.float32)).hexdigest()
+
+@METRICAS.cronometrar("predecir_imagen")
+def predecir_imagen(modelo, imagen, cache=None, planificador=None, con_embedding=False):
+    """Predice una imagen, consultando primero la caché y usando la cola de micro-lotes si se indican
+    
+    Con con_embedding=True devuelve (probabilidad, embedding); el embedding es None si el modelo
+    no lo calcula. Los aciertos de caché devuelven el embedding guardado (en float16).
+    """
+    lote = preprocesar_medido([imagen])
+    img_array = lote[0]
+    clave = clave_imagen(img_array)
+    if cache is not None:
+        entrada = cache.obtener_con_embedding(clave)
+        if entrada is not None:
+            return entrada if con_embedding else entrada[0]
+    with METRICAS.medir("modelo"):
+        if planificador is not None:
+            pred, embedding = planificador.predecir(img_array)
+        else:
+            salida, embeddings = predecir_con_embedding(modelo, lote)
+            pred, embedding = salida[0][0], None if embeddings is None else embeddings[0]
+    if cache is not None:
+        cache.guardar(clave, pred, embedding)
+    return (pred, embedding) if con_embedding else pred
+
+@METRICAS.cronometrar("predecir_lote")
+def predecir_lote(modelo, imagenes, cache=None, tamano_lote=TAMANO_LOTE, con_embedding=False):
+    """Predice varias imágenes en lotes de tensores en lugar de una por una
+    
+    Con con_embedding=True devuelve (probabilidades, embeddings); los embeddings son None si el
+    modelo no los calcula.
+    """
+    embeddings = [None] * len(imagenes)
+    if len(imagenes) == 0:
+        return (np.empty(0, dtype=np.float32), embeddings) if con_embedding else np.empty(0, dtype=np.float32)
+    lote = preprocesar_medido(imagenes)
+    claves = [clave_imagen(img_array) for img_array in lote]
+    
+    preds = np.empty(len(lote), dtype=np.float32)
+    pendientes = []
+    for i, clave in enumerate(claves):
+        entrada = cache.obtener_con_embedding(clave) if cache is not None else None
+        if entrada is None:
+            pendientes.append(i)
+        else:
+            preds[i], embeddings[i] = entrada
+    
+    # Solo las imágenes que no están en caché pasan por el modelo
+    if pendientes:
+        with METRICAS.medir("modelo"):
+            salida, nuevos_embeddings = predecir_con_embedding(modelo, lote[pendientes], tamano_lote)
+        for posicion, (i, pred) in enumerate(zip(pendientes, salida[:, 0])):
+            preds[i] = pred
+            if nuevos_embeddings is not None:
+                embeddings[i] = nuevos_embeddings[posicion]
+            if cache is not None:
+                cache.guardar(claves[i], pred, embeddings[i])
+    return (preds, embeddings) if con_embedding else preds
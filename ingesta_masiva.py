@@ -0,0 +1,124 @@
+"""Re-evaluación masiva de un archivo de trazos con decodificación en paralelo
+
+Las imágenes se decodifican y redimensionan en un pool de procesos, se agrupan en lotes de
+tamaño fijo para el modelo y los resultados se guardan en la tabla de predicciones.
+
+Uso:
+    python ingesta_masiva.py archivo/ --trabajadores 4 --tamano-lote 32
+    python ingesta_masiva.py archivo/ --stub --salida resultados.csv   # sin Supabase
+"""
+import argparse
+import csv
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from agregados import AgregadosPredicciones
+from almacenamiento import crear_cliente, insertar_predicciones
+from inferencia import TAMANO_ENTRADA, TAMANO_LOTE, abrir_imagen, cargar_modelo, normalizar_en, redimensionar
+
+EXTENSIONES = (".jpg", ".jpeg", ".png")
+
+def listar_archivos(carpeta):
+    """Devuelve las rutas de todas las imágenes de la carpeta, recursivamente y en orden"""
+    rutas = []
+    for raiz, _, archivos in os.walk(carpeta):
+        rutas.extend(os.path.join(raiz, a) for a in sorted(archivos) if a.lower().endswith(EXTENSIONES))
+    return sorted(rutas)
+
+def decodificar_archivo(ruta):
+    """Trabajo de cada proceso: decodifica y redimensiona; devuelve píxeles uint8 o el error"""
+    try:
+        return ruta, redimensionar(abrir_imagen(ruta)), None
+    except Exception as e:
+        return ruta, None, str(e)
+
+def decodificar_en_paralelo(rutas, trabajadores, en_vuelo=None):
+    """Genera (ruta, píxeles, error) en orden, con un número acotado de imágenes decodificadas en espera"""
+    if trabajadores <= 1:
+        for ruta in rutas:
+            yield decodificar_archivo(ruta)
+        return
+    en_vuelo = en_vuelo or trabajadores * 8
+    with ProcessPoolExecutor(trabajadores) as pool:
+        pendientes = deque()
+        for ruta in rutas:
+            pendientes.append(pool.submit(decodificar_archivo, ruta))
+            if len(pendientes) >= en_vuelo:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+
+def lotes_preprocesados(decodificadas, tamano_lote):
+    """Agrupa las imágenes decodificadas en lotes fijos sobre un mismo búfer float32"""
+    buffer = np.empty((tamano_lote, *TAMANO_ENTRADA, 3), dtype=np.float32)
+    rutas = []
+    for ruta, pixeles, error in decodificadas:
+        if error is not None:
+            print(f"⚠️ {ruta}: {error}")
+            continue
+        normalizar_en(pixeles, buffer[len(rutas)])
+        rutas.append(ruta)
+        if len(rutas) == tamano_lote:
+            yield rutas, buffer
+            rutas = []
+    if rutas:
+        yield rutas, buffer[:len(rutas)]
+
+def nombre_paciente(ruta, por_carpeta):
+    """El paciente es el nombre de la carpeta que contiene la imagen o el nombre del archivo"""
+    if por_carpeta:
+        return os.path.basename(os.path.dirname(ruta))
+    return os.path.splitext(os.path.basename(ruta))[0]
+
+def ingerir(rutas, modelo, cliente, trabajadores, tamano_lote=TAMANO_LOTE, por_carpeta=False, escritor_csv=None):
+    """Evalúa todas las rutas y guarda un insert masivo por lote; devuelve (imágenes, segundos)"""
+    inicio = time.perf_counter()
+    procesadas = 0
+    agregados = AgregadosPredicciones(cliente) if cliente is not None else None
+    for rutas_lote, lote in lotes_preprocesados(decodificar_en_paralelo(rutas, trabajadores), tamano_lote):
+        probabilidades = modelo.predict(lote, batch_size=tamano_lote, verbose=0)[:, 0]
+        fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        registros = [
+            (nombre_paciente(ruta, por_carpeta), probabilidad, fecha_hora)
+            for ruta, probabilidad in zip(rutas_lote, probabilidades)
+        ]
+        if cliente is not None:
+            insertar_predicciones(cliente, registros, agregados=agregados)
+        if escritor_csv is not None:
+            escritor_csv.writerows(
+                (ruta, nombre, f"{probabilidad:.6f}") for ruta, (nombre, probabilidad, _) in zip(rutas_lote, registros)
+            )
+        procesadas += len(rutas_lote)
+    return procesadas, time.perf_counter() - inicio
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("carpeta")
+    parser.add_argument("--trabajadores", type=int, default=os.cpu_count())
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE)
+    parser.add_argument("--por-carpeta", action="store_true", help="Usar la carpeta de cada imagen como nombre del paciente")
+    parser.add_argument("--stub", action="store_true", help="No guardar las predicciones")
+    parser.add_argument("--salida", help="Guardar también los resultados en un CSV")
+    args = parser.parse_args()
+    
+    rutas = listar_archivos(args.carpeta)
+    cliente = None if args.stub else crear_cliente()
+    modelo = cargar_modelo()
+    
+    archivo_csv = open(args.salida, "w", newline="", encoding="utf-8") if args.salida else None
+    try:
+        escritor = csv.writer(archivo_csv) if archivo_csv else None
+        if escritor:
+            escritor.writerow(["archivo", "nombre", "probabilidad"])
+        procesadas, segundos = ingerir(
+            rutas, modelo, cliente, args.trabajadores, args.tamano_lote, args.por_carpeta, escritor
+        )
+    finally:
+        if archivo_csv:
+            archivo_csv.close()
+    print(f"{procesadas} de {len(rutas)} imágenes en {segundos:.1f} s ({procesadas / segundos:.1f} img/s, {args.trabajadores} trabajadores)")
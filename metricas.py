@@ -0,0 +1,122 @@
+"""Latencias por etapa (decodificación, preprocesamiento, modelo, Supabase, historial, gráficos)
+
+Cada etapa guarda sus últimas mediciones en una ventana deslizante para calcular p50/p95/p99,
+y además el conteo y la suma totales para exportarlas en formato de texto de Prometheus.
+"""
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+class MetricasLatencia:
+    """Guarda las últimas latencias de cada ruta o etapa y calcula sus percentiles"""
+    
+    def __init__(self, ventana=10000):
+        self.ventana = ventana
+        self.latencias = {}
+        self.errores = {}
+        self.totales = {}  # ruta -> [conteo, suma en segundos] desde el arranque
+        self._lock = threading.Lock()
+    
+    def registrar(self, ruta, segundos, error=False):
+        with self._lock:
+            self.latencias.setdefault(ruta, deque(maxlen=self.ventana)).append(segundos)
+            total = self.totales.setdefault(ruta, [0, 0.0])
+            total[0] += 1
+            total[1] += segundos
+            if error:
+                self.errores[ruta] = self.errores.get(ruta, 0) + 1
+    
+    def reiniciar(self):
+        """Olvida todas las mediciones (por ejemplo entre escenarios de una prueba de carga)"""
+        with self._lock:
+            self.latencias.clear()
+            self.errores.clear()
+            self.totales.clear()
+    
+    @contextmanager
+    def medir(self, ruta):
+        """Mide el bloque `with`; si lanza una excepción se cuenta como error"""
+        inicio = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.registrar(ruta, time.perf_counter() - inicio, error)
+    
+    def cronometrar(self, ruta):
+        """Decorador que mide cada llamada a la función"""
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with self.medir(ruta):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+    
+    def resumen(self):
+        with self._lock:
+            copia = {ruta: np.array(valores) for ruta, valores in self.latencias.items()}
+            errores = dict(self.errores)
+        resumen = {}
+        for ruta, valores in copia.items():
+            p50, p95, p99 = np.percentile(valores, [50, 95, 99]) * 1000
+            resumen[ruta] = {
+                "peticiones": int(valores.size),
+                "errores": errores.get(ruta, 0),
+                "media_ms": float(valores.mean() * 1000),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99)
+            }
+        return resumen
+    
+    def a_prometheus(self, nombre="detector_parkinson_latencia_segundos", etiqueta="etapa"):
+        """Exporta las latencias como un summary de Prometheus (cuantiles de la ventana deslizante)"""
+        with self._lock:
+            copia = {ruta: np.array(valores) for ruta, valores in self.latencias.items()}
+            totales = {ruta: tuple(total) for ruta, total in self.totales.items()}
+            errores = dict(self.errores)
+        lineas = [f"# HELP {nombre} Latencia por {etiqueta} en segundos", f"# TYPE {nombre} summary"]
+        for ruta, valores in sorted(copia.items()):
+            for cuantil, valor in zip(("0.5", "0.95", "0.99"), np.percentile(valores, [50, 95, 99])):
+                lineas.append(f'{nombre}{{{etiqueta}="{ruta}",quantile="{cuantil}"}} {valor:.6f}')
+            conteo, suma = totales[ruta]
+            lineas.append(f'{nombre}_count{{{etiqueta}="{ruta}"}} {conteo}')
+            lineas.append(f'{nombre}_sum{{{etiqueta}="{ruta}"}} {suma:.6f}')
+        nombre_errores = nombre.replace("latencia_segundos", "errores_total")
+        lineas += [f"# HELP {nombre_errores} Errores por {etiqueta}", f"# TYPE {nombre_errores} counter"]
+        for ruta in sorted(copia):
+            lineas.append(f'{nombre_errores}{{{etiqueta}="{ruta}"}} {errores.get(ruta, 0)}')
+        return "\n".join(lineas) + "\n"
+
+# Registro compartido por todo el proceso para las etapas internas
+METRICAS = MetricasLatencia()
+
+def iniciar_servidor_metricas(puerto, host="127.0.0.1", metricas=METRICAS):
+    """Sirve GET /metrics en formato Prometheus desde un hilo en segundo plano"""
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            datos = metricas.a_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+        
+        def log_message(self, formato, *args):
+            pass
+    
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="servidor-metricas").start()
+    return servidor
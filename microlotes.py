@@ -0,0 +1,87 @@
+"""Planificador de micro-lotes: agrupa peticiones concurrentes en una sola llamada al modelo"""
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+class PlanificadorMicrolotes:
+    """Cola compartida que junta hasta max_lote entradas o espera como mucho max_espera_ms"""
+    
+    def __init__(self, funcion_lote, max_lote=16, max_espera_ms=10, ventana=10000):
+        self.funcion_lote = funcion_lote
+        self.max_lote = max_lote
+        self.max_espera = max_espera_ms / 1000
+        self.cola = queue.Queue()
+        self.histograma_lotes = Counter()
+        self.profundidades = deque(maxlen=ventana)
+        self.latencias = deque(maxlen=ventana)
+        self._lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._bucle, name="planificador-microlotes", daemon=True)
+        self._hilo.start()
+    
+    def enviar(self, entrada):
+        """Encola una entrada y devuelve un Future con su salida"""
+        futuro = Future()
+        self.cola.put((entrada, futuro, time.perf_counter()))
+        return futuro
+    
+    def predecir(self, entrada, timeout=None):
+        """Encola una entrada y espera su resultado"""
+        return self.enviar(entrada).result(timeout)
+    
+    def _bucle(self):
+        while True:
+            lote = [self.cola.get()]
+            limite = time.perf_counter() + self.max_espera
+            while len(lote) < self.max_lote:
+                restante = limite - time.perf_counter()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self.cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._procesar(lote)
+    
+    def _procesar(self, lote):
+        entradas, futuros, encolados = zip(*lote)
+        try:
+            salidas = self.funcion_lote(np.stack(entradas))
+        except Exception as e:
+            for futuro in futuros:
+                futuro.set_exception(e)
+        else:
+            for futuro, salida in zip(futuros, salidas):
+                futuro.set_result(salida)
+        
+        fin = time.perf_counter()
+        with self._lock:
+            self.histograma_lotes[len(lote)] += 1
+            # Peticiones que quedaron esperando mientras se procesaba este lote
+            self.profundidades.append(self.cola.qsize())
+            self.latencias.extend(fin - encolado for encolado in encolados)
+    
+    def estadisticas(self):
+        """Devuelve el histograma de tamaños de lote, la profundidad de cola y las latencias"""
+        with self._lock:
+            histograma = dict(sorted(self.histograma_lotes.items()))
+            profundidades = np.array(self.profundidades)
+            latencias = np.array(self.latencias)
+        lotes = sum(histograma.values())
+        solicitudes = sum(tamano * veces for tamano, veces in histograma.items())
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99]) * 1000 if latencias.size else (0.0, 0.0, 0.0)
+        return {
+            "lotes": lotes,
+            "solicitudes": solicitudes,
+            "lote_medio": solicitudes / lotes if lotes else 0.0,
+            "histograma_lotes": histograma,
+            "cola_actual": self.cola.qsize(),
+            "cola_maxima": int(profundidades.max()) if profundidades.size else 0,
+            "cola_media": float(profundidades.mean()) if profundidades.size else 0.0,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99)
+        }
@@ -0,0 +1,56 @@
+"""Migración única del feedback en texto ("👍 Sí | comentario") a las columnas `correcta` y `comentario`
+
+Antes de ejecutarla en Supabase hay que crear las columnas (ver README). Solo toca las filas con
+texto en `feedback` y `correcta` vacía, así que puede repetirse sin riesgo; la columna `feedback`
+no se modifica. Al terminar recalcula los agregados del panel.
+
+Uso:
+    python migrar_feedback.py --simular   # solo cuenta lo que se migraría
+    python migrar_feedback.py
+"""
+import argparse
+from collections import defaultdict
+
+from agregados import AgregadosPredicciones
+from almacenamiento import TABLA_PREDICCIONES, crear_cliente, feedback_desde_texto
+
+def migrar_feedback(cliente, tamano_pagina=1000, simular=False):
+    """Rellena correcta/comentario desde el texto; devuelve (migradas, peticiones de actualización)"""
+    migradas = 0
+    peticiones = 0
+    desde_id = 0
+    while True:
+        pagina = (
+            cliente.table(TABLA_PREDICCIONES).select("id,feedback")
+            .not_.is_("feedback", "null").is_("correcta", "null").gt("id", desde_id)
+            .order("id").limit(tamano_pagina).execute().data or []
+        )
+        # Las filas con el mismo valor se actualizan juntas en una sola petición
+        grupos = defaultdict(list)
+        for fila in pagina:
+            valor = feedback_desde_texto(fila["feedback"])
+            if valor is not None:
+                grupos[valor].append(fila["id"])
+        for (correcta, comentario), ids in grupos.items():
+            if not simular:
+                cliente.table(TABLA_PREDICCIONES).update(
+                    {"correcta": correcta, "comentario": comentario}
+                ).in_("id", ids).execute()
+            migradas += len(ids)
+            peticiones += 1
+        if len(pagina) < tamano_pagina:
+            return migradas, peticiones
+        desde_id = pagina[-1]["id"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--simular", action="store_true", help="No escribir, solo contar")
+    args = parser.parse_args()
+
+    cliente = crear_cliente()
+    migradas, peticiones = migrar_feedback(cliente, simular=args.simular)
+    if args.simular:
+        print(f"Se migrarían {migradas} valoraciones en {peticiones} peticiones")
+    else:
+        AgregadosPredicciones(cliente).reconstruir()
+        print(f"✅ {migradas} valoraciones migradas en {peticiones} peticiones; agregados recalculados")
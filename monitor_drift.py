@@ -0,0 +1,225 @@
+"""Detección de drift en streaming sobre las probabilidades predichas
+
+Cada predicción nueva actualiza en O(1) dos detectores:
+- PSI (Population Stability Index) entre una ventana de referencia (las primeras predicciones
+  tras el último reinicio) y una ventana deslizante con las más recientes, con histogramas que
+  se mantienen al entrar y salir cada valor.
+- Page-Hinkley, que acumula las desviaciones respecto a la media y avisa de un cambio
+  sostenido de la media en cualquiera de los dos sentidos.
+
+El estado se guarda en un JSON con la marca de agua (mayor id procesado), así que tras
+reiniciar la app solo se procesan las predicciones posteriores. Como un id menor puede
+confirmarse en Postgres después que uno mayor, también se recuerdan los últimos
+DRIFT_SOLAPE ids procesados: una fila por debajo de la marca de agua que no está entre
+ellos llegó tarde y se procesa.
+"""
+import json
+import math
+import os
+import threading
+from collections import deque
+
+DRIFT_VENTANA = int(os.environ.get("DRIFT_VENTANA", "500"))
+DRIFT_PSI_AVISO = float(os.environ.get("DRIFT_PSI_AVISO", "0.1"))
+DRIFT_PSI_ALERTA = float(os.environ.get("DRIFT_PSI_ALERTA", "0.25"))
+DRIFT_PH_DELTA = float(os.environ.get("DRIFT_PH_DELTA", "0.05"))  # Cambio de media tolerado
+DRIFT_PH_UMBRAL = float(os.environ.get("DRIFT_PH_UMBRAL", "5.0"))
+INTERVALOS_PSI = 10
+MAX_ALERTAS = 20
+DRIFT_SOLAPE = int(os.environ.get("DRIFT_SOLAPE", "1000"))  # Ids recientes recordados para filas que llegan tarde
+
+def _intervalo(probabilidad):
+    return min(int(probabilidad * INTERVALOS_PSI), INTERVALOS_PSI - 1)
+
+def calcular_psi(referencia, actual, total_referencia, total_actual, epsilon=1e-4):
+    """PSI entre dos histogramas de conteos"""
+    psi = 0.0
+    for r, a in zip(referencia, actual):
+        r = max(r / total_referencia, epsilon)
+        a = max(a / total_actual, epsilon)
+        psi += (a - r) * math.log(a / r)
+    return psi
+
+class PageHinkley:
+    """Test de Page-Hinkley de dos colas con media incremental"""
+    
+    def __init__(self, delta=DRIFT_PH_DELTA, umbral=DRIFT_PH_UMBRAL):
+        self.delta = delta
+        self.umbral = umbral
+        self.reiniciar()
+    
+    def reiniciar(self):
+        self.n = 0
+        self.media = 0.0
+        self.suma_subida = 0.0  # Desviaciones acumuladas hacia arriba (se recorta en 0)
+        self.suma_bajada = 0.0
+    
+    def actualizar(self, valor):
+        """Añade un valor; devuelve "subida", "bajada" o None"""
+        self.n += 1
+        self.media += (valor - self.media) / self.n
+        self.suma_subida = max(0.0, self.suma_subida + valor - self.media - self.delta)
+        self.suma_bajada = max(0.0, self.suma_bajada + self.media - valor - self.delta)
+        if self.suma_subida > self.umbral:
+            return "subida"
+        if self.suma_bajada > self.umbral:
+            return "bajada"
+        return None
+
+class MonitorDrift:
+    """Ventanas de referencia y reciente con PSI y Page-Hinkley, persistidas en disco"""
+    
+    def __init__(self, ventana=DRIFT_VENTANA, ruta=None):
+        self.ventana = ventana
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._vaciar()
+        self._cargar_disco()
+    
+    def reiniciar(self, guardar=True):
+        """Olvida las ventanas y las alertas (por ejemplo tras limpiar el historial)"""
+        with self._lock:
+            self._vaciar()
+            if guardar:
+                self._guardar_disco()
+    
+    def _vaciar(self):
+        self.ultimo_id = None
+        self.piso_id = None  # Los ids hasta aquí se dan por procesados
+        self.ids_recientes = deque()
+        self.procesadas = 0
+        self.referencia = [0] * INTERVALOS_PSI
+        self.total_referencia = 0
+        self.recientes = deque()
+        self.actual = [0] * INTERVALOS_PSI
+        self.page_hinkley = PageHinkley()
+        self.psi = None
+        self.en_alerta_psi = False
+        self.alertas = []
+    
+    def actualizar(self, prediccion_id, probabilidad, fecha_hora=None):
+        """Procesa una predicción nueva en O(1)"""
+        self.procesadas += 1
+        self.ultimo_id = prediccion_id if self.ultimo_id is None else max(self.ultimo_id, prediccion_id)
+        self.ids_recientes.append(prediccion_id)
+        if len(self.ids_recientes) > DRIFT_SOLAPE:
+            olvidado = self.ids_recientes.popleft()
+            self.piso_id = olvidado if self.piso_id is None else max(self.piso_id, olvidado)
+        intervalo = _intervalo(probabilidad)
+        
+        # Las primeras `ventana` predicciones forman la referencia
+        if self.total_referencia < self.ventana:
+            self.referencia[intervalo] += 1
+            self.total_referencia += 1
+        else:
+            self.recientes.append(intervalo)
+            self.actual[intervalo] += 1
+            if len(self.recientes) > self.ventana:
+                self.actual[self.recientes.popleft()] -= 1
+            if len(self.recientes) == self.ventana:
+                self.psi = calcular_psi(self.referencia, self.actual, self.total_referencia, self.ventana)
+                if self.psi >= DRIFT_PSI_ALERTA and not self.en_alerta_psi:
+                    self._alertar("PSI", f"PSI {self.psi:.3f} ≥ {DRIFT_PSI_ALERTA}", prediccion_id, fecha_hora)
+                # Histéresis: la alerta se rearma solo cuando el PSI vuelve por debajo del aviso
+                self.en_alerta_psi = self.psi >= DRIFT_PSI_ALERTA or (self.en_alerta_psi and self.psi >= DRIFT_PSI_AVISO)
+        
+        sentido = self.page_hinkley.actualizar(probabilidad)
+        if sentido is not None:
+            self._alertar(
+                "Page-Hinkley", f"Cambio sostenido de la probabilidad media ({sentido}), {self.page_hinkley.n} predicciones tras el último aviso",
+                prediccion_id, fecha_hora
+            )
+            self.page_hinkley.reiniciar()
+    
+    def actualizar_filas(self, ids, probabilidades, fechas):
+        """Procesa en orden las filas aún no vistas (posteriores al piso y no recientes) y guarda el estado"""
+        with self._lock:
+            procesadas = 0
+            vistas = set(self.ids_recientes)
+            for prediccion_id, probabilidad, fecha_hora in zip(ids, probabilidades, fechas):
+                if (self.piso_id is not None and prediccion_id <= self.piso_id) or prediccion_id in vistas:
+                    continue
+                vistas.add(prediccion_id)
+                self.actualizar(int(prediccion_id), float(probabilidad), fecha_hora)
+                procesadas += 1
+            if procesadas:
+                self._guardar_disco()
+            return procesadas
+    
+    def _alertar(self, detector, mensaje, prediccion_id, fecha_hora):
+        self.alertas.append({"detector": detector, "mensaje": mensaje, "id": prediccion_id, "fecha_hora": fecha_hora})
+        del self.alertas[:-MAX_ALERTAS]
+    
+    def estado(self):
+        """Resumen para el panel"""
+        with self._lock:
+            if self.psi is None:
+                nivel = "calentando"
+            elif self.psi >= DRIFT_PSI_ALERTA:
+                nivel = "alerta"
+            elif self.psi >= DRIFT_PSI_AVISO:
+                nivel = "aviso"
+            else:
+                nivel = "estable"
+            return {
+                "nivel": nivel,
+                "psi": self.psi,
+                "procesadas": self.procesadas,
+                "referencia": self.total_referencia,
+                "recientes": len(self.recientes),
+                "ventana": self.ventana,
+                "media_reciente": self.page_hinkley.media if self.page_hinkley.n else None,
+                "alertas": list(self.alertas)
+            }
+    
+    def _cargar_disco(self):
+        if not self.ruta or not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                estado = json.load(f)
+            if estado["ventana"] != self.ventana:
+                return  # Con otra ventana el estado guardado no es comparable
+            self.ultimo_id = estado["ultimo_id"]
+            # Un estado anterior al solape no sabe qué ids recientes vio: todo hasta la marca de agua
+            self.piso_id = estado.get("piso_id", self.ultimo_id)
+            self.ids_recientes = deque(estado.get("ids_recientes", []))
+            self.procesadas = estado["procesadas"]
+            self.referencia = estado["referencia"]
+            self.total_referencia = sum(self.referencia)
+            self.recientes = deque(estado["recientes"])
+            self.actual = [0] * INTERVALOS_PSI
+            for intervalo in self.recientes:
+                self.actual[intervalo] += 1
+            self.page_hinkley.n, self.page_hinkley.media, self.page_hinkley.suma_subida, self.page_hinkley.suma_bajada = estado["page_hinkley"]
+            self.psi = estado["psi"]
+            self.en_alerta_psi = estado["en_alerta_psi"]
+            self.alertas = estado["alertas"]
+        except (OSError, ValueError, KeyError):
+            # Un estado corrupto no debe impedir el arranque: se vuelve a empezar
+            self._vaciar()
+    
+    def _guardar_disco(self):
+        if not self.ruta:
+            return
+        ph = self.page_hinkley
+        estado = {
+            "ventana": self.ventana,
+            "ultimo_id": self.ultimo_id,
+            "piso_id": self.piso_id,
+            "ids_recientes": list(self.ids_recientes),
+            "procesadas": self.procesadas,
+            "referencia": self.referencia,
+            "recientes": list(self.recientes),
+            "page_hinkley": [ph.n, ph.media, ph.suma_subida, ph.suma_bajada],
+            "psi": self.psi,
+            "en_alerta_psi": self.en_alerta_psi,
+            "alertas": self.alertas
+        }
+        try:
+            temporal = f"{self.ruta}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(estado, f)
+            os.replace(temporal, self.ruta)
+        except OSError:
+            pass
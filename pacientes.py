@@ -0,0 +1,105 @@
+"""Búsqueda de pacientes y evolución de cada uno por su clave normalizada
+
+Los pacientes se buscan en `pacientes_predicciones` (una fila por nombre distinto): primero por
+prefijo con `like 'texto%'`, que con la intercalación "C" es un rango sobre el índice de `clave`,
+y si faltan resultados por subcadena con `ilike` (en Supabase la sirve un índice de trigramas).
+Los comodines de LIKE que escriba el usuario se escapan y se buscan tal cual. La evolución de un paciente lee solo sus
+filas gracias al índice (paciente_clave, fecha_hora).
+
+Uso:
+    python pacientes.py rellenar [--simular]   # calcula paciente_clave de las filas antiguas
+    python pacientes.py buscar "jose p"
+"""
+import argparse
+from collections import defaultdict
+
+from agregados import TABLA_PACIENTES, AgregadosPredicciones
+from almacenamiento import TABLA_PREDICCIONES, clave_paciente, crear_cliente
+
+MAX_RESULTADOS = 20
+MIN_SUBCADENA = 3  # Con menos letras la subcadena coincide con casi todo
+COLUMNAS_EVOLUCION = "id,nombre,probabilidad,resultado,fecha_hora,correcta"
+
+def escapar_like(texto):
+    """Escapa la barra invertida y los comodines % y _ para que LIKE busque el texto literal"""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def buscar_pacientes(cliente, texto, limite=MAX_RESULTADOS):
+    """Pacientes cuya clave empieza por el texto y, después, los que lo contienen; [{nombre, clave}]"""
+    clave = clave_paciente(texto)
+    if not clave:
+        return []
+    literal = escapar_like(clave)
+    filas = (
+        cliente.table(TABLA_PACIENTES).select("nombre,clave")
+        .like("clave", literal + "%")
+        .order("clave").limit(limite).execute().data or []
+    )
+    if len(filas) < limite and len(clave) >= MIN_SUBCADENA:
+        filas += (
+            cliente.table(TABLA_PACIENTES).select("nombre,clave")
+            .ilike("clave", "%" + literal + "%").order("clave").limit(limite).execute().data or []
+        )
+    # Varios nombres escritos de forma distinta comparten clave: se muestra uno por paciente
+    pacientes = {}
+    for fila in filas:
+        pacientes.setdefault(fila["clave"], {"nombre": fila["nombre"], "clave": fila["clave"]})
+    return list(pacientes.values())[:limite]
+
+def evolucion_paciente(cliente, clave, tamano_pagina=1000):
+    """Todos los análisis de un paciente en orden cronológico"""
+    filas = []
+    while True:
+        pagina = (
+            cliente.table(TABLA_PREDICCIONES).select(COLUMNAS_EVOLUCION)
+            .eq("paciente_clave", clave).order("fecha_hora").order("id")
+            .range(len(filas), len(filas) + tamano_pagina - 1).execute().data or []
+        )
+        filas.extend(pagina)
+        if len(pagina) < tamano_pagina:
+            return filas
+
+def rellenar_claves(cliente, tamano_pagina=1000, simular=False):
+    """Calcula paciente_clave de las filas que no la tienen; devuelve (filas, peticiones de actualización)"""
+    rellenadas = 0
+    peticiones = 0
+    desde_id = 0
+    while True:
+        pagina = (
+            cliente.table(TABLA_PREDICCIONES).select("id,nombre")
+            .is_("paciente_clave", "null").gt("id", desde_id)
+            .order("id").limit(tamano_pagina).execute().data or []
+        )
+        grupos = defaultdict(list)
+        for fila in pagina:
+            grupos[clave_paciente(fila["nombre"])].append(fila["id"])
+        for clave, ids in grupos.items():
+            if not simular:
+                cliente.table(TABLA_PREDICCIONES).update({"paciente_clave": clave}).in_("id", ids).execute()
+            rellenadas += len(ids)
+            peticiones += 1
+        if len(pagina) < tamano_pagina:
+            return rellenadas, peticiones
+        desde_id = pagina[-1]["id"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest="accion", required=True)
+    rellenar = subcomandos.add_parser("rellenar", help="Calcula las claves de las filas antiguas")
+    rellenar.add_argument("--simular", action="store_true", help="No escribir, solo contar")
+    buscar = subcomandos.add_parser("buscar", help="Busca pacientes por prefijo o subcadena")
+    buscar.add_argument("texto")
+    args = parser.parse_args()
+
+    cliente = crear_cliente()
+    if args.accion == "rellenar":
+        rellenadas, peticiones = rellenar_claves(cliente, simular=args.simular)
+        if args.simular:
+            print(f"Se rellenarían {rellenadas} filas en {peticiones} peticiones")
+        else:
+            # Los agregados guardan la clave de cada nombre para el buscador
+            AgregadosPredicciones(cliente).reconstruir()
+            print(f"✅ {rellenadas} filas con clave de paciente en {peticiones} peticiones; agregados recalculados")
+    else:
+        for paciente in buscar_pacientes(cliente, args.texto):
+            print(f"{paciente['nombre']}  ({paciente['clave']})")
@@ -0,0 +1,286 @@
+"""Cliente en memoria con la misma interfaz de consultas que Supabase, para pruebas de carga sin red"""
+import copy
+import re
+import threading
+from dataclasses import dataclass
+
+@dataclass
+class RespuestaMemoria:
+    data: list
+    count: int = None
+
+def _patron_like(patron, opciones=0):
+    """Expresión regular equivalente a un patrón LIKE: % y _ son comodines y \\ los escapa"""
+    partes = []
+    escapado = False
+    for caracter in patron:
+        if not escapado and caracter == "\\":
+            escapado = True
+            continue
+        if not escapado and caracter in "%_":
+            partes.append(".*" if caracter == "%" else ".")
+        else:
+            partes.append(re.escape(caracter))
+        escapado = False
+    return re.compile("".join(partes), opciones | re.DOTALL)
+
+class ConsultaMemoria:
+    """Subconjunto del constructor de consultas de postgrest sobre una lista de filas"""
+    
+    def __init__(self, tabla):
+        self.tabla = tabla
+        self.operacion = "select"
+        self.columnas = None
+        self.contar = False
+        self.valores = None
+        self.filtros = []
+        self.orden = []
+        self.desde = 0
+        self.limite = None
+        self.conflicto = None
+        self.ignorar_duplicados = False
+        self.devolver_filas = True  # delete(returning="minimal") no devuelve las filas borradas
+        self._negar = False
+    
+    # Operaciones
+    def select(self, columnas="*", count=None):
+        self.operacion = "select"
+        self.columnas = None if columnas.strip() == "*" else [c.strip() for c in columnas.split(",")]
+        self.contar = count is not None
+        return self
+    
+    def insert(self, filas):
+        self.operacion = "insert"
+        self.valores = filas if isinstance(filas, list) else [filas]
+        return self
+    
+    def upsert(self, filas, on_conflict="", ignore_duplicates=False):
+        self.insert(filas)
+        self.conflicto = on_conflict or "id"
+        self.ignorar_duplicados = ignore_duplicates
+        return self
+    
+    def update(self, valores):
+        self.operacion = "update"
+        self.valores = valores
+        return self
+    
+    def delete(self, returning="representation"):
+        self.operacion = "delete"
+        self.devolver_filas = str(getattr(returning, "value", returning)) != "minimal"
+        return self
+    
+    # Filtros
+    @property
+    def not_(self):
+        self._negar = True
+        return self
+    
+    def _filtro(self, columna, condicion):
+        negar, self._negar = self._negar, False
+        self.filtros.append(lambda fila: condicion(fila.get(columna)) != negar)
+        return self
+    
+    def eq(self, columna, valor):
+        return self._filtro(columna, lambda v: v == valor)
+    
+    def neq(self, columna, valor):
+        return self._filtro(columna, lambda v: v != valor)
+    
+    def gt(self, columna, valor):
+        return self._filtro(columna, lambda v: v is not None and v > valor)
+    
+    def gte(self, columna, valor):
+        return self._filtro(columna, lambda v: v is not None and v >= valor)
+    
+    def lt(self, columna, valor):
+        return self._filtro(columna, lambda v: v is not None and v < valor)
+    
+    def lte(self, columna, valor):
+        return self._filtro(columna, lambda v: v is not None and v <= valor)
+    
+    def in_(self, columna, valores):
+        valores = set(valores)
+        return self._filtro(columna, lambda v: v in valores)
+    
+    def like(self, columna, patron):
+        expresion = _patron_like(patron)
+        return self._filtro(columna, lambda v: v is not None and expresion.fullmatch(str(v)) is not None)
+    
+    def ilike(self, columna, patron):
+        expresion = _patron_like(patron, re.IGNORECASE)
+        return self._filtro(columna, lambda v: v is not None and expresion.fullmatch(str(v)) is not None)
+    
+    def is_(self, columna, valor):
+        esperado = None if valor in (None, "null") else valor
+        return self._filtro(columna, lambda v: v is esperado if esperado is None else v == esperado)
+    
+    # Orden y paginación
+    def order(self, columna, desc=False):
+        self.orden.append((columna, desc))
+        return self
+    
+    def limit(self, n):
+        self.limite = n
+        return self
+    
+    def range(self, inicio, fin):
+        self.desde = inicio
+        self.limite = fin - inicio + 1
+        return self
+    
+    def execute(self):
+        with self.tabla.lock:
+            if self.operacion == "insert":
+                if self.conflicto is not None:
+                    return RespuestaMemoria(self.tabla.combinar(self.valores, self.conflicto, self.ignorar_duplicados))
+                return RespuestaMemoria(self.tabla.insertar(self.valores))
+            
+            filas = [fila for fila in self.tabla.filas if all(f(fila) for f in self.filtros)]
+            if self.operacion == "update":
+                for fila in filas:
+                    fila.update(self.valores)
+                return RespuestaMemoria(copy.deepcopy(filas))
+            if self.operacion == "delete":
+                eliminar = {id(fila) for fila in filas}
+                self.tabla.filas = [fila for fila in self.tabla.filas if id(fila) not in eliminar]
+                return RespuestaMemoria(filas if self.devolver_filas else [])
+            
+            total = len(filas)
+            for columna, desc in reversed(self.orden):
+                filas = sorted(filas, key=lambda fila: (fila.get(columna) is None, fila.get(columna)), reverse=desc)
+            fin = None if self.limite is None else self.desde + self.limite
+            filas = filas[self.desde:fin]
+            if self.columnas is not None:
+                filas = [{c: fila.get(c) for c in self.columnas} for fila in filas]
+            else:
+                filas = [dict(fila) for fila in filas]
+            return RespuestaMemoria(filas, total if self.contar else None)
+
+class TablaMemoria:
+    def __init__(self):
+        self.filas = []
+        self.siguiente_id = 1
+        self.lock = threading.Lock()
+    
+    def insertar(self, valores):
+        guardadas = []
+        for valores_fila in valores:
+            fila = dict(valores_fila, id=self.siguiente_id)
+            self.siguiente_id += 1
+            self.filas.append(fila)
+            guardadas.append(dict(fila))
+        return guardadas
+    
+    def combinar(self, valores, conflicto, ignorar_duplicados):
+        """Upsert: las filas con un valor de `conflicto` ya existente se actualizan o se ignoran"""
+        existentes = {fila.get(conflicto): fila for fila in self.filas}
+        guardadas = []
+        for valores_fila in valores:
+            fila = existentes.get(valores_fila.get(conflicto))
+            if fila is None:
+                fila = self.insertar([valores_fila])[0]
+                existentes[fila.get(conflicto)] = self.filas[-1]
+                guardadas.append(fila)
+            elif not ignorar_duplicados:
+                fila.update(valores_fila)
+                guardadas.append(dict(fila))
+        return guardadas
+
+class ClienteMemoria:
+    """Sustituto de supabase.Client que guarda las tablas en memoria del proceso"""
+    
+    def __init__(self):
+        self.tablas = {}
+        self._lock = threading.Lock()
+    
+    def table(self, nombre):
+        with self._lock:
+            tabla = self.tablas.setdefault(nombre, TablaMemoria())
+        return ConsultaMemoria(tabla)
+    
+    def rpc(self, nombre, parametros=None):
+        if nombre not in FUNCIONES:
+            raise ValueError(f"Función desconocida: {nombre}")
+        return LlamadaMemoria(self, FUNCIONES[nombre], parametros or {})
+
+class LlamadaMemoria:
+    """Equivalente de rpc() sobre las tablas en memoria"""
+    
+    def __init__(self, cliente, funcion, parametros):
+        self.cliente = cliente
+        self.funcion = funcion
+        self.parametros = parametros
+    
+    def execute(self):
+        return RespuestaMemoria(self.funcion(self.cliente, **self.parametros) or [])
+
+def _sumar_agregados(cliente, incremento):
+    """Suma el incremento a la fila de agregados con la tabla bloqueada"""
+    tabla = cliente.table("agregados_predicciones").tabla
+    with tabla.lock:
+        if not tabla.filas:
+            tabla.filas.append({"id": 1})
+        fila = tabla.filas[0]
+        for columna, valor in incremento.items():
+            if columna == "prob_maxima" or columna == "prob_minima":
+                extremo = max if columna == "prob_maxima" else min
+                valores = [v for v in (fila.get(columna), valor) if v is not None]
+                fila[columna] = extremo(valores) if valores else None
+            else:
+                fila[columna] = fila.get(columna, 0) + valor
+
+def _reconstruir_agregados(cliente):
+    """Recalcula los agregados y los pacientes con las tres tablas bloqueadas (umbral y rangos de estadisticas.py)"""
+    predicciones = cliente.table("predicciones").tabla
+    pacientes = cliente.table("pacientes_predicciones").tabla
+    agregados = cliente.table("agregados_predicciones").tabla
+    with predicciones.lock, pacientes.lock, agregados.lock:
+        claves = {}
+        for fila in predicciones.filas:
+            if fila.get("nombre") is not None:
+                claves.setdefault(fila["nombre"], fila.get("paciente_clave"))
+        pacientes.filas = [{"nombre": nombre, "clave": clave} for nombre, clave in claves.items()]
+        probabilidades = [fila["probabilidad"] for fila in predicciones.filas]
+        correctas = [fila.get("correcta") for fila in predicciones.filas if fila.get("correcta") is not None]
+        agregados.filas = [{
+            "id": 1,
+            "total_analisis": len(probabilidades),
+            "total_parkinson": sum(p > 0.5 for p in probabilidades),
+            "suma_probabilidad": float(sum(probabilidades)),
+            "prob_maxima": max(probabilidades, default=None),
+            "prob_minima": min(probabilidades, default=None),
+            "rango_0_25": sum(p * 100 < 25 for p in probabilidades),
+            "rango_25_50": sum(25 <= p * 100 < 50 for p in probabilidades),
+            "rango_50_75": sum(50 <= p * 100 < 75 for p in probabilidades),
+            "rango_75_100": sum(p * 100 >= 75 for p in probabilidades),
+            "pacientes_unicos": len(claves),
+            "feedback_total": len(correctas),
+            "feedback_positivo": sum(bool(c) for c in correctas),
+            "feedback_negativo": sum(not c for c in correctas)
+        }]
+
+def incremento_feedback(anterior, nueva):
+    """Cambio de los contadores de feedback cuando `correcta` pasa de `anterior` a `nueva`"""
+    return {
+        "feedback_total": (nueva is not None) - (anterior is not None),
+        "feedback_positivo": (nueva is True) - (anterior is True),
+        "feedback_negativo": (nueva is False) - (anterior is False)
+    }
+
+def _guardar_feedback(cliente, id_prediccion, nueva_correcta, nuevo_comentario):
+    """Actualiza el feedback y ajusta los agregados con la tabla de predicciones bloqueada"""
+    tabla = cliente.table("predicciones").tabla
+    with tabla.lock:
+        fila = next((f for f in tabla.filas if f.get("id") == id_prediccion), None)
+        if fila is None:
+            return
+        anterior = fila.get("correcta")
+        fila.update({"correcta": nueva_correcta, "comentario": nuevo_comentario})
+        _sumar_agregados(cliente, incremento_feedback(anterior, nueva_correcta))
+
+FUNCIONES = {
+    "sumar_agregados": _sumar_agregados,
+    "reconstruir_agregados": _reconstruir_agregados,
+    "guardar_feedback": _guardar_feedback
+}
@@ -0,0 +1,368 @@
+"""Cliente SQLite local con la misma interfaz de consultas que Supabase
+
+Permite usar la app sin red (ALMACENAMIENTO=sqlite). La base se abre en modo WAL para que
+las lecturas del panel no bloqueen las escrituras, con índices en fecha_hora, nombre y
+probabilidad.
+"""
+import re
+import sqlite3
+import threading
+
+from supabase_memoria import RespuestaMemoria, incremento_feedback
+
+ESQUEMA = {
+    "predicciones": [
+        """CREATE TABLE IF NOT EXISTS predicciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT,
+            probabilidad REAL,
+            resultado TEXT,
+            fecha_hora TEXT,
+            feedback TEXT,
+            correcta BOOLEAN,
+            comentario TEXT,
+            paciente_clave TEXT,
+            clave_insercion TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_predicciones_fecha_hora ON predicciones (fecha_hora)",
+        "CREATE INDEX IF NOT EXISTS idx_predicciones_nombre ON predicciones (nombre)",
+        "CREATE INDEX IF NOT EXISTS idx_predicciones_probabilidad ON predicciones (probabilidad)",
+        # Índice parcial: solo las filas con feedback, que son las que consulta la pestaña de feedback
+        "CREATE INDEX IF NOT EXISTS idx_predicciones_correcta ON predicciones (correcta) WHERE correcta IS NOT NULL",
+        # Evolución de un paciente: sus filas ya ordenadas por fecha sin tocar las demás
+        "CREATE INDEX IF NOT EXISTS idx_predicciones_paciente ON predicciones (paciente_clave, fecha_hora)",
+        # Clave de la escritura diferida: un reenvío de una fila ya guardada no la duplica
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_predicciones_clave_insercion ON predicciones (clave_insercion)"
+    ],
+    "agregados_predicciones": [
+        """CREATE TABLE IF NOT EXISTS agregados_predicciones (
+            id INTEGER PRIMARY KEY,
+            total_analisis INTEGER NOT NULL DEFAULT 0,
+            total_parkinson INTEGER NOT NULL DEFAULT 0,
+            suma_probabilidad REAL NOT NULL DEFAULT 0,
+            prob_maxima REAL,
+            prob_minima REAL,
+            rango_0_25 INTEGER NOT NULL DEFAULT 0,
+            rango_25_50 INTEGER NOT NULL DEFAULT 0,
+            rango_50_75 INTEGER NOT NULL DEFAULT 0,
+            rango_75_100 INTEGER NOT NULL DEFAULT 0,
+            pacientes_unicos INTEGER NOT NULL DEFAULT 0,
+            feedback_total INTEGER NOT NULL DEFAULT 0,
+            feedback_positivo INTEGER NOT NULL DEFAULT 0,
+            feedback_negativo INTEGER NOT NULL DEFAULT 0
+        )"""
+    ],
+    "pacientes_predicciones": [
+        "CREATE TABLE IF NOT EXISTS pacientes_predicciones (nombre TEXT PRIMARY KEY, clave TEXT)",
+        # Búsqueda por prefijo como rango sobre la clave
+        "CREATE INDEX IF NOT EXISTS idx_pacientes_clave ON pacientes_predicciones (clave)"
+    ]
+}
+
+# Columnas añadidas después de crear la tabla: se agregan a las bases existentes al abrirlas
+COLUMNAS_NUEVAS = {
+    "predicciones": {"correcta": "BOOLEAN", "comentario": "TEXT", "paciente_clave": "TEXT", "clave_insercion": "TEXT"},
+    "pacientes_predicciones": {"clave": "TEXT"}
+}
+
+# Funciones que la app llama con rpc(); en Supabase se crean con el SQL del README
+CONTADORES_AGREGADOS = [
+    "total_analisis", "total_parkinson", "suma_probabilidad", "rango_0_25", "rango_25_50", "rango_50_75",
+    "rango_75_100", "pacientes_unicos", "feedback_total", "feedback_positivo", "feedback_negativo"
+]
+# Suma un incremento a la fila de agregados en una sola sentencia (atómica entre procesos)
+SQL_SUMAR_AGREGADOS = f"""INSERT INTO agregados_predicciones (id, {', '.join(CONTADORES_AGREGADOS)}, prob_maxima, prob_minima)
+        VALUES (1, {', '.join(':' + c for c in CONTADORES_AGREGADOS)}, :prob_maxima, :prob_minima)
+        ON CONFLICT (id) DO UPDATE SET
+        {', '.join(f'{c} = {c} + excluded.{c}' for c in CONTADORES_AGREGADOS)},
+        prob_maxima = max(coalesce(prob_maxima, excluded.prob_maxima), coalesce(excluded.prob_maxima, prob_maxima)),
+        prob_minima = min(coalesce(prob_minima, excluded.prob_minima), coalesce(excluded.prob_minima, prob_minima))"""
+
+def _sumar_agregados(conexion, incremento):
+    conexion.execute(SQL_SUMAR_AGREGADOS, {
+        **{c: incremento.get(c, 0) for c in CONTADORES_AGREGADOS},
+        "prob_maxima": incremento.get("prob_maxima"),
+        "prob_minima": incremento.get("prob_minima")
+    })
+
+# Recalcula los agregados desde la tabla de predicciones, con los mismos umbral y rangos que estadisticas.py
+SQL_RECALCULAR_AGREGADOS = """INSERT OR REPLACE INTO agregados_predicciones (
+            id, total_analisis, total_parkinson, suma_probabilidad, prob_maxima, prob_minima,
+            rango_0_25, rango_25_50, rango_50_75, rango_75_100,
+            pacientes_unicos, feedback_total, feedback_positivo, feedback_negativo
+        )
+        SELECT 1, count(*), count(*) FILTER (WHERE probabilidad > 0.5), coalesce(sum(probabilidad), 0),
+            max(probabilidad), min(probabilidad),
+            count(*) FILTER (WHERE probabilidad * 100 < 25),
+            count(*) FILTER (WHERE probabilidad * 100 >= 25 AND probabilidad * 100 < 50),
+            count(*) FILTER (WHERE probabilidad * 100 >= 50 AND probabilidad * 100 < 75),
+            count(*) FILTER (WHERE probabilidad * 100 >= 75),
+            (SELECT count(*) FROM pacientes_predicciones),
+            count(correcta), count(*) FILTER (WHERE correcta), count(*) FILTER (WHERE NOT correcta)
+        FROM predicciones"""
+
+def _reconstruir_agregados(conexion):
+    # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer: nadie escribe entre el recálculo y el guardado
+    conexion.execute("BEGIN IMMEDIATE")
+    conexion.execute("DELETE FROM pacientes_predicciones")
+    conexion.execute(
+        """INSERT INTO pacientes_predicciones (nombre, clave)
+        SELECT nombre, min(paciente_clave) FROM predicciones WHERE nombre IS NOT NULL GROUP BY nombre"""
+    )
+    conexion.execute(SQL_RECALCULAR_AGREGADOS)
+
+def _guardar_feedback(conexion, id_prediccion, nueva_correcta, nuevo_comentario):
+    # Con el bloqueo tomado antes de leer, el valor anterior no cambia hasta guardar el nuevo
+    conexion.execute("BEGIN IMMEDIATE")
+    fila = conexion.execute("SELECT correcta FROM predicciones WHERE id = ?", (id_prediccion,)).fetchone()
+    if fila is None:
+        return
+    conexion.execute(
+        "UPDATE predicciones SET correcta = ?, comentario = ? WHERE id = ?", (nueva_correcta, nuevo_comentario, id_prediccion)
+    )
+    _sumar_agregados(conexion, incremento_feedback(fila["correcta"], nueva_correcta))
+
+FUNCIONES = {
+    "sumar_agregados": _sumar_agregados,
+    "reconstruir_agregados": _reconstruir_agregados,
+    "guardar_feedback": _guardar_feedback
+}
+
+# Las columnas BOOLEAN se guardan como 0/1 y se devuelven como bool, igual que PostgREST
+sqlite3.register_converter("BOOLEAN", lambda valor: bool(int(valor)))
+
+IDENTIFICADOR = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def _columna(nombre):
+    nombre = nombre.strip()
+    if not IDENTIFICADOR.match(nombre):
+        raise ValueError(f"Nombre de columna no válido: {nombre}")
+    return f'"{nombre}"'
+
+def _like_a_glob(patron):
+    """Traduce un patrón LIKE (con \\ como escape) a GLOB; los caracteres especiales de GLOB van entre corchetes"""
+    partes = []
+    escapado = False
+    for caracter in patron:
+        if not escapado and caracter == "\\":
+            escapado = True
+            continue
+        if not escapado and caracter in "%_":
+            partes.append("*" if caracter == "%" else "?")
+        else:
+            partes.append(f"[{caracter}]" if caracter in "*?[" else caracter)
+        escapado = False
+    return "".join(partes)
+
+class ConsultaSQLite:
+    """Traduce la cadena select/insert/update/delete + filtros de postgrest a una sentencia SQL"""
+    
+    def __init__(self, cliente, tabla):
+        self.cliente = cliente
+        self.tabla = _columna(tabla)
+        self.operacion = "select"
+        self.columnas = "*"
+        self.contar = False
+        self.valores = None
+        self.condiciones = []
+        self.parametros = []
+        self.orden = []
+        self.desde = 0
+        self.limite = None
+        self.conflicto = None  # Columna única del upsert
+        self.ignorar_duplicados = False
+        self.devolver_filas = True  # delete(returning="minimal") no devuelve las filas borradas
+        self._negar = False
+    
+    # Operaciones
+    def select(self, columnas="*", count=None):
+        self.operacion = "select"
+        self.columnas = "*" if columnas.strip() == "*" else ", ".join(_columna(c) for c in columnas.split(","))
+        self.contar = count is not None
+        return self
+    
+    def insert(self, filas):
+        self.operacion = "insert"
+        self.valores = filas if isinstance(filas, list) else [filas]
+        return self
+    
+    def upsert(self, filas, on_conflict="", ignore_duplicates=False):
+        self.insert(filas)
+        self.conflicto = on_conflict or None
+        self.ignorar_duplicados = ignore_duplicates
+        return self
+    
+    def update(self, valores):
+        self.operacion = "update"
+        self.valores = valores
+        return self
+    
+    def delete(self, returning="representation"):
+        self.operacion = "delete"
+        self.devolver_filas = str(getattr(returning, "value", returning)) != "minimal"
+        return self
+    
+    # Filtros
+    @property
+    def not_(self):
+        self._negar = True
+        return self
+    
+    def _filtro(self, condicion, *parametros):
+        negar, self._negar = self._negar, False
+        self.condiciones.append(f"NOT ({condicion})" if negar else condicion)
+        self.parametros.extend(parametros)
+        return self
+    
+    def eq(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} = ?", valor)
+    
+    def neq(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} != ?", valor)
+    
+    def gt(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} > ?", valor)
+    
+    def gte(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} >= ?", valor)
+    
+    def lt(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} < ?", valor)
+    
+    def lte(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} <= ?", valor)
+    
+    def in_(self, columna, valores):
+        valores = list(valores)
+        if not valores:
+            return self._filtro("0")
+        return self._filtro(f"{_columna(columna)} IN ({', '.join('?' * len(valores))})", *valores)
+    
+    def like(self, columna, patron):
+        # GLOB distingue mayúsculas como LIKE en Postgres y, con un prefijo fijo, usa el índice de la columna
+        return self._filtro(f"{_columna(columna)} GLOB ?", _like_a_glob(patron))
+    
+    def ilike(self, columna, patron):
+        # LIKE de SQLite ya ignora mayúsculas en ASCII; la barra invertida escapa % y _ como en Postgres
+        return self._filtro(f"{_columna(columna)} LIKE ? ESCAPE '\\'", patron)
+    
+    def is_(self, columna, valor):
+        if valor in (None, "null"):
+            return self._filtro(f"{_columna(columna)} IS NULL")
+        return self._filtro(f"{_columna(columna)} IS ?", valor)
+    
+    # Orden y paginación
+    def order(self, columna, desc=False):
+        self.orden.append(f"{_columna(columna)} {'DESC' if desc else 'ASC'}")
+        return self
+    
+    def limit(self, n):
+        self.limite = n
+        return self
+    
+    def range(self, inicio, fin):
+        self.desde = inicio
+        self.limite = fin - inicio + 1
+        return self
+    
+    def _where(self):
+        return f" WHERE {' AND '.join(self.condiciones)}" if self.condiciones else ""
+    
+    def execute(self):
+        conexion = self.cliente.conexion()
+        with conexion:
+            if self.operacion == "insert":
+                return RespuestaMemoria(self._insertar(conexion))
+            if self.operacion == "update":
+                asignaciones = ", ".join(f"{_columna(c)} = ?" for c in self.valores)
+                filas = conexion.execute(
+                    f"UPDATE {self.tabla} SET {asignaciones}{self._where()} RETURNING *",
+                    [*self.valores.values(), *self.parametros]
+                ).fetchall()
+                return RespuestaMemoria([dict(f) for f in filas])
+            if self.operacion == "delete":
+                if not self.devolver_filas:
+                    conexion.execute(f"DELETE FROM {self.tabla}{self._where()}", self.parametros)
+                    return RespuestaMemoria([])
+                filas = conexion.execute(f"DELETE FROM {self.tabla}{self._where()} RETURNING *", self.parametros).fetchall()
+                return RespuestaMemoria([dict(f) for f in filas])
+            
+            total = None
+            if self.contar:
+                total = conexion.execute(f"SELECT COUNT(*) FROM {self.tabla}{self._where()}", self.parametros).fetchone()[0]
+            sql = f"SELECT {self.columnas} FROM {self.tabla}{self._where()}"
+            if self.orden:
+                sql += f" ORDER BY {', '.join(self.orden)}"
+            if self.limite is not None or self.desde:
+                sql += f" LIMIT {int(self.limite if self.limite is not None else -1)} OFFSET {int(self.desde)}"
+            filas = conexion.execute(sql, self.parametros).fetchall()
+            return RespuestaMemoria([dict(f) for f in filas], total)
+    
+    def _insertar(self, conexion):
+        guardadas = []
+        for fila in self.valores:
+            columnas = ", ".join(_columna(c) for c in fila)
+            marcadores = ", ".join("?" * len(fila))
+            conflicto = ""
+            if self.ignorar_duplicados:
+                conflicto = " ON CONFLICT DO NOTHING"
+            elif self.conflicto is not None:
+                asignaciones = ", ".join(f"{_columna(c)} = excluded.{_columna(c)}" for c in fila)
+                conflicto = f" ON CONFLICT ({_columna(self.conflicto)}) DO UPDATE SET {asignaciones}"
+            cursor = conexion.execute(
+                f"INSERT INTO {self.tabla} ({columnas}) VALUES ({marcadores}){conflicto} RETURNING *", list(fila.values())
+            )
+            guardada = cursor.fetchone()
+            # Como PostgREST, las filas ignoradas por duplicadas no se devuelven
+            if guardada is not None:
+                guardadas.append(dict(guardada))
+        return guardadas
+
+class LlamadaSQLite:
+    """Equivalente de rpc(): ejecuta una de las FUNCIONES en una transacción"""
+    
+    def __init__(self, cliente, nombre, parametros):
+        if nombre not in FUNCIONES:
+            raise ValueError(f"Función desconocida: {nombre}")
+        self.cliente = cliente
+        self.nombre = nombre
+        self.parametros = parametros or {}
+    
+    def execute(self):
+        conexion = self.cliente.conexion()
+        with conexion:
+            FUNCIONES[self.nombre](conexion, **self.parametros)
+        return RespuestaMemoria([])
+
+class ClienteSQLite:
+    """Sustituto de supabase.Client sobre un archivo SQLite, con una conexión por hilo"""
+    
+    def __init__(self, ruta="predicciones.db"):
+        self.ruta = ruta
+        self._local = threading.local()
+        conexion = self.conexion()
+        conexion.execute("PRAGMA journal_mode=WAL")
+        with conexion:
+            for tabla, (crear, *indices) in ESQUEMA.items():
+                conexion.execute(crear)
+                existentes = {fila["name"] for fila in conexion.execute(f"PRAGMA table_info({tabla})")}
+                for columna, tipo in COLUMNAS_NUEVAS.get(tabla, {}).items():
+                    if columna not in existentes:
+                        conexion.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}")
+                for indice in indices:
+                    conexion.execute(indice)
+    
+    def conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+    
+    def table(self, nombre):
+        return ConsultaSQLite(self, nombre)
+    
+    def rpc(self, nombre, parametros=None):
+        return LlamadaSQLite(self, nombre, parametros)
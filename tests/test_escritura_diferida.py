@@ -0,0 +1,237 @@
+"""Escritor diferido ante caídas de Supabase: archivo local, orden del reenvío e inserciones sin duplicar
+
+Se ejecuta contra los dos backends locales (memoria y SQLite) con un cliente que simula los
+fallos: caída de la red, respuestas perdidas tras guardar, respuestas incompletas y una caída
+del proceso a mitad del reenvío.
+
+Uso: python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agregados import AgregadosPredicciones
+from almacenamiento import TABLA_PREDICCIONES, fila_prediccion
+from escritura_diferida import EscritorDiferido
+from supabase_memoria import ClienteMemoria
+from supabase_sqlite import ClienteSQLite
+
+class CaidaDelProceso(BaseException):
+    """Corta el hilo como lo haría la muerte del proceso: no la captura ningún `except Exception`"""
+
+class ConsultaInestable:
+    """Consulta que aplica en execute() los fallos programados en el cliente"""
+    
+    def __init__(self, consulta, cliente, tabla=None):
+        self.consulta = consulta
+        self.cliente = cliente
+        self.tabla = tabla
+    
+    def __getattr__(self, nombre):
+        valor = getattr(self.consulta, nombre)
+        if valor is self.consulta:  # Propiedades encadenables como not_
+            return self
+        if not callable(valor):
+            return valor
+        def encadenar(*args, **kwargs):
+            resultado = valor(*args, **kwargs)
+            return self if resultado is self.consulta else resultado
+        return encadenar
+    
+    def execute(self):
+        self.cliente.contar_peticion()
+        insercion = self.tabla == TABLA_PREDICCIONES and getattr(self.consulta, "operacion", None) == "insert"
+        if insercion and self.cliente.descartar_ultima > 0:
+            # Ni se guarda ni se devuelve la última fila
+            self.cliente.descartar_ultima -= 1
+            self.consulta.valores = self.consulta.valores[:-1]
+        response = self.consulta.execute()
+        if insercion and self.cliente.perder_respuestas > 0:
+            # Las filas quedan guardadas, pero la respuesta no llega
+            self.cliente.perder_respuestas -= 1
+            raise TimeoutError("respuesta perdida (simulado)")
+        if insercion and self.cliente.recortar_respuestas > 0:
+            # Las filas quedan guardadas, pero la respuesta llega sin la última
+            self.cliente.recortar_respuestas -= 1
+            response.data = response.data[:-1]
+        return response
+
+class ClienteInestable:
+    """Cliente local con fallos programables; peticiones_restantes=None responde siempre"""
+    
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.peticiones_restantes = None
+        self.error = ConnectionError("Supabase no disponible (simulado)")
+        self.perder_respuestas = 0
+        self.recortar_respuestas = 0
+        self.descartar_ultima = 0
+    
+    def contar_peticion(self):
+        if self.peticiones_restantes is not None:
+            if self.peticiones_restantes <= 0:
+                raise self.error
+            self.peticiones_restantes -= 1
+    
+    def table(self, nombre):
+        return ConsultaInestable(self.cliente.table(nombre), self, nombre)
+    
+    def rpc(self, nombre, parametros=None):
+        return ConsultaInestable(self.cliente.rpc(nombre, parametros), self)
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def cliente(request, tmp_path):
+    if request.param == "memoria":
+        return ClienteInestable(ClienteMemoria())
+    return ClienteInestable(ClienteSQLite(str(tmp_path / "predicciones.db")))
+
+@pytest.fixture
+def ruta_spool(tmp_path):
+    return str(tmp_path / "predicciones_pendientes.jsonl")
+
+def crear_escritor(cliente, ruta_spool, agregados, **opciones):
+    # Sin reenvío automático: cada reenvío lo lanza la prueba
+    opciones = {"reintentos": 1, "espera_base_s": 0, "reenvio_spool_s": 3600, **opciones}
+    return EscritorDiferido(cliente, ruta_spool=ruta_spool, agregados=agregados, **opciones)
+
+def fila(i):
+    return fila_prediccion(f"Paciente {i:03d}", 0.3 + 0.4 * (i % 2), f"2024-01-01 10:{i % 60:02d}:00")
+
+def filas_guardadas(cliente):
+    return cliente.table(TABLA_PREDICCIONES).select("id,nombre,correcta,comentario").order("id").execute().data
+
+def spool_vacio(escritor):
+    return not os.path.exists(escritor.ruta_spool) and not os.path.exists(escritor.ruta_reenvio)
+
+def test_caida_y_reenvio_en_orden(cliente, ruta_spool):
+    agregados = AgregadosPredicciones(cliente)
+    escritor = crear_escritor(cliente, ruta_spool, agregados)
+    esperado = {}  # nombre -> (correcta, comentario) que debe quedar guardado
+    orden = []  # nombres en el orden en que se encolaron
+    
+    def encolar(i):
+        orden.append(fila(i)["nombre"])
+        esperado[orden[-1]] = (None, None)
+        return orden[-1], escritor.insertar(fila(i))
+    
+    def feedback(nombre, referencia, correcta, comentario=None):
+        escritor.actualizar_feedback(referencia, correcta, comentario)
+        esperado[nombre] = (correcta, comentario)
+    
+    # 1. Supabase responde: la primera mitad se guarda con su id
+    guardadas = [encolar(i) for i in range(20)]
+    assert escritor.vaciar(5)
+    ids_guardadas = {nombre: pendiente.esperar_id(5) for nombre, pendiente in guardadas}
+    assert None not in ids_guardadas.values()
+    
+    # 2. Caída: inserciones y feedback (de filas con y sin id, con cambios de opinión) van al archivo local
+    cliente.peticiones_restantes = 0
+    en_caida = [encolar(i) for i in range(20, 40)]
+    for k, (nombre, pendiente) in enumerate(en_caida):
+        if k % 3 == 0:
+            feedback(nombre, pendiente, True, f"comentario {k}")
+        if k % 5 == 0:
+            feedback(nombre, pendiente, k % 2 == 0)
+    for k, (nombre, _) in enumerate(guardadas[::4]):
+        feedback(nombre, ids_guardadas[nombre], k % 2 == 1, "revisado sin conexión")
+    assert escritor.vaciar(5)
+    assert all(p.en_spool and p.id is None for _, p in en_caida)
+    
+    # 3. Vuelve a medias: el reenvío se corta tras la primera inserción agrupada y sus sumas
+    cliente.peticiones_restantes = 3
+    escritor._reenviar_spool()
+    assert escritor.estadisticas()["en_spool"] > 0
+    # El feedback pendiente de filas ya insertadas pasa a referirse a su id real
+    restantes = escritor._leer_registros(escritor.ruta_reenvio)
+    assert all("clave" not in r for r in restantes if r["op"] == "feedback")
+    
+    # 4. Vuelve del todo
+    cliente.peticiones_restantes = None
+    escritor._reenviar_spool()
+    assert spool_vacio(escritor)
+    assert all(p.esperar_id(5) is not None for _, p in en_caida)
+    
+    filas = filas_guardadas(cliente)
+    assert [f["nombre"] for f in filas] == orden  # sin pérdidas ni duplicados y en orden de llegada
+    assert {f["nombre"]: (f["correcta"], f["comentario"]) for f in filas} == esperado
+    assert agregados.verificar() == {}
+
+def test_error_en_el_hilo_no_lo_detiene(cliente, ruta_spool):
+    def fallar(filas):
+        raise RuntimeError("error simulado tras insertar")
+    escritor = crear_escritor(cliente, ruta_spool, None, al_insertar=fallar)
+    escritor.insertar(fila(0))
+    assert escritor.vaciar(5)  # El lote con error no deja a nadie esperando
+    escritor.al_insertar = None
+    pendiente = escritor.insertar(fila(1))
+    assert escritor.vaciar(5)
+    assert pendiente.esperar_id(5) is not None
+
+def test_reintento_tras_respuesta_perdida_no_duplica(cliente, ruta_spool):
+    agregados = AgregadosPredicciones(cliente)
+    escritor = crear_escritor(cliente, ruta_spool, agregados, reintentos=3)
+    cliente.perder_respuestas = 1
+    pendientes = [escritor.insertar(fila(i)) for i in range(5)]
+    assert escritor.vaciar(5)
+    filas = filas_guardadas(cliente)
+    assert len(filas) == 5
+    assert [p.esperar_id(5) for p in pendientes] == [f["id"] for f in filas]
+    assert agregados.verificar() == {}
+
+def test_respuesta_corta_resuelve_todas_las_filas(cliente, ruta_spool):
+    agregados = AgregadosPredicciones(cliente)
+    escritor = crear_escritor(cliente, ruta_spool, agregados)
+    
+    # La fila guardada que falta en la respuesta se busca por su clave
+    cliente.recortar_respuestas = 1
+    pendientes = [escritor.insertar(fila(i)) for i in range(5)]
+    assert escritor.vaciar(5)
+    assert None not in [p.esperar_id(5) for p in pendientes]
+    assert spool_vacio(escritor)
+    
+    # La que no llegó a guardarse va al archivo local (con su feedback) y se reenvía después
+    cliente.descartar_ultima = 1
+    pendientes = [escritor.insertar(fila(i)) for i in range(5, 10)]
+    escritor.actualizar_feedback(pendientes[-1], False, "sin id todavía")
+    assert escritor.vaciar(5)
+    assert None not in [p.esperar_id(5) for p in pendientes[:-1]]
+    assert pendientes[-1].en_spool and pendientes[-1].id is None
+    escritor._reenviar_spool()
+    assert spool_vacio(escritor)
+    assert pendientes[-1].esperar_id(5) is not None
+    
+    filas = filas_guardadas(cliente)
+    assert [f["nombre"] for f in filas] == [fila(i)["nombre"] for i in range(10)]
+    assert (filas[-1]["correcta"], filas[-1]["comentario"]) == (False, "sin id todavía")
+    assert agregados.verificar() == {}
+
+def test_caida_del_proceso_durante_el_reenvio(cliente, ruta_spool):
+    agregados = AgregadosPredicciones(cliente)
+    escritor = crear_escritor(cliente, ruta_spool, agregados, max_lote=3)
+    cliente.peticiones_restantes = 0
+    pendientes = [escritor.insertar(fila(i)) for i in range(7)]
+    assert escritor.vaciar(5)
+    for pendiente in pendientes[::2]:
+        escritor.actualizar_feedback(pendiente, True, "revisado")
+    assert escritor.vaciar(5)
+    registros = escritor.estadisticas()["en_spool"]
+    
+    # El proceso cae tras reenviar el primer grupo de inserciones
+    cliente.peticiones_restantes = 3
+    cliente.error = CaidaDelProceso()
+    with pytest.raises(CaidaDelProceso):
+        escritor._reenviar_spool()
+    assert not os.path.exists(ruta_spool)
+    assert 0 < len(escritor._leer_registros(escritor.ruta_reenvio)) < registros
+    
+    # Al arrancar de nuevo se reenvía lo que faltaba, sin perder ni duplicar nada
+    cliente.peticiones_restantes = None
+    nuevo = crear_escritor(cliente, ruta_spool, agregados)
+    assert nuevo.vaciar(5)
+    assert spool_vacio(nuevo)
+    filas = filas_guardadas(cliente)
+    assert [f["nombre"] for f in filas] == [fila(i)["nombre"] for i in range(7)]
+    assert [f["correcta"] for f in filas] == [True if i % 2 == 0 else None for i in range(7)]
+    assert agregados.verificar() == {}